@@ -0,0 +1,115 @@
+"""Compare the per-call overhead of the ORM queries with the Core read path in crud.
+
+Loads the test data into an in-memory database and times the hot read functions
+against the ORM queries they used to run:
+
+    poetry run python benchmarks/crud_read_path.py --number 500
+"""
+
+import argparse
+import json
+import timeit
+
+from packaging.version import Version
+from sqlalchemy import create_engine, desc
+from sqlalchemy.orm import sessionmaker
+
+from cid import crud
+from cid.models import AwsImage, AzureImage, Base
+
+
+def orm_find_aws_images(db, arch=None, page=1, page_size=100):
+    query = db.query(AwsImage).order_by(AwsImage.creationDate.desc())
+    if arch:
+        query = query.filter(AwsImage.arch == arch)
+    total_count = query.count()
+    results = query.limit(page_size).offset((page - 1) * page_size).all()
+    return {"results": results, "total_count": total_count}
+
+
+def orm_find_matching_ami(db, image_id):
+    image = db.query(AwsImage).filter(AwsImage.imageId == image_id).first()
+    return (
+        db.query(AwsImage.imageId, AwsImage.region)
+        .filter(AwsImage.name == image.name)
+        .all()
+    )
+
+
+def orm_find_available_aws_versions(db):
+    versions = [x.version for x in db.query(AwsImage.version).distinct()]
+    return sorted(versions, key=Version, reverse=True)
+
+
+def orm_latest_azure_image(db, arch):
+    return (
+        db.query(AzureImage)
+        .filter(AzureImage.architecture == arch)
+        .order_by(desc(AzureImage.version))
+        .first()
+    )
+
+
+def load_test_data(db):
+    with open("tests/data/aws.json") as fileh:
+        crud.import_aws_images(db, json.load(fileh))
+    with open("tests/data/azure.json") as fileh:
+        crud.import_azure_images(db, json.load(fileh))
+    with open("tests/data/google.json") as fileh:
+        crud.import_google_images(db, json.load(fileh))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200, help="Calls per case")
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    load_test_data(db)
+    image_id = db.query(AwsImage.imageId).first()[0]
+
+    cases = [
+        (
+            "find_aws_images(page_size=100)",
+            lambda: orm_find_aws_images(db),
+            lambda: crud.find_aws_images(db),
+        ),
+        (
+            "find_aws_images(arch, page_size=10)",
+            lambda: orm_find_aws_images(db, "x86_64", page_size=10),
+            lambda: crud.find_aws_images(db, "x86_64", page_size=10),
+        ),
+        (
+            "find_matching_ami",
+            lambda: orm_find_matching_ami(db, image_id),
+            lambda: crud.find_matching_ami(db, image_id),
+        ),
+        (
+            "find_available_aws_versions",
+            lambda: orm_find_available_aws_versions(db),
+            lambda: crud.find_available_aws_versions(db),
+        ),
+        (
+            "latest_azure_image(x64)",
+            lambda: orm_latest_azure_image(db, "x64"),
+            lambda: crud.latest_azure_image(db, "x64"),
+        ),
+    ]
+
+    print(f"{'case':40} {'orm µs':>10} {'core µs':>10} {'speedup':>8}")
+    for name, orm, core in cases:
+        # Warm up the statement caches of both paths first.
+        orm(), core()
+        db.expunge_all()
+        orm_time = min(timeit.repeat(orm, number=args.number, repeat=3))
+        core_time = min(timeit.repeat(core, number=args.number, repeat=3))
+        print(
+            f"{name:40} {orm_time / args.number * 1e6:10.1f} "
+            f"{core_time / args.number * 1e6:10.1f} {orm_time / core_time:7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Compare a flood of expensive requests with and without admission control.
+
+Loads the AWS test data repeated to the given number of rows into a SQLite database,
+then sends many different listing requests with the largest page size at once, along
+with a cheap request, and prints:
+
+* the latency of the listings that were served, and how many were refused or failed,
+* the latency of the cheap request sent in the middle of the flood,
+* the memory the process grew by.
+
+Memory only grows, so each mode runs in a process of its own:
+
+    poetry run python benchmarks/overload.py --rows 100000 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+MODES = ("unlimited", "admission control")
+
+
+def populate(database, rows):
+    from cid import crud
+    from cid.models import Base
+
+    Base.metadata.create_all(bind=database.engine)
+    with open("tests/data/aws.json") as fileh:
+        images = json.load(fileh)
+    db = database.SessionLocal()
+    crud.import_aws_images(
+        db,
+        [
+            {**images[index % len(images)], "ImageId": f"ami-{index:017x}"}
+            for index in range(rows)
+        ],
+    )
+    crud.update_last_updated(db)
+    db.close()
+
+
+async def timed(client, path):
+    start = time.perf_counter()
+    response = await client.get(path)
+    return response.status_code, time.perf_counter() - start
+
+
+async def flood(app, requests):
+    import httpx
+
+    # Requests that fail, such as when no database connection frees up, get a 500.
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://test", timeout=600
+    ) as client:
+        listings = [
+            asyncio.create_task(timed(client, f"/aws?page_size=1000&page={page}"))
+            for page in range(1, requests + 1)
+        ]
+        await asyncio.sleep(0.1)
+        cheap = await timed(client, "/healthz")
+        return await asyncio.gather(*listings), cheap
+
+
+def run(mode, rows, requests):
+    """Measure one mode, in this process."""
+    os.environ["ENVIRONMENT"] = "testing"
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/cid.db"
+    logging.disable(logging.WARNING)
+
+    from cid import admission, database
+    from cid import main as api
+
+    populate(database, rows)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    concurrency = admission.ADMISSION_CONCURRENCY if mode == MODES[1] else 0
+    control = admission.AdmissionControl(
+        concurrency,
+        admission.ADMISSION_QUEUE,
+        admission.ADMISSION_QUEUE_TIMEOUT,
+        admission.ADMISSION_RETRY_AFTER,
+    )
+    with patch.object(admission, "admission_control", control):
+        listings, cheap = asyncio.run(flood(api.app, requests))
+
+    served = [duration for status, duration in listings if status == 200]
+    refused = sum(status == 503 for status, _ in listings)
+    failed = len(listings) - len(served) - refused
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) / 1024
+    p99 = statistics.quantiles(served, n=100)[98] if len(served) > 1 else served[0]
+    print(
+        f"{mode:>18} {len(served):>7} {refused:>8} {failed:>7} "
+        f"{statistics.median(served) * 1000:9.0f} {p99 * 1000:9.0f} "
+        f"{cheap[1] * 1000:9.0f} {grown:9.1f}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000, help="AWS images")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.rows, args.requests)
+        return
+
+    print(
+        f"{'':>18} {'served':>7} {'refused':>8} {'failed':>7} {'p50 ms':>9} {'p99 ms':>9} "
+        f"{'cheap ms':>9} {'+RSS MiB':>9}"
+    )
+    for mode in MODES:
+        subprocess.check_call(  # noqa: S603
+            [
+                sys.executable,
+                __file__,
+                "--rows",
+                str(args.rows),
+                "--requests",
+                str(args.requests),
+                "--mode",
+                mode,
+            ]
+        )
+
+
+if __name__ == "__main__":
+    main()
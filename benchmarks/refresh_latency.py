@@ -0,0 +1,151 @@
+"""Plot request latency while a refresh runs in a thread or in its own process.
+
+Serves synthetic image data from a local bucket, then keeps requesting a listing
+from the app while the image data is refreshed, once in a thread of the API process
+as refreshes used to run and once in a refresh process. Prints the p50 and p99
+latency of every half second, with a bar for the p99 and a mark while the refresh
+runs:
+
+    poetry run python benchmarks/refresh_latency.py --rows 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# The app must not start its own schedule, and reads the data served below.
+workdir = tempfile.mkdtemp(prefix="cid-refresh-")
+os.environ["ENVIRONMENT"] = "testing"
+os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/cid.db"
+os.environ["IMAGE_DATA_BASE_URL"] = "http://127.0.0.1:8765"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from cid import refresh  # noqa: E402
+from cid.database import SessionLocal  # noqa: E402
+from cid.main import app  # noqa: E402
+
+WINDOW = 0.5
+PATH = "/aws?arch=x86_64&page_size=10"
+
+
+def load(name):
+    with open(f"tests/data/{name}") as fileh:
+        return json.load(fileh)
+
+
+def write_bucket(directory, rows):
+    images = load("aws.json")
+    aws = [
+        {**images[index % len(images)], "ImageId": f"ami-{index:017x}"}
+        for index in range(rows)
+    ]
+    for name, data in (
+        ("aws/aws.json", aws),
+        ("azure/eastus.json", load("azure.json")),
+        ("google/global.json", load("google.json")),
+    ):
+        os.makedirs(os.path.join(directory, os.path.dirname(name)), exist_ok=True)
+        with open(os.path.join(directory, name), "w") as fileh:
+            json.dump(data, fileh)
+
+
+def refresh_in_thread():
+    db = SessionLocal()
+    try:
+        refresh.refresh_image_data(db)
+    finally:
+        db.close()
+
+
+def measure(client, run_refresh, settle):
+    """Request the listing before, during and after a refresh."""
+    samples = []
+    done = threading.Event()
+    window = {}
+
+    def target():
+        window["start"] = time.perf_counter()
+        run_refresh()
+        window["end"] = time.perf_counter()
+        done.set()
+
+    start = time.perf_counter()
+    thread = threading.Thread(target=target)
+    while True:
+        now = time.perf_counter()
+        if not thread.is_alive() and not done.is_set() and now - start > settle:
+            thread.start()
+        if done.is_set() and now - window["end"] > settle:
+            break
+        client.get(PATH)
+        samples.append((now - start, time.perf_counter() - now))
+        time.sleep(random.uniform(0, 0.002))  # noqa: S311
+    thread.join()
+    return samples, window["start"] - start, window["end"] - start
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def report(name, samples, refresh_start, refresh_end):
+    print(f"\n{name}: refresh took {refresh_end - refresh_start:.1f}s")
+    print(f"{'time s':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    windows = {}
+    for at, latency in samples:
+        windows.setdefault(int(at / WINDOW), []).append(latency * 1000)
+    scale = max(percentile(values, 0.99) for values in windows.values())
+    for index in sorted(windows):
+        values = windows[index]
+        p99 = percentile(values, 0.99)
+        at = index * WINDOW
+        mark = "*" if refresh_start <= at + WINDOW and at <= refresh_end else " "
+        bar = "#" * max(1, round(40 * p99 / scale))
+        print(f"{at:7.1f} {percentile(values, 0.5):8.2f} {p99:8.2f} {mark} {bar}")
+
+    during = [lat for at, lat in samples if refresh_start <= at <= refresh_end]
+    outside = [lat for at, lat in samples if not refresh_start <= at <= refresh_end]
+    print(
+        f"p99 outside the refresh {percentile(outside, 0.99) * 1000:.2f} ms, "
+        f"during the refresh {percentile(during, 0.99) * 1000:.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000, help="AWS images")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds around")
+    args = parser.parse_args()
+
+    bucket = os.path.join(workdir, "bucket")
+    write_bucket(bucket, args.rows)
+    server = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "http.server", "8765", "--directory", bucket],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        time.sleep(1)
+        # Load the data once, so the app has something to serve.
+        if not refresh.run_refresh_process():
+            sys.exit("Unable to load the image data")
+        with TestClient(app) as client:
+            report("thread", *measure(client, refresh_in_thread, args.settle))
+            report(
+                "process",
+                *measure(client, refresh.run_refresh_process, args.settle),
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
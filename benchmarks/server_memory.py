@@ -0,0 +1,161 @@
+"""Compare the memory of preforked workers with that of separate uvicorn processes.
+
+Builds a SQLite database with the AWS test data repeated to the given number of rows,
+serves it with the in-memory snapshot from the given number of processes, once as
+separate uvicorn processes and once as workers forked by `cid.server`, and sums their
+proportional set size. Pages that processes share are split between them, so the sum
+is what the processes take from the machine:
+
+    poetry run python benchmarks/server_memory.py --rows 200000 --workers 4
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+POPULATE = """
+import json, sys
+from cid import crud
+from cid.database import SessionLocal, engine
+from cid.models import Base
+
+Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+with open("tests/data/aws.json") as fileh:
+    images = json.load(fileh)
+rows = int(sys.argv[1])
+crud.import_aws_images(db, [
+    {**images[index % len(images)], "ImageId": f"ami-{index:017x}"}
+    for index in range(rows)
+])
+for cloud_provider in ("azure", "google"):
+    with open(f"tests/data/{cloud_provider}.json") as fileh:
+        getattr(crud, f"import_{cloud_provider}_images")(db, json.load(fileh))
+crud.update_last_updated(db)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory(pid):
+    """Return the proportional and resident set sizes of a process in MiB."""
+    sizes = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fileh:
+        for line in fileh:
+            key, _, value = line.partition(":")
+            if key in ("Pss", "Rss"):
+                sizes[key] = int(value.split()[0]) / 1024
+    return sizes["Pss"], sizes["Rss"]
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as fileh:
+        return [int(child) for child in fileh.read().split()]
+
+
+def wait_until_served(port, processes, timeout=300):
+    """Request every process until each one has loaded the snapshot."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/aws/versions"):
+                pass
+        except OSError:
+            time.sleep(0.2)
+            continue
+        # The snapshot is built before the workers are forked, or by every uvicorn
+        # process in the background. Give them time to finish.
+        time.sleep(processes * 2)
+        return
+    sys.exit("The server didn't start")
+
+
+def measure(name, commands, env, port, workers):
+    servers = [
+        subprocess.Popen(  # noqa: S603
+            command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        for command in commands
+    ]
+    try:
+        wait_until_served(port, workers)
+        pids = []
+        for server in servers:
+            pids.append(server.pid)
+            pids.extend(children(server.pid))
+        sizes = [memory(pid) for pid in pids]
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    pss = sum(size[0] for size in sizes)
+    rss = sum(size[1] for size in sizes)
+    print(f"{name:>20} {len(pids):>10} {pss:12.1f} {rss:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000, help="AWS images")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cid-server-")
+    env = {
+        **os.environ,
+        "ENVIRONMENT": "production",
+        "DATABASE_URL": f"sqlite:///{workdir}/cid.db",
+        "SNAPSHOT_ENABLED": "true",
+        "PYTHONPATH": os.getcwd(),
+    }
+    subprocess.check_call(  # noqa: S603
+        [sys.executable, "-c", POPULATE, str(args.rows)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+    print(f"{'':>20} {'processes':>10} {'PSS MiB':>12} {'RSS MiB':>12}")
+    port = free_port()
+    # Separate processes can share a port through SO_REUSEPORT only, so each one
+    # listens on a port of its own and the first one is requested.
+    ports = [port] + [free_port() for _ in range(args.workers - 1)]
+    measure(
+        "separate uvicorns",
+        [
+            [sys.executable, "-m", "uvicorn", "--port", str(p), "cid.main:app"]
+            for p in ports
+        ],
+        env,
+        port,
+        args.workers,
+    )
+    measure(
+        "preforked workers",
+        [
+            [
+                sys.executable,
+                "-m",
+                "cid.server",
+                "--port",
+                str(port),
+                "--workers",
+                str(args.workers),
+            ]
+        ],
+        env,
+        port,
+        args.workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
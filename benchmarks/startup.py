@@ -0,0 +1,156 @@
+"""Measure how long a new process takes to import the app and serve its first request.
+
+Machines are stopped when idle and started again by the next request, which waits
+for the whole cold start. This times, in fresh processes:
+
+* importing `cid.main`,
+* the time to first byte: from starting uvicorn until the first response of a
+  prebuilt SQLite database arrives, like on a machine that was just started.
+
+Each result can be appended to a history file, which prints the change from the
+previous result to track both over time:
+
+    poetry run python benchmarks/startup.py --runs 10 --history startup.ndjson
+"""
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Exits right away, since older versions started a thread when imported.
+IMPORT_APP = (
+    "import os, time; start = time.perf_counter(); import cid.main; "
+    "print(time.perf_counter() - start, flush=True); os._exit(0)"
+)
+
+POPULATE = """
+import json
+from cid import crud
+from cid.database import SessionLocal, engine
+from cid.models import Base
+
+Base.metadata.create_all(bind=engine)
+db = SessionLocal()
+for cloud_provider in ("aws", "azure", "google"):
+    with open(f"tests/data/{cloud_provider}.json") as fileh:
+        getattr(crud, f"import_{cloud_provider}_images")(db, json.load(fileh))
+crud.update_last_updated(db)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def import_time(env):
+    output = subprocess.check_output(  # noqa: S603
+        [sys.executable, "-c", IMPORT_APP], env=env, stderr=subprocess.DEVNULL
+    )
+    # The app logs to stdout as well.
+    return float(output.splitlines()[-1])
+
+
+def time_to_first_byte(env, path, timeout=60):
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "uvicorn", "--port", str(port), "cid.main:app"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read(1)
+            except ConnectionRefusedError:
+                time.sleep(0.005)
+                continue
+            finally:
+                connection.close()
+            if response.status != 200:
+                sys.exit(f"{path} returned {response.status}")
+            return time.perf_counter() - start
+        sys.exit(f"No response within {timeout} seconds")
+    finally:
+        server.kill()
+        server.wait()
+
+
+def track(history, result):
+    """Append a result to the history, and print the change from the previous one."""
+    previous = None
+    if os.path.exists(history):
+        with open(history) as fileh:
+            lines = fileh.read().splitlines()
+        if lines:
+            previous = json.loads(lines[-1])
+
+    with open(history, "a") as fileh:
+        fileh.write(json.dumps(result) + "\n")
+
+    if previous is not None:
+        for key in ("import_ms", "ttfb_ms"):
+            change = result[key] - previous[key]
+            print(f"{key}: {change:+.1f} ms since {previous['commit']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/aws/latest", help="First request")
+    parser.add_argument("--history", help="File to append the results to")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="cid-startup-")
+    env = {
+        **os.environ,
+        "ENVIRONMENT": "production",
+        "DATABASE_URL": f"sqlite:///{workdir}/cid.db",
+        "PYTHONPATH": os.getcwd(),
+    }
+    subprocess.check_call(  # noqa: S603
+        [sys.executable, "-c", POPULATE], env=env, stdout=subprocess.DEVNULL
+    )
+
+    imports = [import_time(env) * 1000 for _ in range(args.runs)]
+    ttfbs = [time_to_first_byte(env, args.path) * 1000 for _ in range(args.runs)]
+
+    print(f"{'':>16} {'median ms':>10} {'min ms':>10}")
+    for name, values in (("import cid.main", imports), ("first byte", ttfbs)):
+        print(f"{name:>16} {statistics.median(values):10.1f} {min(values):10.1f}")
+
+    if args.history:
+        commit = subprocess.run(  # noqa: S603
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            text=True,
+            check=False,
+        ).stdout.strip()
+        track(
+            args.history,
+            {
+                "commit": commit or "unknown",
+                "date": datetime.now(timezone.utc).isoformat(),
+                "runs": args.runs,
+                "import_ms": round(statistics.median(imports), 1),
+                "ttfb_ms": round(statistics.median(ttfbs), 1),
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare bursts of identical requests with and without request coalescing.
+
+Loads the AWS test data repeated to the given number of rows into a SQLite database,
+then sends bursts of identical requests to the app at once, like a dashboard that
+many people reload together. Prints how long a burst takes and how many queries it
+runs on the database, with coalescing disabled and enabled. The response cache is
+disabled, so every burst misses it:
+
+    poetry run python benchmarks/thundering_herd.py --rows 100000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+workdir = tempfile.mkdtemp(prefix="cid-herd-")
+os.environ["ENVIRONMENT"] = "testing"
+os.environ["DATABASE_URL"] = f"sqlite:///{workdir}/cid.db"
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from cid import crud, database  # noqa: E402
+from cid import main as api  # noqa: E402
+from cid.models import Base  # noqa: E402
+
+PATHS = ("/aws/latest", "/aws?version=9.4")
+
+
+def populate(rows):
+    Base.metadata.create_all(bind=database.engine)
+    with open("tests/data/aws.json") as fileh:
+        images = json.load(fileh)
+    db = database.SessionLocal()
+    crud.import_aws_images(
+        db,
+        [
+            {**images[index % len(images)], "ImageId": f"ami-{index:017x}"}
+            for index in range(rows)
+        ],
+    )
+    crud.update_last_updated(db)
+    db.close()
+
+
+def count_queries():
+    """Count the statements the read endpoints run, on whichever engine they use."""
+    queries = []
+    engines = {database.read_engine}
+    if database.async_read_engine is not None:
+        engines.add(database.async_read_engine.sync_engine)
+    for engine in engines:
+        event.listen(
+            engine, "before_cursor_execute", lambda *args: queries.append(None)
+        )
+    return queries
+
+
+async def bursts(client, path, concurrency, count):
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(client.get(path) for _ in range(concurrency))
+        )
+        durations.append(time.perf_counter() - start)
+        assert {response.status_code for response in responses} == {200}  # noqa: S101
+    return durations
+
+
+async def compare(args, queries):
+    # A single event loop, which the connections of the asyncio engine belong to.
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for path in PATHS:
+            for enabled in (False, True):
+                with patch.object(api, "REQUEST_COALESCING_ENABLED", enabled):
+                    queries.clear()
+                    durations = await bursts(
+                        client, path, args.concurrency, args.bursts
+                    )
+                print(
+                    f"{path:>20} {'on' if enabled else 'off':>10} "
+                    f"{statistics.median(durations) * 1000:10.1f} "
+                    f"{len(queries) // args.bursts:8d}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000, help="AWS images")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=5)
+    args = parser.parse_args()
+
+    # Every request would be logged by httpx otherwise.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    populate(args.rows)
+    queries = count_queries()
+
+    print(f"{'':>20} {'coalescing':>10} {'burst ms':>10} {'queries':>8}")
+    asyncio.run(compare(args, queries))
+
+
+if __name__ == "__main__":
+    main()
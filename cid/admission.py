@@ -0,0 +1,182 @@
+"""Admission control of the expensive endpoints, to shed load instead of slowing down.
+
+The listings and the exports can read a whole table. When too many of them run at
+once, every request slows down until the process runs out of memory or threads.
+Instead, each of these endpoints admits a fixed number of requests at a time, and
+queues a bounded number of others. A request that finds the queue full, or that waits
+longer than the timeout, is answered right away with a 503 and a Retry-After header,
+so clients and load balancers can retry later or elsewhere.
+
+Admission control runs after the response cache and request coalescing, so cached
+responses and requests that share the response of another one are never refused.
+Refusals themselves are never shared: identical requests waiting for a refused one
+are admitted or refused on their own.
+"""
+
+import asyncio
+import logging
+import re
+from collections import deque
+from contextlib import suppress
+from typing import Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from cid.config import (
+    ADMISSION_CONCURRENCY,
+    ADMISSION_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+)
+from cid.serialization import JSONBytesResponse
+
+logger = logging.getLogger(__name__)
+
+# Endpoints that may read a whole table: the listings and the exports.
+EXPENSIVE_PATH = re.compile(r"^/(aws|azure|google)(/export)?$")
+
+
+class Overloaded(Exception):
+    """When a request can't be admitted, because too many are running already."""
+
+    pass
+
+
+class Limiter:
+    """Run a bounded number of requests at a time, and queue a bounded number more."""
+
+    def __init__(self, concurrency: int, queue: int, timeout: float) -> None:
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+
+        self._waiters: deque[asyncio.Future[None]] = deque()
+
+    async def acquire(self) -> None:
+        """Wait for a free slot.
+
+        Raises:
+            Overloaded: when the queue is full, or no slot freed up in time
+        """
+        if self.active < self.concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        if len(self._waiters) >= self.queue:
+            self.rejected += 1
+            raise Overloaded
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            async with asyncio.timeout(self.timeout):
+                await waiter
+        except BaseException as error:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait ended.
+                self.release()
+            else:
+                # A release may have dropped the cancelled waiter already.
+                with suppress(ValueError):
+                    self._waiters.remove(waiter)
+            if isinstance(error, TimeoutError):
+                self.rejected += 1
+                raise Overloaded from None
+            raise
+        self.admitted += 1
+
+    def release(self) -> None:
+        """Free a slot, handing it over to the request that has waited the longest."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict[str, int]:
+        """Return the requests running, waiting, admitted and rejected."""
+        return {
+            "active": self.active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+class AdmissionControl:
+    """Keep a limiter for each expensive endpoint."""
+
+    def __init__(
+        self, concurrency: int, queue: int, timeout: float, retry_after: int
+    ) -> None:
+        self.concurrency = concurrency
+        self.queue = queue
+        self.timeout = timeout
+        self.retry_after = retry_after
+
+        self._limiters: dict[str, Limiter] = {}
+
+    def limiter(self, path: str) -> Optional[Limiter]:
+        """Return the limiter of an endpoint, or None if it is always admitted."""
+        if self.concurrency <= 0 or not EXPENSIVE_PATH.match(path):
+            return None
+        limiter = self._limiters.get(path)
+        if limiter is None:
+            limiter = self._limiters[path] = Limiter(
+                self.concurrency, self.queue, self.timeout
+            )
+        return limiter
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        """Return the statistics of the limiter of every endpoint requested so far."""
+        return {path: limiter.stats() for path, limiter in self._limiters.items()}
+
+
+admission_control = AdmissionControl(
+    ADMISSION_CONCURRENCY,
+    ADMISSION_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RETRY_AFTER,
+)
+
+
+class AdmissionMiddleware:
+    """Hold a slot of the endpoint while a request runs, until its body is sent.
+
+    Exports stream their body long after the endpoint returned, so this is a plain
+    ASGI middleware rather than one that only waits for the response to start.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limiter = None
+        if scope["type"] == "http":
+            limiter = admission_control.limiter(scope["path"])
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Overloaded:
+            logger.debug("Refused a request to %s: overloaded", scope["path"])
+            response = JSONBytesResponse(
+                {"detail": "Too many requests, try again later"},
+                status_code=503,
+                headers={"Retry-After": str(admission_control.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
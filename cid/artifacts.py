@@ -0,0 +1,239 @@
+"""Downloadable files of the whole catalog, built once per refresh.
+
+Bulk consumers that want every image once a day can download a single static file
+instead of walking the paginated listings. Each refresh writes a new version of the
+files for every provider into its own directory:
+
+    ARTIFACTS_DIR/
+        manifest.json                 the version being served
+        20261019T120000000000Z/
+            manifest.json             name, size, rows and SHA-256 of every file
+            aws.ndjson.gz
+            aws.parquet               only when pyarrow is installed
+            aws.sqlite
+            ...
+
+A version is built in a temporary directory and renamed into place before the
+top-level manifest is replaced, so readers never see a partial version. The previous
+version is kept around for clients that are still downloading it.
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import re
+import shutil
+from collections.abc import Iterable
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional
+
+from sqlalchemy import Table, create_engine, insert
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.config import CLOUD_PROVIDERS
+from cid.export import ImageRow, batches, ndjson_chunks
+from cid.formats import arrow_type, arrow_values
+
+# pyarrow is only imported by refreshes that write Parquet files.
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+# Versions kept on disk, including the one being served.
+KEEP_VERSIONS = 2
+
+# Versions are named after the UTC time they were built at.
+VERSION_PATTERN = re.compile(r"^\d{8}T\d{12}Z$")
+
+MEDIA_TYPES = {
+    "ndjson.gz": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "sqlite": "application/vnd.sqlite3",
+}
+
+# Writers take the path, the table and the rows, and return the number of rows written.
+Writer = Callable[[str, Table, Iterable[ImageRow]], int]
+
+
+def _write_ndjson_gz(path: str, table: Table, rows: Iterable[ImageRow]) -> int:
+    """Write gzip-compressed NDJSON, one image per line."""
+    count = 0
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as fh:
+        for chunk in ndjson_chunks(rows):
+            fh.write(chunk)
+            count += chunk.count(b"\n")
+    return count
+
+
+def _write_sqlite(path: str, table: Table, rows: Iterable[ImageRow]) -> int:
+    """Write a SQLite database holding the provider's table, and make it read-only."""
+    count = 0
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        table.create(engine)
+        with engine.begin() as connection:
+            for batch in batches(rows):
+                connection.execute(insert(table), [dict(row) for row in batch])
+                count += len(batch)
+    finally:
+        engine.dispose()
+
+    os.chmod(path, 0o444)
+    return count
+
+
+def _write_parquet(path: str, table: Table, rows: Iterable[ImageRow]) -> int:
+    """Write a Parquet file with one row group per batch of rows."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column.key, arrow_type(column)) for column in table.columns])
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches(rows):
+            values = {
+                column.key: arrow_values(column, [row[column.key] for row in batch])
+                for column in table.columns
+            }
+            writer.write_table(pa.Table.from_pydict(values, schema=schema))
+            count += len(batch)
+    return count
+
+
+def writers() -> dict[str, Writer]:
+    """Return the writer of every format that can be built here, by file extension."""
+    formats: dict[str, Writer] = {"ndjson.gz": _write_ndjson_gz}
+    if HAS_PYARROW:
+        formats["parquet"] = _write_parquet
+    formats["sqlite"] = _write_sqlite
+    return formats
+
+
+def _sha256(path: str) -> str:
+    """Hash a file without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, content: Any) -> None:
+    """Replace a JSON file atomically."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(content, fh, indent=2)
+    os.replace(tmp_path, path)
+
+
+def build_artifacts(db: Session, directory: str) -> dict[str, Any]:
+    """Write a new version of the artifacts of every provider and start serving it.
+
+    Args:
+        db (Session): database session
+        directory (str): directory holding every version of the artifacts
+
+    Returns:
+        dict: manifest of the new version
+    """
+    built_at = datetime.now(timezone.utc)
+    version = built_at.strftime("%Y%m%dT%H%M%S%fZ")
+    tmp_dir = os.path.join(directory, f".{version}.{os.getpid()}.tmp")
+    os.makedirs(tmp_dir)
+
+    files = []
+    try:
+        for cloud_provider in CLOUD_PROVIDERS:
+            for extension, write in writers().items():
+                name = f"{cloud_provider}.{extension}"
+                path = os.path.join(tmp_dir, name)
+                # Every format reads the images again, a batch at a time.
+                table, rows = crud.export_all_images(db, cloud_provider)
+                count = write(path, table, rows)
+                files.append({
+                    "name": name,
+                    "provider": cloud_provider,
+                    "format": extension,
+                    "rows": count,
+                    "size": os.path.getsize(path),
+                    "sha256": _sha256(path),
+                })
+
+        manifest = {
+            "version": version,
+            "built_at": built_at.isoformat(),
+            "files": files,
+        }
+        _write_json(os.path.join(tmp_dir, MANIFEST), manifest)
+        os.rename(tmp_dir, os.path.join(directory, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    _write_json(os.path.join(directory, MANIFEST), manifest)
+    logger.info("📦 Built artifacts version %s", version)
+
+    _prune(directory)
+    return manifest
+
+
+def _prune(directory: str) -> None:
+    """Remove all but the newest versions."""
+    versions = sorted(
+        (entry for entry in os.listdir(directory) if VERSION_PATTERN.match(entry)),
+        reverse=True,
+    )
+    for version in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(os.path.join(directory, version), ignore_errors=True)
+
+
+# Parsed manifests by path, along with the modification time they were read at.
+_manifests: dict[str, tuple[int, dict[str, Any]]] = {}
+
+
+def read_manifest(directory: str, version: str = "latest") -> Optional[dict[str, Any]]:
+    """Return the manifest of a version, or of the version being served.
+
+    Manifests are parsed again only when their file changed, which also picks up the
+    versions built by other worker processes.
+    """
+    if version == "latest":
+        path = os.path.join(directory, MANIFEST)
+    elif VERSION_PATTERN.match(version):
+        path = os.path.join(directory, version, MANIFEST)
+    else:
+        return None
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    cached = _manifests.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path) as fh:
+            cached = (mtime, json.load(fh))
+        _manifests[path] = cached
+    return cached[1]
+
+
+def find_artifact(
+    directory: str, version: str, name: str
+) -> Optional[tuple[str, dict[str, Any]]]:
+    """Return the path and manifest entry of a file, if the version holds it."""
+    manifest = read_manifest(directory, version)
+    if manifest is None:
+        return None
+
+    for entry in manifest["files"]:
+        if entry["name"] == name:
+            path = os.path.join(directory, manifest["version"], name)
+            return path, entry
+    return None
@@ -0,0 +1,57 @@
+"""Run the crud read functions from async endpoints.
+
+The read functions of `cid.crud` run prebuilt Core statements on a `Session`. On an
+`AsyncSession` they run unchanged through `run_sync`: SQLAlchemy executes them in a
+greenlet and the driver, aiosqlite or asyncpg, waits for the database on the event
+loop. A plain `Session`, used when no asyncio driver is installed, runs them in the
+thread pool like the sync endpoints used to.
+"""
+
+from collections.abc import AsyncIterator, Iterator
+from typing import TYPE_CHECKING, Any, Callable, TypeGuard, TypeVar, Union, cast
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from cid.database import HAS_ASYNCIO
+
+if TYPE_CHECKING or HAS_ASYNCIO:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+AnySession = Union[Session, "AsyncSession"]
+
+T = TypeVar("T")
+
+
+def is_async(db: AnySession) -> "TypeGuard[AsyncSession]":
+    """Check whether a session reads through an asyncio engine."""
+    return HAS_ASYNCIO and isinstance(db, AsyncSession)
+
+
+async def run(db: AnySession, function: Callable[..., T], *args: Any) -> T:
+    """Call a crud function with the session, without blocking the event loop."""
+    if is_async(db):
+        return await db.run_sync(function, *args)
+    return await run_in_threadpool(function, db, *args)
+
+
+async def iterate(db: AnySession, iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Iterate a sync iterator that reads from the session, one item at a time.
+
+    Streams of rows, such as the exports, fetch their next batch whenever they are
+    advanced, so every step runs like a crud function.
+    """
+    done = object()
+    while True:
+        item = await run(db, lambda _: next(iterator, done))
+        if item is done:
+            return
+        yield item  # type: ignore[misc]
+
+
+async def close(db: AnySession) -> None:
+    """Close a session and give its connection back to the pool."""
+    if is_async(db):
+        await db.close()
+    else:
+        await run_in_threadpool(cast(Session, db).close)
@@ -2,18 +2,20 @@
 
 import logging
 
-from cid.crud import update_image_data, update_last_updated
 from cid.database import SessionLocal
+from cid.refresh import refresh_image_data
 
 logger = logging.getLogger(__name__)
 
 
 def populate_db() -> None:
-    """Populate the database with image data during container builds."""
+    """Populate the database with image data during container builds.
+
+    The database is pulled from the generation store when one is configured.
+    """
     logger.info("Only populating the database.")
 
     db = SessionLocal()
-    update_image_data(db)
-    update_last_updated(db)
+    refresh_image_data(db)
 
     logger.info("Database population complete. Exiting.")
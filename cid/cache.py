@@ -0,0 +1,287 @@
+"""Bounded in-memory cache of rendered responses for the read endpoints.
+
+The image data only changes when a refresh runs, so identical requests between two
+refreshes always get identical responses. Each refresh bumps the data generation,
+which is part of every cache key, so responses rendered from older data are never
+served again. Entries are evicted in least-recently-used order once the cache holds
+too many entries or too many bytes, and they also expire after a fixed time to live.
+
+The copies kept by clients and CDNs are validated by the data itself: responses carry
+an ETag derived from the recorded time of the last update and the request, along with
+that time and how long the data stays fresh, so unchanged data can be revalidated
+with a 304 response instead of being downloaded again. Every process serving the same
+data sends the same validators, whenever it started.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from time import monotonic
+from typing import NamedTuple, Optional
+
+from cid.config import (
+    REFRESH_INTERVAL,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Read endpoints whose responses only depend on the image data and the query string.
+CACHEABLE_PATH = re.compile(
+    r"^/(aws|azure|google)(/versions|/latest|/images/.+)?$|^/aws/match/"
+)
+
+
+class CachedResponse(NamedTuple):
+    """A rendered response, ready to be sent again."""
+
+    status_code: int
+    headers: list[tuple[str, str]]
+    body: bytes
+    expires_at: float
+
+
+CacheKey = tuple[int, str, tuple[tuple[str, str], ...], Optional[str], Optional[str]]
+
+
+class ResponseCache:
+    """A thread-safe LRU cache with size- and TTL-based eviction."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[CacheKey, CachedResponse] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def key(
+        self,
+        path: str,
+        query_params: Iterable[tuple[str, str]],
+        encoding: Optional[str] = None,
+        media_type: Optional[str] = None,
+    ) -> CacheKey:
+        """Build the key of a request, ignoring the order of its query parameters.
+
+        Each content encoding and each representation other than JSON of a response
+        is cached as a separate entry.
+        """
+        return (
+            current_generation(),
+            path,
+            tuple(sorted(query_params)),
+            encoding,
+            media_type,
+        )
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        """Return a cached response, or None if there is no fresh one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def __contains__(self, key: CacheKey) -> bool:
+        """Check whether a fresh response is cached, without counting a hit or miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.expires_at > monotonic()
+
+    def put(
+        self,
+        key: CacheKey,
+        status_code: int,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        """Store a response, evicting the least recently used ones to make room."""
+        # Responses rendered while a refresh was running may hold older data.
+        if key[0] != current_generation() or len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = CachedResponse(
+                status_code, headers, body, monotonic() + self.ttl
+            )
+            self._size += len(body)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit, miss and eviction counters along with the cache size."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: CacheKey) -> None:
+        """Remove an entry. The caller must hold the lock."""
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+
+response_cache = ResponseCache(
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_TTL
+)
+
+# The generation of the image data being served in this process, which only ever goes
+# up. It keys the response cache, and is never sent to clients.
+_generation = 0
+
+# When the image data being served was last updated, as recorded in the database. The
+# validators sent to clients are derived from it, so every process serving the same
+# data sends the same ones.
+_data_version: Optional[str] = None
+_last_modified: Optional[datetime] = None
+
+
+def current_generation() -> int:
+    """Return the generation of the image data being served."""
+    return _generation
+
+
+def data_version() -> Optional[str]:
+    """Return the last update of the image data being served, if it is known yet."""
+    return _data_version
+
+
+def set_data_version(last_update: str) -> None:
+    """Remember the last update of the image data being served, from `LastUpdate`."""
+    global _data_version, _last_modified
+
+    _data_version = last_update
+    _last_modified = None
+    if last_update:
+        updated_at = datetime.fromisoformat(last_update)
+        # The database stores the time of the update in UTC, without a time zone.
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=timezone.utc)
+        # HTTP dates only have a resolution of one second.
+        _last_modified = updated_at.replace(microsecond=0)
+
+
+def last_modified() -> Optional[datetime]:
+    """Return the time the image data being served was last updated, if known."""
+    return _last_modified
+
+
+def bump_generation() -> int:
+    """Start a new data generation after the image data has changed."""
+    global _generation
+
+    _generation += 1
+    # Entries of older generations can never be hit again.
+    response_cache.clear()
+
+    logger.info("🔁 Serving data generation %d", _generation)
+    return _generation
+
+
+def etag(
+    path: str,
+    query_params: Iterable[tuple[str, str]],
+    encoding: Optional[str] = None,
+    media_type: Optional[str] = None,
+) -> str:
+    """Build a strong ETag for a request from the image data it is served from."""
+    validator = "|".join([
+        data_version() or "",
+        encoding or "identity",
+        media_type or "application/json",
+        path,
+        *(f"{name}={value}" for name, value in sorted(query_params)),
+    ])
+    return f'"{hashlib.sha256(validator.encode()).hexdigest()[:32]}"'
+
+
+def caching_headers(tag: str, vary: str = "Accept-Encoding") -> dict[str, str]:
+    """Return the validators and freshness headers of a cacheable response."""
+    updated_at = last_modified()
+    if updated_at is None:
+        # Without a known update time, clients must revalidate every time.
+        return {"ETag": tag, "Cache-Control": "public, max-age=0", "Vary": vary}
+
+    # The data stays fresh until the next scheduled refresh after its update.
+    next_refresh = updated_at + timedelta(seconds=REFRESH_INTERVAL)
+    max_age = int((next_refresh - datetime.now(timezone.utc)).total_seconds())
+    return {
+        "ETag": tag,
+        "Last-Modified": format_datetime(updated_at, usegmt=True),
+        "Cache-Control": f"public, max-age={max(max_age, 0)}",
+        "Vary": vary,
+    }
+
+
+def matches_etag(tag: str, if_none_match: Optional[str]) -> bool:
+    """Check whether If-None-Match lists the tag itself, rather than only `*`."""
+    if if_none_match is None:
+        return False
+    return any(
+        candidate.strip().removeprefix("W/") == tag
+        for candidate in if_none_match.split(",")
+    )
+
+
+def is_not_modified(
+    tag: str, if_none_match: Optional[str], if_modified_since: Optional[str]
+) -> bool:
+    """Check whether the copy a client already holds is still current.
+
+    `*` and If-Modified-Since match any resource, including ones that don't exist,
+    so the response must be known to succeed before answering them with a 304.
+    """
+    if if_none_match is not None:
+        # If-None-Match uses the weak comparison and takes precedence.
+        candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+        return "*" in candidates or any(
+            candidate.removeprefix("W/") == tag for candidate in candidates
+        )
+
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        updated_at = last_modified()
+        if since.tzinfo is None or updated_at is None:
+            return False
+        return updated_at <= since
+
+    return False
@@ -0,0 +1,341 @@
+"""Read-only catalog file that several worker processes can share through mmap.
+
+The catalog stores the columnar tables of a snapshot in a single file, laid out so that
+readers never have to copy or decode it up front:
+
+* a small JSON header that records where every section starts,
+* one fixed-width `uint32` code per row for each column,
+* one string table per column holding its dictionary of distinct values,
+* for indexed columns, the posting lists of every value with an offset index into them,
+  and the bitmaps of every value for low-cardinality columns.
+
+Each worker maps the file read-only, so the kernel keeps a single physical copy of its
+pages in the page cache no matter how many workers are running. A refresh writes a new
+file next to the old one and renames it into place. Workers that still map the old
+file keep a valid view of it until they switch to the new one.
+"""
+
+import json
+import logging
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+from collections.abc import Iterator, Mapping, Sequence
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from cid.columnar import Column, ColumnarTable
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CIDCAT01"
+
+# Magic, then the length of the JSON header as an unsigned 64-bit integer.
+_PREAMBLE_SIZE = len(MAGIC) + 8
+
+
+class InvalidCatalog(Exception):
+    """When a file is not a catalog written by this module."""
+
+    pass
+
+
+def _align(offset: int) -> int:
+    """Round an offset up to the next multiple of eight bytes."""
+    return (offset + 7) & ~7
+
+
+def _column_type(values: Sequence[Any]) -> str:
+    """Work out how the values of a column are stored as strings."""
+    present = [value for value in values if value is not None]
+    if all(isinstance(value, str) for value in present):
+        return "str"
+    if all(isinstance(value, datetime) for value in present):
+        return "datetime"
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in present):
+        return "int"
+    return "json"
+
+
+_ENCODERS: dict[str, Callable[[Any], str]] = {
+    "str": str,
+    "datetime": datetime.isoformat,
+    "int": str,
+    "json": json.dumps,
+}
+
+_DECODERS: dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "datetime": datetime.fromisoformat,
+    "int": int,
+    "json": json.loads,
+}
+
+
+class _Writer:
+    """Collect the sections of a catalog and remember where each one starts."""
+
+    def __init__(self) -> None:
+        self.chunks: list[bytes] = []
+        self.offset = 0
+
+    def add(self, data: bytes) -> int:
+        """Append a section, aligned to eight bytes, and return its offset."""
+        padding = _align(self.offset) - self.offset
+        if padding:
+            self.chunks.append(b"\0" * padding)
+            self.offset += padding
+
+        start = self.offset
+        self.chunks.append(data)
+        self.offset += len(data)
+        return start
+
+    def add_strings(self, strings: Sequence[str]) -> dict[str, int]:
+        """Append a string table and return the offsets of its index and its data."""
+        encoded = [string.encode() for string in strings]
+        offsets = array("Q", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        return {
+            "count": len(encoded),
+            "offsets": self.add(offsets.tobytes()),
+            "data": self.add(b"".join(encoded)),
+        }
+
+
+def _write_column(writer: _Writer, column: Column, size: int) -> dict[str, Any]:
+    """Append the sections of a single column and return its header entry."""
+    values = list(column.values)
+    column_type = _column_type(values)
+    encode = _ENCODERS[column_type]
+
+    entry: dict[str, Any] = {
+        "name": column.name,
+        "type": column_type,
+        "null": values.index(None) if None in values else None,
+        "sorted": column_type == "str" and column.index is not None,
+        "values": writer.add_strings([
+            "" if value is None else encode(value) for value in values
+        ]),
+        "codes": writer.add(array("I", column.codes).tobytes()),
+        "postings": None,
+        "bitmaps": None,
+    }
+
+    if column.postings:
+        offsets = array("I", [0])
+        positions = array("I")
+        for posting in column.postings:
+            positions.extend(posting)
+            offsets.append(len(positions))
+        entry["postings"] = {
+            "offsets": writer.add(offsets.tobytes()),
+            "positions": writer.add(positions.tobytes()),
+        }
+
+    if column.bitmaps is not None:
+        width = (size + 7) // 8
+        entry["bitmaps"] = {
+            "width": width,
+            "data": writer.add(
+                b"".join(bitmap.to_bytes(width, "little") for bitmap in column.bitmaps)
+            ),
+        }
+
+    return entry
+
+
+def write_catalog(path: str, tables: Mapping[str, ColumnarTable]) -> None:
+    """Write columnar tables to a catalog file, replacing any existing file atomically."""
+    writer = _Writer()
+    header = {
+        "created_at": datetime.now().isoformat(),
+        "tables": {
+            name: {
+                "size": table.size,
+                "columns": [
+                    _write_column(writer, column, table.size)
+                    for column in table.columns.values()
+                ],
+            }
+            for name, table in tables.items()
+        },
+    }
+    encoded_header = json.dumps(header).encode()
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as fileh:
+        fileh.write(MAGIC)
+        fileh.write(len(encoded_header).to_bytes(8, "little"))
+        fileh.write(encoded_header)
+        fileh.write(b"\0" * (_align(fileh.tell()) - fileh.tell()))
+        for chunk in writer.chunks:
+            fileh.write(chunk)
+        fileh.flush()
+        os.fsync(fileh.fileno())
+    os.replace(temporary_path, path)
+
+    logger.info("🗂️ Wrote the image catalog to %s", path)
+
+
+class _StringTable(Sequence[str]):
+    """A table of strings decoded on demand from the mapped file."""
+
+    def __init__(self, buffer: memoryview, entry: dict[str, int]) -> None:
+        count = entry["count"]
+        self._offsets = buffer[entry["offsets"] : entry["offsets"] + 8 * (count + 1)]
+        self._offsets = self._offsets.cast("Q")
+        self._data = buffer[entry["data"] :]
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, code: Any) -> Any:
+        if isinstance(code, slice):
+            return [self[i] for i in range(*code.indices(self._count))]
+        return str(self._data[self._offsets[code] : self._offsets[code + 1]], "utf-8")
+
+
+class _ValueTable(Sequence[Any]):
+    """The dictionary of a column, decoded back to Python values on demand."""
+
+    def __init__(
+        self, strings: _StringTable, decode: Callable[[str], Any], null: Optional[int]
+    ) -> None:
+        self._strings = strings
+        self._decode = decode
+        self._null = null
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def __getitem__(self, code: Any) -> Any:
+        if isinstance(code, slice):
+            return [self[i] for i in range(*code.indices(len(self)))]
+        if code == self._null:
+            return None
+        return self._decode(self._strings[code])
+
+
+class _SortedIndex(Mapping[Any, int]):
+    """Look up the code of a value by binary search in a sorted string table."""
+
+    def __init__(self, strings: _StringTable, null: Optional[int]) -> None:
+        self._strings = strings
+        # NULL sorts first, so the strings start right after it.
+        self._start = 0 if null is None else null + 1
+
+    def __getitem__(self, value: Any) -> int:
+        if isinstance(value, str):
+            code = bisect_left(self._strings, value, self._start)
+            if code < len(self._strings) and self._strings[code] == value:
+                return code
+        raise KeyError(value)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._strings[self._start :])
+
+    def __len__(self) -> int:
+        return len(self._strings) - self._start
+
+
+class _Postings(Sequence[Sequence[int]]):
+    """Posting lists that are zero-copy slices of the mapped file."""
+
+    def __init__(self, offsets: memoryview, positions: memoryview) -> None:
+        self._offsets = offsets
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code: Any) -> Any:
+        return self._positions[self._offsets[code] : self._offsets[code + 1]]
+
+
+class _Bitmaps(Sequence[int]):
+    """Bitmaps stored as little-endian bytes, turned into ints when they are used."""
+
+    def __init__(self, data: memoryview, width: int, count: int) -> None:
+        self._data = data
+        self._width = width
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, code: Any) -> Any:
+        if not 0 <= code < self._count:
+            raise IndexError(code)
+        start = code * self._width
+        return int.from_bytes(self._data[start : start + self._width], "little")
+
+
+class Catalog:
+    """A catalog file mapped into memory."""
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as fileh:
+            self._mmap = mmap.mmap(fileh.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(fileh.fileno())
+
+        # Remember which file was mapped so a replacement can be detected later.
+        self.path = path
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+
+        buffer = memoryview(self._mmap)
+        if bytes(buffer[: len(MAGIC)]) != MAGIC:
+            raise InvalidCatalog(path)
+
+        header_size = int.from_bytes(buffer[len(MAGIC) : _PREAMBLE_SIZE], "little")
+        self.header = json.loads(
+            bytes(buffer[_PREAMBLE_SIZE : _PREAMBLE_SIZE + header_size])
+        )
+        self._data = buffer[_align(_PREAMBLE_SIZE + header_size) :]
+
+    def _column(self, entry: dict[str, Any], size: int) -> Column:
+        """Build a column whose data lives in the mapped file."""
+        data = self._data
+        strings = _StringTable(data, entry["values"])
+        values = _ValueTable(strings, _DECODERS[entry["type"]], entry["null"])
+        codes = data[entry["codes"] : entry["codes"] + 4 * size].cast("I")
+
+        index = _SortedIndex(strings, entry["null"]) if entry["sorted"] else None
+
+        postings: Sequence[Sequence[int]] = ()
+        if entry["postings"] is not None:
+            offsets_start = entry["postings"]["offsets"]
+            offsets = data[offsets_start : offsets_start + 4 * (len(strings) + 1)]
+            positions_start = entry["postings"]["positions"]
+            positions = data[positions_start : positions_start + 4 * size]
+            postings = _Postings(offsets.cast("I"), positions.cast("I"))
+
+        bitmaps = None
+        if entry["bitmaps"] is not None:
+            width = entry["bitmaps"]["width"]
+            start = entry["bitmaps"]["data"]
+            bitmaps = _Bitmaps(
+                data[start : start + width * len(strings)], width, len(strings)
+            )
+
+        return Column(entry["name"], values, codes, index, postings, bitmaps)
+
+    def table(self, name: str) -> ColumnarTable:
+        """Return one of the tables in the catalog."""
+        table = self.header["tables"][name]
+        columns = {
+            entry["name"]: self._column(entry, table["size"])
+            for entry in table["columns"]
+        }
+        return ColumnarTable(table["size"], columns)
+
+    def is_current(self) -> bool:
+        """Check whether the catalog file on disk is still the one that was mapped."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) == self.identity
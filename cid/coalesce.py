@@ -0,0 +1,97 @@
+"""Share one computation between identical requests that arrive at the same time.
+
+When a popular page reloads, dozens of identical requests arrive together, before the
+response cache holds their response, or while it is disabled. Without coalescing,
+each of them would run the same queries. Instead, the first request computes the
+response and the others wait for it and share its result.
+
+Requests are keyed like the response cache: by the data generation, the path and the
+query parameters. Only requests in flight at the same time are coalesced: a result is
+forgotten as soon as it is handed out, since keeping it is the cache's job.
+"""
+
+import asyncio
+from collections.abc import Awaitable, Hashable
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _LeaderCancelled(Exception):
+    """Raised to the followers when the request computing their result is cancelled."""
+
+    pass
+
+
+class SingleFlight(Generic[T]):
+    """Run one computation per key at a time, and share its result with every caller.
+
+    The first caller of a key runs the computation, and the others wait for its
+    result. A follower whose client went away doesn't cancel the computation, and if
+    the caller computing the result is cancelled, one of the followers computes it
+    instead.
+    """
+
+    def __init__(self) -> None:
+        self.computed = 0
+        self.shared = 0
+
+        self._flights: dict[Hashable, asyncio.Future[T]] = {}
+
+    async def do(
+        self,
+        key: Hashable,
+        function: Callable[[], Awaitable[T]],
+        shareable: Optional[Callable[[T], bool]] = None,
+    ) -> T:
+        """Return the result of the computation of a key, running it if needed.
+
+        Followers run the computation themselves when its result isn't `shareable`.
+        """
+        while True:
+            flight = self._flights.get(key)
+            if flight is None:
+                return await self._lead(key, function)
+
+            try:
+                # Shielded, so a follower going away doesn't cancel the flight.
+                result = await asyncio.shield(flight)
+            except _LeaderCancelled:
+                continue
+            if shareable is not None and not shareable(result):
+                self.computed += 1
+                return await function()
+            self.shared += 1
+            return result
+
+    async def _lead(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        flight: asyncio.Future[T] = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        self.computed += 1
+        try:
+            result = await function()
+        except asyncio.CancelledError:
+            self._fail(flight, _LeaderCancelled())
+            raise
+        except Exception as error:
+            self._fail(flight, error)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+    @staticmethod
+    def _fail(flight: "asyncio.Future[Any]", error: Exception) -> None:
+        flight.set_exception(error)
+        # The leader raises the error itself, so there may be nobody else to see it.
+        flight.exception()
+
+    def stats(self) -> dict[str, int]:
+        """Return the computations run and shared, and the number in flight."""
+        return {
+            "in_flight": len(self._flights),
+            "computed": self.computed,
+            "shared": self.shared,
+        }
@@ -0,0 +1,337 @@
+"""Dictionary-encoded columnar tables for filtering image listings in memory.
+
+Every column stores each distinct value once in a dictionary, plus one integer code
+per row. The rows are kept in the order the listing endpoints return them, so a set
+of matching row positions is already sorted and a page is just a slice of it.
+
+Indexed columns also keep a posting list for each distinct value: the sorted positions
+of the rows that hold it. Low-cardinality columns like arch or region also keep a
+bitmap for each value, stored as a Python int with one bit per row. Filters on those
+columns are combined with bitwise operators that run in C over the whole table at once.
+"""
+
+import json
+from array import array
+from collections.abc import Iterable, Mapping, Sequence
+from itertools import chain
+from typing import Any, NamedTuple, Optional
+
+from cid.config import MAX_PAGE_SIZE
+
+# Indexed columns with at most this many distinct values also get bitmaps.
+BITMAP_MAX_CARDINALITY = 128
+
+# Number of bits of a mask to look at, or count when skipping ahead, at once.
+_SKIP_CHUNK = 4096
+_WINDOW_MASK = (1 << _SKIP_CHUNK) - 1
+_WORD_MASK = (1 << 64) - 1
+
+
+class Filter(NamedTuple):
+    """Match rows where a column equals (or contains) a value."""
+
+    column: str
+    value: str
+    contains: bool = False
+
+
+def _dictionary_key(value: Any) -> Any:
+    """Return a hashable key for a column value, which may be a JSON list or dict."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def _value_sort_key(value: Any) -> tuple:
+    """Sort dictionaries of strings with NULL first so they can be binary searched."""
+    return (value is not None, value or "")
+
+
+def _bitmap(positions: Iterable[int], size: int) -> int:
+    """Build a bitmap with the bits at the given positions set."""
+    buffer = bytearray((size + 7) // 8)
+    for position in positions:
+        buffer[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(buffer, "little")
+
+
+class Column:
+    """A single dictionary-encoded column."""
+
+    __slots__ = ("bitmaps", "codes", "index", "name", "postings", "values")
+
+    def __init__(
+        self,
+        name: str,
+        values: Sequence[Any],
+        codes: Sequence[int],
+        index: Optional[Mapping[Any, int]] = None,
+        postings: Sequence[Sequence[int]] = (),
+        bitmaps: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.name = name
+        self.values = values
+        self.codes = codes
+        self.index = index
+        self.postings = postings
+        self.bitmaps = bitmaps
+
+    @classmethod
+    def from_values(
+        cls, name: str, raw_values: Sequence[Any], indexed: bool
+    ) -> "Column":
+        """Dictionary-encode a sequence of values, one per row."""
+        keys = {_dictionary_key(value): value for value in raw_values}
+        if all(value is None or isinstance(value, str) for value in keys.values()):
+            keys = dict(sorted(keys.items(), key=lambda item: _value_sort_key(item[1])))
+
+        index = {key: code for code, key in enumerate(keys)}
+        values = list(keys.values())
+        codes = array("I", (index[_dictionary_key(value)] for value in raw_values))
+
+        if not indexed:
+            return cls(name, values, codes)
+
+        positions: list[array] = [array("I") for _ in values]
+        for position, code in enumerate(codes):
+            positions[code].append(position)
+
+        bitmaps = None
+        if len(values) <= BITMAP_MAX_CARDINALITY:
+            bitmaps = [_bitmap(posting, len(codes)) for posting in positions]
+
+        return cls(name, values, codes, index, positions, bitmaps)
+
+    def count(self, codes: Iterable[int]) -> int:
+        """Return the number of rows that hold any of the given codes."""
+        return sum(len(self.postings[code]) for code in codes)
+
+    def matching_codes(self, value: str, contains: bool = False) -> list[int]:
+        """Return the dictionary codes of the values that match a filter."""
+        if not contains:
+            code = self.index.get(value) if self.index is not None else None
+            return [] if code is None else [code]
+
+        # Substring matches ignore case, just like SQLite's LIKE operator.
+        needle = value.lower()
+        return [
+            code
+            for code, candidate in enumerate(self.values)
+            if isinstance(candidate, str) and needle in candidate.lower()
+        ]
+
+
+def _collect_set_bits(
+    window: int, start: int, skip: int, limit: int, positions: list[int]
+) -> int:
+    """Add the positions of the set bits of a window, starting at bit `start`.
+
+    Bits are skipped a 64-bit word at a time while `skip` of them are left to skip,
+    and positions are added until there are `limit` of them.
+
+    Returns:
+        int: how many set bits are left to skip
+    """
+    found = window.bit_count()
+    if found <= skip:
+        return skip - found
+
+    while window and len(positions) < limit:
+        word = window & _WORD_MASK
+        found = word.bit_count()
+        if found <= skip:
+            skip -= found
+        else:
+            while word and len(positions) < limit:
+                lowest = word & -word
+                word ^= lowest
+                if skip:
+                    skip -= 1
+                else:
+                    positions.append(start + lowest.bit_length() - 1)
+        window >>= 64
+        start += 64
+    return skip
+
+
+def _set_bit_positions(mask: int, skip: int, limit: int) -> list[int]:
+    """Return the positions of up to `limit` set bits after skipping `skip` of them.
+
+    The first window of bits is read off the mask without copying the rest of it, so
+    first pages of most listings never touch the whole mask. Later windows are read
+    from the bytes of the mask, and only counted while there are bits left to skip.
+    """
+    positions: list[int] = []
+    skip = _collect_set_bits(mask & _WINDOW_MASK, 0, skip, limit, positions)
+    if len(positions) == limit or mask <= _WINDOW_MASK:
+        return positions
+
+    data = memoryview(mask.to_bytes((mask.bit_length() + 7) // 8, "little"))
+    window_bytes = _SKIP_CHUNK // 8
+    for offset in range(window_bytes, len(data), window_bytes):
+        window = int.from_bytes(data[offset : offset + window_bytes], "little")
+        skip = _collect_set_bits(window, offset * 8, skip, limit, positions)
+        if len(positions) == limit:
+            break
+    return positions
+
+
+class ColumnarTable:
+    """An immutable, dictionary-encoded table with rows in listing order."""
+
+    __slots__ = ("columns", "size")
+
+    def __init__(self, size: int, columns: Mapping[str, Column]) -> None:
+        self.size = size
+        self.columns = columns
+
+    @classmethod
+    def from_rows(
+        cls,
+        names: Sequence[str],
+        rows: Sequence[Sequence[Any]],
+        indexed: Iterable[str] = (),
+    ) -> "ColumnarTable":
+        """Build a table from rows that are already sorted in listing order."""
+        indexed = set(indexed)
+        columns = {
+            name: Column.from_values(
+                name, [row[i] for row in rows], indexed=name in indexed
+            )
+            for i, name in enumerate(names)
+        }
+        return cls(len(rows), columns)
+
+    def row(
+        self, position: int, names: Optional[Sequence[str]] = None
+    ) -> dict[str, Any]:
+        """Materialize a single row, or some of its columns, as a dictionary."""
+        columns = (
+            self.columns.items()
+            if names is None
+            else [(name, self.columns[name]) for name in names]
+        )
+        return {name: column.values[column.codes[position]] for name, column in columns}
+
+    def value(self, name: str, position: int) -> Any:
+        """Return the value of a single column in a single row."""
+        column = self.columns[name]
+        return column.values[column.codes[position]]
+
+    def distinct(self, name: str) -> list[Any]:
+        """Return the distinct non-NULL values of a column."""
+        return [value for value in self.columns[name].values if value is not None]
+
+    def positions(self, name: str, value: Any) -> Sequence[int]:
+        """Return the positions of the rows where an indexed column equals a value."""
+        column = self.columns[name]
+        code = column.index.get(value) if column.index is not None else None
+        if code is None or not column.postings:
+            return ()
+        return column.postings[code]
+
+    def select(self, filters: Sequence[Filter]) -> "Selection":
+        """Find the rows that match all of the given filters."""
+        resolved = []
+        for column_filter in filters:
+            column = self.columns[column_filter.column]
+            codes = column.matching_codes(column_filter.value, column_filter.contains)
+            if not codes:
+                return Selection(self.size, positions=[])
+            resolved.append((column, codes))
+
+        if not resolved:
+            return Selection(self.size)
+
+        bitmapped = [
+            (column.bitmaps, codes)
+            for column, codes in resolved
+            if column.bitmaps is not None
+        ]
+        if len(bitmapped) == len(resolved):
+            mask = (1 << self.size) - 1
+            for bitmaps, codes in bitmapped:
+                column_mask = 0
+                for code in codes:
+                    column_mask |= bitmaps[code]
+                mask &= column_mask
+            return Selection(self.size, mask=mask)
+
+        # Start from the filter that matches the fewest rows and check the others
+        # against the row codes of their columns.
+        resolved.sort(key=lambda item: item[0].count(item[1]))
+        (driver, driver_codes), others = resolved[0], resolved[1:]
+
+        postings = [driver.postings[code] for code in driver_codes]
+        candidates = postings[0] if len(postings) == 1 else sorted(chain(*postings))
+
+        checks = [(column.codes, set(codes)) for column, codes in others]
+        return Selection(
+            self.size,
+            positions=[
+                position
+                for position in candidates
+                if all(codes[position] in allowed for codes, allowed in checks)
+            ],
+        )
+
+    def find(
+        self,
+        filters: Sequence[Filter],
+        page: int = 1,
+        page_size: int = 100,
+        names: Optional[Sequence[str]] = None,
+    ) -> dict:
+        """Return a page of rows that match the filters, shaped like `crud.paginate`.
+
+        Only the columns in `names` are returned, or every column if it is None.
+        """
+        if page < 1:
+            page = 1
+
+        page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+
+        selection = self.select(filters)
+        total_count = selection.count()
+        total_pages = (total_count + page_size - 1) // page_size
+        positions = selection.slice((page - 1) * page_size, page_size)
+
+        return {
+            "results": [self.row(position, names) for position in positions],
+            "page": page,
+            "page_size": page_size,
+            "total_count": total_count,
+            "total_pages": total_pages,
+        }
+
+
+class Selection:
+    """The set of rows matched by a query, as a bitmap or as sorted positions."""
+
+    __slots__ = ("mask", "positions", "size")
+
+    def __init__(
+        self,
+        size: int,
+        mask: Optional[int] = None,
+        positions: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.size = size
+        self.mask = mask
+        self.positions = positions
+
+    def count(self) -> int:
+        """Return the number of matching rows."""
+        if self.positions is not None:
+            return len(self.positions)
+        if self.mask is not None:
+            return self.mask.bit_count()
+        return self.size
+
+    def slice(self, offset: int, limit: int) -> Sequence[int]:
+        """Return the positions of up to `limit` rows starting at `offset`."""
+        if self.positions is not None:
+            return self.positions[offset : offset + limit]
+        if self.mask is not None:
+            return _set_bit_positions(self.mask, offset, limit)
+        return range(min(offset, self.size), min(offset + limit, self.size))
@@ -0,0 +1,86 @@
+"""Content encodings for the read endpoints, negotiated from Accept-Encoding.
+
+gzip is always available. Brotli and Zstandard are used when the `brotli` and
+`zstandard` packages are installed, and are preferred over gzip because they compress
+the large JSON listings better and faster.
+"""
+
+import gzip
+from collections.abc import Callable
+from typing import Optional
+
+# Bodies smaller than this are sent as they are, since compressing them saves little.
+MIN_COMPRESSED_SIZE = 512
+
+try:
+    import brotli
+
+    HAS_BROTLI = True
+except ImportError:  # pragma: no cover
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # pragma: no cover
+    HAS_ZSTANDARD = False
+
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def _brotli_compress(body: bytes) -> bytes:
+    return bytes(brotli.compress(body, quality=5))
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    compressor = zstandard.ZstdCompressor(level=6)
+    return bytes(compressor.compress(body))
+
+
+# The supported encodings, from the most to the least preferred.
+ENCODERS: dict[str, Callable[[bytes], bytes]] = {}
+if HAS_BROTLI:
+    ENCODERS["br"] = _brotli_compress
+if HAS_ZSTANDARD:
+    ENCODERS["zstd"] = _zstd_compress
+ENCODERS["gzip"] = _gzip
+
+
+def _quality(value: str) -> float:
+    """Parse the q parameter of an Accept-Encoding entry."""
+    for param in value.split(";"):
+        name, _, weight = param.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(weight)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding a client accepts, or None for no encoding."""
+    if not accept_encoding:
+        return None
+
+    weights: dict[str, float] = {}
+    for entry in accept_encoding.split(","):
+        name, _, params = entry.partition(";")
+        weights[name.strip().lower()] = _quality(params)
+
+    best, best_weight = None, 0.0
+    for encoding in ENCODERS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body: bytes, encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """Compress a body, returning it along with the encoding that was applied."""
+    if encoding is None or len(body) < MIN_COMPRESSED_SIZE:
+        return body, None
+    return ENCODERS[encoding](body), encoding
@@ -1,6 +1,7 @@
 """Centralized configuration for the project."""
 
 import os
+import re
 
 # Get the current environment (default to testing if not set).
 ENVIRONMENT = os.getenv("ENVIRONMENT", "testing")
@@ -13,10 +14,111 @@ DATABASE_URLS = {
     # In-memory databases are much faster for testing.
     "testing": "sqlite:///:memory:",
 }
-DATABASE_URL = DATABASE_URLS[ENVIRONMENT]
+# DATABASE_URL overrides the database of the environment, such as a PostgreSQL server
+# shared by several API nodes. PostgreSQL URLs without a driver, including the old
+# postgres:// scheme that some hosts hand out, use psycopg2.
+DATABASE_URL = re.sub(
+    r"^postgres(ql)?://",
+    "postgresql+psycopg2://",
+    os.getenv("DATABASE_URL", DATABASE_URLS[ENVIRONMENT]),
+)
+
+# Connection pool of every engine on a database server. Connections are replaced after
+# the recycle time in seconds, and checked before use when pre-ping is enabled, so
+# connections closed by the server or a proxy are never handed out.
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = int(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "1800"))
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+
+# Read requests through an asyncio engine when aiosqlite or asyncpg is installed.
+ASYNC_DATABASE_ENABLED = os.getenv("ASYNC_DATABASE_ENABLED", "true").lower() == "true"
+
+# Worker processes forked by the `cid` server, one per CPU when 0.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+
+# Pragmas of every SQLite connection. WAL lets the API keep reading while a refresh
+# writes, and NORMAL synchronous is durable enough for data that can be downloaded
+# again. The cache size is negative to count it in KiB instead of pages.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", str(-64 * 1024)))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 2**20)))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+# Milliseconds a connection waits for a lock held by another one.
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# Seconds between two refreshes of the image data. Every process waits up to the
+# jitter in seconds longer, picked at random, so nodes don't all download the image
+# data at once.
+REFRESH_INTERVAL = 24 * 60 * 60
+REFRESH_JITTER = int(os.getenv("REFRESH_JITTER", "900"))
+
+# Run every refresh in a process of its own, so parsing the image data never holds
+# the GIL of the API process. The refresh process is stopped after the timeout in
+# seconds.
+REFRESH_IN_SUBPROCESS = os.getenv("REFRESH_IN_SUBPROCESS", "true").lower() == "true"
+REFRESH_TIMEOUT = int(os.getenv("REFRESH_TIMEOUT", "3600"))
+
+# Optional lock file electing the one process that refreshes the data on a host. It
+# defaults to a file next to a SQLite database. PostgreSQL uses an advisory lock.
+REFRESH_LOCK_PATH = os.getenv("REFRESH_LOCK_PATH", "")
+
+# Optional shared store of the finished generations of the database and catalog: a
+# local directory, an s3://bucket/prefix (with boto3 installed), or an http(s):// URL
+# to pull from. The publisher builds every generation from the image data and
+# publishes it, while every other node only pulls the generations it doesn't have.
+GENERATION_STORE = os.getenv("GENERATION_STORE", "")
+GENERATION_PUBLISHER = os.getenv("GENERATION_PUBLISHER", "false").lower() == "true"
+
+# Serve the hot read endpoints and the filtered listings from an in-memory snapshot of
+# the image data that is rebuilt after every refresh instead of querying the database
+# on each request.
+SNAPSHOT_ENABLED = os.getenv("SNAPSHOT_ENABLED", "false").lower() == "true"
+
+# Optional path of a read-only catalog file holding the snapshot. Every worker process
+# maps the same file, so they share one copy of the snapshot in the page cache.
+CATALOG_PATH = os.getenv("CATALOG_PATH", "")
+
+# Cache rendered responses of the read endpoints until the next refresh. The cache
+# keeps at most this many entries and bytes, and entries expire after the TTL (in
+# seconds) even when no refresh happened in this process.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 2**20)))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Let identical read requests that arrive at the same time share one response.
+REQUEST_COALESCING_ENABLED = (
+    os.getenv("REQUEST_COALESCING_ENABLED", "true").lower() == "true"
+)
+
+# Listings return at most this many images per page, whatever page size is asked for.
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Admission control of the expensive endpoints, the listings and the exports. Each
+# worker process runs at most this many requests to each of them at a time, and queues
+# at most this many more for up to the timeout (in seconds). Other requests are refused
+# right away with a 503 and a Retry-After (in seconds), instead of slowing down every
+# request. A concurrency of 0 disables admission control.
+ADMISSION_CONCURRENCY = int(os.getenv("ADMISSION_CONCURRENCY", "4"))
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "1"))
+
+# Optional directory where every refresh writes downloadable files of the whole
+# catalog for each provider.
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR", "")
+
+# Optional directory where every refresh publishes the responses that only depend on
+# the image data as static, precompressed files for a web server or CDN.
+STATIC_SITE_DIR = os.getenv("STATIC_SITE_DIR", "")
 
 # Image data for populating the database.
-IMAGE_DATA_BASE_URL = "https://cloudx-json-bucket.s3.amazonaws.com/raw"
+IMAGE_DATA_BASE_URL = os.getenv(
+    "IMAGE_DATA_BASE_URL", "https://cloudx-json-bucket.s3.amazonaws.com/raw"
+)
 AWS_IMAGE_DATA = f"{IMAGE_DATA_BASE_URL}/aws/aws.json"
 AZURE_IMAGE_DATA = f"{IMAGE_DATA_BASE_URL}/azure/eastus.json"
 GOOGLE_IMAGE_DATA = f"{IMAGE_DATA_BASE_URL}/google/global.json"
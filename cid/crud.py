@@ -1,72 +1,205 @@
 """Create, replace, update, and delete functions for the CID database."""
 
 import logging
+from collections.abc import Iterator
+from datetime import datetime
+from functools import lru_cache
 from typing import Any, Optional
 
-from dateutil import parser
-from packaging.version import Version
-from sqlalchemy import desc, func
+from sqlalchemy import ColumnElement, Select, Table, bindparam, func, select
+from sqlalchemy.engine import Row, RowMapping
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.query import Query
 
-from cid.config import CLOUD_PROVIDERS
+from cid.config import CLOUD_PROVIDERS, MAX_PAGE_SIZE
 from cid.database import engine
-from cid.models import AwsImage, AzureImage, GoogleImage, LastUpdate
+from cid.ingest import bulk_insert
+from cid.models import (
+    GOOGLE_DEFERRED_COLUMNS,
+    AwsImage,
+    AzureImage,
+    GoogleImage,
+    LastUpdate,
+)
 from cid.utils import (
     InvalidCloudProvider,
+    InvalidFields,
     extract_aws_version,
     extract_google_version,
     get_json_data,
+    google_version_key,
+    newest_versions_first,
 )
 
 logger = logging.getLogger(__name__)
 
 
+# The read functions run prebuilt Core statements with bound parameters instead of
+# ORM queries. SQLAlchemy compiles each statement once and caches it, and the rows
+# come back as lightweight mappings instead of ORM instances in the identity map.
+_AWS: Table = AwsImage.__table__
+_AZURE: Table = AzureImage.__table__
+_GOOGLE: Table = GoogleImage.__table__
+
+AWS_REGIONS = select(_AWS.c.region).distinct().order_by(_AWS.c.region)
+AWS_ARCHS = select(_AWS.c.arch).distinct()
+AWS_LATEST_IMAGE = (
+    select(_AWS.c.name, _AWS.c.version, _AWS.c.date)
+    .where(_AWS.c.name.not_ilike("%BETA%"), _AWS.c.arch == bindparam("arch"))
+    .order_by(_AWS.c.version.desc(), _AWS.c.date.desc())
+    .limit(1)
+)
+AWS_IMAGE_REGIONS = select(_AWS.c.region, _AWS.c.imageId).where(
+    _AWS.c.name == bindparam("name"), _AWS.c.arch == bindparam("arch")
+)
+AWS_IMAGE_BY_AMI = (
+    select(_AWS.c.imageId, _AWS.c.name, _AWS.c.version, _AWS.c.region)
+    .where(_AWS.c.imageId == bindparam("image_id"))
+    .limit(1)
+)
+AWS_IMAGES_BY_NAME = select(_AWS.c.imageId, _AWS.c.region).where(
+    _AWS.c.name == bindparam("name")
+)
+AWS_IMAGES_BY_VERSION = select(_AWS.c.id, _AWS.c.name).where(
+    _AWS.c.version == bindparam("version")
+)
+AWS_VERSIONS = select(_AWS.c.version).distinct()
+
+AZURE_ARCHS = select(_AZURE.c.architecture).distinct()
+AZURE_LATEST_IMAGE = (
+    select(_AZURE.c.sku, _AZURE.c.offer, _AZURE.c.version, _AZURE.c.urn)
+    .where(_AZURE.c.architecture == bindparam("arch"))
+    .order_by(_AZURE.c.version.desc())
+    .limit(1)
+)
+AZURE_VERSIONS = select(_AZURE.c.version).distinct()
+
+GOOGLE_ARCHS = select(_GOOGLE.c.arch).distinct()
+GOOGLE_LATEST_IMAGE = (
+    select(
+        _GOOGLE.c.name,
+        _GOOGLE.c.version,
+        _GOOGLE.c.creationTimestamp,
+        _GOOGLE.c.selfLink,
+    )
+    .where(_GOOGLE.c.arch.ilike(bindparam("arch")))
+    .order_by(_GOOGLE.c.version.desc(), _GOOGLE.c.creationTimestamp.desc())
+    .limit(1)
+)
+GOOGLE_VERSIONS = select(_GOOGLE.c.version).distinct()
+
+# PostgreSQL finds the latest image of every architecture in a single query with
+# DISTINCT ON, instead of one query per architecture. NULLs are sorted last, as
+# SQLite does in descending order.
+AWS_LATEST_IMAGES = (
+    select(_AWS.c.arch, _AWS.c.name, _AWS.c.version, _AWS.c.date)
+    .distinct(_AWS.c.arch)
+    .where(_AWS.c.name.not_ilike("%BETA%"), _AWS.c.arch.is_not(None))
+    .order_by(
+        _AWS.c.arch, _AWS.c.version.desc().nulls_last(), _AWS.c.date.desc().nulls_last()
+    )
+)
+AZURE_LATEST_IMAGES = (
+    select(
+        _AZURE.c.architecture.label("arch"),
+        _AZURE.c.sku,
+        _AZURE.c.offer,
+        _AZURE.c.version,
+        _AZURE.c.urn,
+    )
+    .distinct(_AZURE.c.architecture)
+    .where(_AZURE.c.architecture.is_not(None))
+    .order_by(_AZURE.c.architecture, _AZURE.c.version.desc().nulls_last())
+)
+GOOGLE_LATEST_IMAGES = (
+    select(
+        _GOOGLE.c.arch,
+        _GOOGLE.c.name,
+        _GOOGLE.c.version,
+        _GOOGLE.c.creationTimestamp,
+        _GOOGLE.c.selfLink,
+    )
+    .distinct(_GOOGLE.c.arch)
+    .where(_GOOGLE.c.arch.is_not(None))
+    .order_by(
+        _GOOGLE.c.arch,
+        _GOOGLE.c.version.desc().nulls_last(),
+        _GOOGLE.c.creationTimestamp.desc().nulls_last(),
+    )
+)
+
+# Rows fetched from the database at once when exporting a whole listing.
+EXPORT_BATCH_SIZE = 1000
+
+IMAGES_BY_ID = {
+    provider: select(table).where(table.c.id == bindparam("id"))
+    for provider, table in (("aws", _AWS), ("azure", _AZURE), ("google", _GOOGLE))
+}
+
+# The table of each provider and the column its listings are sorted by, newest first.
+LISTINGS = {
+    "aws": (_AWS, "creationDate"),
+    "azure": (_AZURE, "version"),
+    "google": (_GOOGLE, "creationTimestamp"),
+}
+
+LAST_UPDATE = select(LastUpdate.__table__.c.updated_at).limit(1)
+
+
 def aws_regions(db: Session) -> list:
     """Get all AWS regions."""
-    return db.query(AwsImage.region).distinct().order_by(AwsImage.region).all()
+    return list(db.execute(AWS_REGIONS).all())
+
+
+def is_postgresql(db: Session) -> bool:
+    """Check whether a session is bound to a PostgreSQL database."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _latest_images(
+    db: Session,
+    arch: Optional[str],
+    archs: Select,
+    latest_image: Select,
+    latest_images: Select,
+) -> list[tuple[Any, Optional[Row]]]:
+    """Find the latest image of one architecture, or of every architecture.
+
+    Returns each architecture along with its latest image, or None if it has none.
+    """
+    if arch is None and is_postgresql(db):
+        return [(row.arch, row) for row in db.execute(latest_images)]
+
+    arch_list = [arch] if arch is not None else list(db.scalars(archs))
+    return [
+        (arch, db.execute(latest_image, {"arch": arch}).first()) for arch in arch_list
+    ]
 
 
 def latest_aws_image(db: Session, arch: Optional[str]) -> dict[str, Any]:
     """Get the latest RHEL image on AWS."""
-    archs = (
-        [arch]
-        if arch is not None
-        else [arch[0] for arch in db.query(AwsImage.arch).distinct().all()]
-    )
+    # Find the image with the highest version number and the latest date.
+    latest = _latest_images(db, arch, AWS_ARCHS, AWS_LATEST_IMAGE, AWS_LATEST_IMAGES)
 
     latest_images_dict = {}
-    for arch in archs:
-        # Find the image with the highest version number and the latest date.
-        latest_image = (
-            db.query(AwsImage)
-            .filter(AwsImage.name.notlike("%BETA%"), AwsImage.arch == arch)
-            .order_by(desc(AwsImage.version), desc(AwsImage.date))
-            .first()
-        )
+    for arch, latest_image in latest:
         if latest_image is None:
             continue
 
-        # Loop through each region to find the latest image available in each.
-        images = {}
-        for region in aws_regions(db):
-            region_image = (
-                db.query(AwsImage)
-                .filter(
-                    AwsImage.region == region[0],
-                    AwsImage.name == latest_image.name,
-                    AwsImage.arch == arch,
-                )
-                .first()
-            )
-            if region_image is not None:
-                images[region[0]] = region_image.imageId
+        # Keep the first image found in each region, ordered by region.
+        amis_by_region: dict[str, str] = {}
+        for region, image_id in db.execute(
+            AWS_IMAGE_REGIONS, {"name": latest_image.name, "arch": arch}
+        ):
+            if region is not None:
+                amis_by_region.setdefault(region, image_id)
 
         latest_images_dict[arch] = {
             "name": latest_image.name,
             "version": latest_image.version,
             "date": latest_image.date,
-            "amis": images,
+            "amis": {
+                region: amis_by_region[region] for region in sorted(amis_by_region)
+            },
         }
 
     if not latest_images_dict:
@@ -77,20 +210,12 @@ def latest_aws_image(db: Session, arch: Optional[str]) -> dict[str, Any]:
 
 def latest_azure_image(db: Session, arch: Optional[str]) -> dict[str, Any]:
     """Get the latest RHEL image on Azure."""
-    archs = (
-        [arch]
-        if arch is not None
-        else [arch[0] for arch in db.query(AzureImage.architecture).distinct().all()]
+    latest = _latest_images(
+        db, arch, AZURE_ARCHS, AZURE_LATEST_IMAGE, AZURE_LATEST_IMAGES
     )
-    latest_images_dict = {}
-    for arch in archs:
-        latest_image = (
-            db.query(AzureImage)
-            .filter(AzureImage.architecture == arch)
-            .order_by(desc(AzureImage.version))
-            .first()
-        )
 
+    latest_images_dict = {}
+    for arch, latest_image in latest:
         if latest_image is None:
             continue
 
@@ -109,20 +234,12 @@ def latest_azure_image(db: Session, arch: Optional[str]) -> dict[str, Any]:
 
 def latest_google_image(db: Session, arch: Optional[str]) -> dict:
     """Get the latest RHEL image on Google Cloud."""
-    archs = (
-        [arch]
-        if arch is not None
-        else [arch[0] for arch in db.query(GoogleImage.arch).distinct().all()]
+    latest = _latest_images(
+        db, arch, GOOGLE_ARCHS, GOOGLE_LATEST_IMAGE, GOOGLE_LATEST_IMAGES
     )
-    latest_images_dict = {}
-    for arch in archs:
-        latest_image = (
-            db.query(GoogleImage)
-            .filter(GoogleImage.arch.ilike(arch))
-            .order_by(desc(GoogleImage.version), desc(GoogleImage.creationTimestamp))
-            .first()
-        )
 
+    latest_images_dict = {}
+    for arch, latest_image in latest:
         if latest_image is None:
             return {"error": "No images found for Google Cloud", "code": 404}
 
@@ -139,14 +256,28 @@ def latest_google_image(db: Session, arch: Optional[str]) -> dict:
     return latest_images_dict
 
 
+def parse_timestamp(value: str) -> datetime:
+    """Parse a timestamp of the image data, keeping its local time without the offset.
+
+    The columns have no time zone. SQLite drops the offset when it stores a
+    timestamp, while PostgreSQL would convert it to the session's time zone first,
+    so the offset is dropped here to store the same value in both.
+    """
+    # dateutil is only needed by refreshes, so the API doesn't import it at startup.
+    from dateutil import parser
+
+    parsed: datetime = parser.parse(value)
+    return parsed.replace(tzinfo=None)
+
+
 def import_aws_images(db: Session, images: list) -> None:
     """Take a list of AWS images and add them to the database."""
     import_queue = []
 
     for image in images:
         # sqlite requires dates to be in Python's datetime format.
-        creation_date = parser.parse(image.get("CreationDate"))
-        deprecation_time = parser.parse(image.get("DeprecationTime"))
+        creation_date = parse_timestamp(image.get("CreationDate"))
+        deprecation_time = parse_timestamp(image.get("DeprecationTime"))
 
         # Extract the RHEL version number from the image name.
         image_name = extract_aws_version(image.get("Name"))
@@ -170,8 +301,8 @@ def import_aws_images(db: Session, images: list) -> None:
 
     logger.info("Adding %s AWS images to the database", len(import_queue))
 
-    # This lower-level method is more efficient for inserting lots of rows at once.
-    db.execute(AwsImage.__table__.insert(), import_queue)
+    # AWS has the most rows by far, which are copied in bulk on PostgreSQL.
+    bulk_insert(db, _AWS, import_queue)
     db.commit()
 
 
@@ -180,20 +311,20 @@ def import_azure_images(db: Session, images: list) -> None:
     import_queue = []
 
     for image in images:
-        image_obj = AzureImage(
-            id=image.get("urn"),
-            architecture=image.get("architecture"),
-            offer=image.get("offer"),
-            publisher=image.get("publisher"),
-            sku=image.get("sku"),
-            urn=image.get("urn"),
-            version=image.get("version"),
-        )
-        import_queue.append(image_obj)
+        image_dict = {
+            "id": image.get("urn"),
+            "architecture": image.get("architecture"),
+            "offer": image.get("offer"),
+            "publisher": image.get("publisher"),
+            "sku": image.get("sku"),
+            "urn": image.get("urn"),
+            "version": image.get("version"),
+        }
+        import_queue.append(image_dict)
 
     logger.info("Adding %s Azure images to the database", len(import_queue))
 
-    db.add_all(import_queue)
+    bulk_insert(db, _AZURE, import_queue)
     db.commit()
 
 
@@ -203,36 +334,36 @@ def import_google_images(db: Session, images: list) -> None:
 
     for image in images:
         # sqlite requires dates to be in Python's datetime format.
-        creation_timestamp = parser.parse(image.get("creationTimestamp"))
+        creation_timestamp = parse_timestamp(image.get("creationTimestamp"))
 
         # Extract the RHEL version number from the image name.
         image_name = extract_google_version(image.get("name"))
 
-        image_obj = GoogleImage(
-            id=image.get("id"),
-            name=image.get("name"),
-            arch=image.get("architecture"),
-            version=image_name,
-            creationTimestamp=creation_timestamp,
-            description=image.get("description"),
-            diskSizeGb=image.get("diskSizeGb"),
-            family=image.get("family"),
-            guestOsFeatures=image.get("guestOsFeatures"),
-            kind=image.get("kind"),
-            labelFingerprint=image.get("labelFingerprint"),
-            licenseCodes=image.get("licenseCodes"),
-            licenses=image.get("licenses"),
-            rawDisk=image.get("rawDisk"),
-            selfLink=image.get("selfLink"),
-            sourceType=image.get("sourceType"),
-            status=image.get("status"),
-            storageLocations=image.get("storageLocations"),
-        )
-        import_queue.append(image_obj)
+        image_dict = {
+            "id": image.get("id"),
+            "name": image.get("name"),
+            "arch": image.get("architecture"),
+            "version": image_name,
+            "creationTimestamp": creation_timestamp,
+            "description": image.get("description"),
+            "diskSizeGb": image.get("diskSizeGb"),
+            "family": image.get("family"),
+            "guestOsFeatures": image.get("guestOsFeatures"),
+            "kind": image.get("kind"),
+            "labelFingerprint": image.get("labelFingerprint"),
+            "licenseCodes": image.get("licenseCodes"),
+            "licenses": image.get("licenses"),
+            "rawDisk": image.get("rawDisk"),
+            "selfLink": image.get("selfLink"),
+            "sourceType": image.get("sourceType"),
+            "status": image.get("status"),
+            "storageLocations": image.get("storageLocations"),
+        }
+        import_queue.append(image_dict)
 
     logger.info("Adding %s Google images to the database", len(import_queue))
 
-    db.add_all(import_queue)
+    bulk_insert(db, _GOOGLE, import_queue)
     db.commit()
 
 
@@ -247,10 +378,11 @@ def update_last_updated(db: Session) -> None:
 
 
 def get_last_update(db: Session) -> str:
-    last_update = db.query(LastUpdate).first()
-    if last_update is None:
+    updated_at = db.scalars(LAST_UPDATE).first()
+    if updated_at is None:
         return ""
-    return str(last_update.updated_at)
+    # SQLite only stores whole seconds.
+    return str(updated_at.replace(microsecond=0))
 
 
 def update_image_data(db: Session) -> None:
@@ -295,17 +427,13 @@ def find_matching_ami(db: Session, image_id: str) -> dict:
         dict: basic information about the image with matching AMIs
     """
     # Get the image record for the AMI we were given.
-    image = db.query(AwsImage).filter(AwsImage.imageId == image_id).first()
+    image = db.execute(AWS_IMAGE_BY_AMI, {"image_id": image_id}).first()
 
     if image is None:
         return {"error": "No images found", "code": 404}
 
     # Use the name to find matching images in other regions.
-    matching_images = (
-        db.query(AwsImage.imageId, AwsImage.region)
-        .filter(AwsImage.name == image.name)
-        .all()
-    )
+    matching_images = db.execute(AWS_IMAGES_BY_NAME, {"name": image.name}).all()
 
     return {
         "ami": image.imageId,
@@ -332,9 +460,9 @@ def find_available_aws_versions(db: Session) -> list:
         list: list of available versions
     """
     # Get all images with the given name.
-    versions = [x.version for x in db.query(AwsImage.version).distinct()]
+    versions = list(db.scalars(AWS_VERSIONS))
 
-    return sorted(versions, key=Version, reverse=True)
+    return newest_versions_first(versions)
 
 
 def find_available_azure_versions(db: Session) -> list:
@@ -345,12 +473,12 @@ def find_available_azure_versions(db: Session) -> list:
     Returns:
         list: list of available versions
     """
-    query = db.query(AzureImage.version).distinct()
-
-    versions = [".".join(x.version.split(".")[:2]) for x in query]
+    versions = [
+        ".".join(version.split(".")[:2]) for version in db.scalars(AZURE_VERSIONS)
+    ]
     versions = list(set(versions))
 
-    return sorted(versions, key=Version, reverse=True)
+    return newest_versions_first(versions)
 
 
 def find_available_google_versions(db: Session) -> list:
@@ -361,13 +489,9 @@ def find_available_google_versions(db: Session) -> list:
     Returns:
         list: list of available versions
     """
-    versions = [x.version for x in db.query(GoogleImage.version).distinct()]
-
-    def version_key(version: str) -> Version:
-        parts = [part for part in version.split(".") if part.isdigit()]
-        return Version(".".join(parts))
+    versions = list(db.scalars(GOOGLE_VERSIONS))
 
-    return sorted(versions, key=version_key, reverse=True)
+    return newest_versions_first(versions, google_version_key)
 
 
 def find_images_for_version(db: Session, version: str) -> list:
@@ -380,7 +504,7 @@ def find_images_for_version(db: Session, version: str) -> list:
     Returns:
         list: list of images for the given version
     """
-    images = db.query(AwsImage).filter(AwsImage.version == version).all()
+    images = db.execute(AWS_IMAGES_BY_VERSION, {"version": version}).all()
 
     for image in images:
         print(image.id)
@@ -388,6 +512,50 @@ def find_images_for_version(db: Session, version: str) -> list:
     return [{"ami": x.id, "name": x.name} for x in images]
 
 
+# Listing filters by column name and whether they match substrings.
+Filters = dict[tuple[str, bool], Optional[str]]
+
+
+def _aws_filters(
+    arch: Optional[str],
+    version: Optional[str],
+    name: Optional[str],
+    region: Optional[str],
+    image_id: Optional[str],
+) -> Filters:
+    return {
+        ("arch", False): arch,
+        ("version", False): version,
+        ("name", True): name,
+        ("region", False): region,
+        ("id", False): image_id,
+    }
+
+
+def _azure_filters(
+    arch: Optional[str], version: Optional[str], urn: Optional[str]
+) -> Filters:
+    return {
+        ("architecture", False): arch,
+        ("version", True): version,
+        ("urn", True): urn,
+    }
+
+
+def _google_filters(
+    arch: Optional[str],
+    version: Optional[str],
+    name: Optional[str],
+    family: Optional[str],
+) -> Filters:
+    return {
+        ("arch", False): arch,
+        ("version", False): version,
+        ("name", True): name,
+        ("family", False): family,
+    }
+
+
 def find_aws_images(
     db: Session,
     arch: Optional[str] = None,
@@ -397,6 +565,7 @@ def find_aws_images(
     image_id: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
+    fields: Optional[str] = None,
 ) -> dict:
     """Return paginated AWS images that match the given criteria.
 
@@ -409,24 +578,14 @@ def find_aws_images(
       image_id (Optional[str]): image ID to search
       page (int): page number
       page_size (int): number of images per page
+      fields (Optional[str]): comma-separated columns to return, default all
 
     Returns:
       dict: dict of images that match the given criteria
     """
-    query = db.query(AwsImage).order_by(AwsImage.creationDate.desc())
-
-    if arch:
-        query = query.filter(AwsImage.arch == arch)
-    if version:
-        query = query.filter(AwsImage.version == version)
-    if name:
-        query = query.filter(AwsImage.name.contains(name))
-    if region:
-        query = query.filter(AwsImage.region == region)
-    if image_id:
-        query = query.filter(AwsImage.id == image_id)
-
-    return paginate(query, page, page_size)
+    filters = _aws_filters(arch, version, name, region, image_id)
+    columns = listing_columns(_AWS, fields)
+    return paginate(db, _AWS, "creationDate", filters, page, page_size, columns)
 
 
 def find_azure_images(
@@ -436,6 +595,7 @@ def find_azure_images(
     urn: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
+    fields: Optional[str] = None,
 ) -> dict:
     """Return all Azure images that match the given criteria.
 
@@ -446,20 +606,14 @@ def find_azure_images(
         urn (Optional[str]): image urn to search
         page (int): page number
         page_size (int): number of images per page
+        fields (Optional[str]): comma-separated columns to return, default all
 
     Returns:
         list: list of images that match the given criteria
     """
-    query = db.query(AzureImage).order_by(desc(AzureImage.version))
-
-    if arch:
-        query = query.filter(AzureImage.architecture == arch)
-    if version:
-        query = query.filter(AzureImage.version.contains(version))
-    if urn:
-        query = query.filter(AzureImage.urn.contains(urn))
-
-    return paginate(query, page, page_size)
+    filters = _azure_filters(arch, version, urn)
+    columns = listing_columns(_AZURE, fields)
+    return paginate(db, _AZURE, "version", filters, page, page_size, columns)
 
 
 def find_google_images(
@@ -470,6 +624,7 @@ def find_google_images(
     family: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
+    fields: Optional[str] = None,
 ) -> dict:
     """Return paginated Google images that match the given criteria.
 
@@ -481,35 +636,115 @@ def find_google_images(
       family (Optional[str]): Google image family to search
       page (int): page number
       page_size (int): number of images per page
+      fields (Optional[str]): comma-separated columns to return, by default all
+        but the large JSON columns
 
     Returns:
       dict: paginated results
     """
-    query = db.query(GoogleImage).order_by(GoogleImage.creationTimestamp.desc())
+    filters = _google_filters(arch, version, name, family)
+    columns = listing_columns(_GOOGLE, fields, GOOGLE_DEFERRED_COLUMNS)
+    return paginate(db, _GOOGLE, "creationTimestamp", filters, page, page_size, columns)
+
+
+def find_image(db: Session, cloud_provider: str, image_id: str) -> Optional[RowMapping]:
+    """Return every column of a single image, including the deferred ones."""
+    if cloud_provider not in IMAGES_BY_ID:
+        raise InvalidCloudProvider(cloud_provider)
+    return db.execute(IMAGES_BY_ID[cloud_provider], {"id": image_id}).mappings().first()
+
+
+def listing_columns(
+    table: Table, fields: Optional[str], deferred: tuple[str, ...] = ()
+) -> tuple[str, ...]:
+    """Pick the columns a listing returns from a comma-separated list of fields.
+
+    Without any fields, every column except the deferred ones is returned.
+    """
+    # Keep the order the fields were asked for in, without duplicates.
+    stripped = (field.strip() for field in (fields or "").split(","))
+    names = tuple(dict.fromkeys(field for field in stripped if field))
+    if not names:
+        return tuple(
+            column.key for column in table.columns if column.key not in deferred
+        )
+
+    unknown = [name for name in names if name not in table.columns]
+    if unknown:
+        raise InvalidFields(", ".join(unknown))
+    return names
+
+
+def listing_order(table: Table, order_by: str) -> tuple[ColumnElement, ...]:
+    """Sort a listing by a column, newest first, in the same order on every database.
+
+    NULLs come last, as SQLite sorts them in descending order, and rows with the same
+    value are kept in a stable order by their id so pages never overlap.
+    """
+    return (table.c[order_by].desc().nulls_last(), table.c.id)
+
+
+# Every combination of filters and fields gets its own statements, so keep the most
+# recently used ones only.
+@lru_cache(maxsize=256)
+def _listing_statements(
+    table: Table,
+    order_by: str,
+    filters: tuple[tuple[str, bool], ...],
+    columns: tuple[str, ...],
+) -> tuple[Select, Select, Select]:
+    """Build the count, page and export statements of a listing once per set of filters.
+
+    Each filter is a column name and whether it matches substrings. The filter values,
+    the limit and the offset are bound when the statements are executed. Only the
+    given columns are selected.
+    """
+    # Substring matches ignore case on every database, as SQLite's LIKE does.
+    conditions = [
+        table.c[column].icontains(bindparam(column))
+        if contains
+        else table.c[column] == bindparam(column)
+        for column, contains in filters
+    ]
+    count = select(func.count()).select_from(table).where(*conditions)
+    export = (
+        select(*(table.c[column] for column in columns))
+        .where(*conditions)
+        .order_by(*listing_order(table, order_by))
+    )
+    page = export.limit(bindparam("limit")).offset(bindparam("offset"))
+    return count, page, export
+
 
-    if arch:
-        query = query.filter(GoogleImage.arch == arch)
-    if version:
-        query = query.filter(GoogleImage.version == version)
-    if name:
-        query = query.filter(GoogleImage.name.contains(name))
-    if family:
-        query = query.filter(GoogleImage.family == family)
+def _active_filters(filters: Filters) -> Filters:
+    """Leave out the filters without a value."""
+    return {key: value for key, value in filters.items() if value}
 
-    return paginate(query, page, page_size)
+
+def _filter_params(filters: Filters) -> dict[str, Any]:
+    """Return the values to bind to the parameters of the filters."""
+    return {column: value for (column, _), value in filters.items()}
 
 
 def paginate(
-    query: Query,
+    db: Session,
+    table: Table,
+    order_by: str,
+    filters: Filters,
     page: int = 1,
     page_size: int = 100,
+    columns: Optional[tuple[str, ...]] = None,
 ) -> dict:
-    """Paginate a query and return the results.
+    """Filter a table, sorted by a column in descending order, and paginate it.
 
     Args:
-      query: SQLAlchemy query object
+      db (Session): database session
+      table (Table): table to read from
+      order_by (str): column to sort by, newest first
+      filters (dict): filter values by column name and whether to match substrings
       page (int): page number
-      page_size (int): number of items per page
+      page_size (int): number of items per page, at most MAX_PAGE_SIZE
+      columns (Optional[tuple]): columns to return, default all
 
     Returns:
       dict: paginated results
@@ -517,13 +752,23 @@ def paginate(
     if page < 1:
         page = 1
 
-    if page_size < 1:
-        page_size = 1
+    # A single page must never load a whole table into memory.
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+
+    active = _active_filters(filters)
+    if columns is None:
+        columns = tuple(table.columns.keys())
+    count, query, _ = _listing_statements(table, order_by, tuple(active), columns)
+    params = _filter_params(active)
 
-    total_count = query.count()
+    total_count = db.scalar(count, params) or 0
     total_pages = (total_count + page_size - 1) // page_size
 
-    results = query.limit(page_size).offset((page - 1) * page_size).all()
+    results: list[RowMapping] = list(
+        db.execute(
+            query, {**params, "limit": page_size, "offset": (page - 1) * page_size}
+        ).mappings()
+    )
 
     return {
         "results": results,
@@ -532,3 +777,86 @@ def paginate(
         "total_count": total_count,
         "total_pages": total_pages,
     }
+
+
+def stream(
+    db: Session,
+    table: Table,
+    order_by: str,
+    filters: Filters,
+    columns: tuple[str, ...],
+) -> Iterator[RowMapping]:
+    """Yield every row of a filtered listing, reading it from the database in batches.
+
+    Only one batch of rows is held in memory at a time, however many rows match.
+    """
+    active = _active_filters(filters)
+    _, _, export = _listing_statements(table, order_by, tuple(active), columns)
+    result = db.execute(
+        export,
+        _filter_params(active),
+        execution_options={"yield_per": EXPORT_BATCH_SIZE},
+    )
+    for partition in result.mappings().partitions():
+        yield from partition
+
+
+def export_aws_images(
+    db: Session,
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    name: Optional[str] = None,
+    region: Optional[str] = None,
+    image_id: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> tuple[tuple[str, ...], Iterator[RowMapping]]:
+    """Return the columns and a stream of every AWS image that matches the criteria.
+
+    Takes the same filters as `find_aws_images`, without pagination.
+    """
+    columns = listing_columns(_AWS, fields)
+    filters = _aws_filters(arch, version, name, region, image_id)
+    return columns, stream(db, _AWS, "creationDate", filters, columns)
+
+
+def export_azure_images(
+    db: Session,
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    urn: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> tuple[tuple[str, ...], Iterator[RowMapping]]:
+    """Return the columns and a stream of every Azure image that matches the criteria.
+
+    Takes the same filters as `find_azure_images`, without pagination.
+    """
+    columns = listing_columns(_AZURE, fields)
+    filters = _azure_filters(arch, version, urn)
+    return columns, stream(db, _AZURE, "version", filters, columns)
+
+
+def export_google_images(
+    db: Session,
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    name: Optional[str] = None,
+    family: Optional[str] = None,
+    fields: Optional[str] = None,
+) -> tuple[tuple[str, ...], Iterator[RowMapping]]:
+    """Return the columns and a stream of every Google image that matches the criteria.
+
+    Takes the same filters as `find_google_images`, without pagination.
+    """
+    columns = listing_columns(_GOOGLE, fields, GOOGLE_DEFERRED_COLUMNS)
+    filters = _google_filters(arch, version, name, family)
+    return columns, stream(db, _GOOGLE, "creationTimestamp", filters, columns)
+
+
+def export_all_images(
+    db: Session, cloud_provider: str
+) -> tuple[Table, Iterator[RowMapping]]:
+    """Return the table of a provider and a stream of all its images, every column."""
+    if cloud_provider not in LISTINGS:
+        raise InvalidCloudProvider(cloud_provider)
+    table, order_by = LISTINGS[cloud_provider]
+    return table, stream(db, table, order_by, {}, tuple(table.columns.keys()))
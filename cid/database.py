@@ -1,12 +1,174 @@
 """Basic database setup for SQLAlchemy ORM."""
 # Via FastAPI tutorial: https://fastapi.tiangolo.com/tutorial/sql-databases/
 
-from sqlalchemy import create_engine
+import importlib.util
+from typing import Any, Optional
+
+from sqlalchemy import Engine, create_engine, event
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from cid.config import DATABASE_URL
+from cid.config import (
+    ASYNC_DATABASE_ENABLED,
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_PRE_PING,
+    DATABASE_POOL_RECYCLE,
+    DATABASE_POOL_SIZE,
+    DATABASE_POOL_TIMEOUT,
+    DATABASE_URL,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_TEMP_STORE,
+)
+
+try:
+    # SQLAlchemy runs the sync internals of its asyncio engines in greenlets.
+    import greenlet  # noqa: F401
+    from sqlalchemy.ext.asyncio import (
+        AsyncEngine,
+        async_sessionmaker,
+        create_async_engine,
+    )
+
+    HAS_ASYNCIO = True
+except ImportError:  # pragma: no cover
+    HAS_ASYNCIO = False
+
+# asyncio drivers by dialect, along with the module that provides them.
+ASYNC_DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+}
+
+
+def sqlite_pragmas(read_only: bool = False) -> dict[str, Any]:
+    """Return the pragmas every new SQLite connection starts with."""
+    pragmas: dict[str, Any] = {
+        "busy_timeout": SQLITE_BUSY_TIMEOUT,
+        "synchronous": SQLITE_SYNCHRONOUS,
+        "cache_size": SQLITE_CACHE_SIZE,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "temp_store": SQLITE_TEMP_STORE,
+    }
+    if read_only:
+        # Readers never write, so they are kept from doing it by accident.
+        pragmas["query_only"] = "ON"
+    else:
+        # The journal mode is stored in the database file and only needs to be set
+        # by the writer. In WAL mode readers no longer wait for a refresh to commit.
+        pragmas["journal_mode"] = SQLITE_JOURNAL_MODE
+    return pragmas
+
+
+def pool_options(url: str, read_only: bool = False) -> dict[str, Any]:
+    """Return the pool and connection options of an engine on a database server."""
+    options: dict[str, Any] = {
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+    }
+    if read_only and url.startswith("postgresql+asyncpg"):
+        settings = {"default_transaction_read_only": "on"}
+        options["connect_args"] = {"server_settings": settings}
+    elif read_only and url.startswith("postgresql"):
+        options["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+    return options
+
+
+def _set_pragmas_on_connect(engine: Engine, read_only: bool) -> None:
+    """Run the SQLite pragmas on every new connection of an engine."""
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+def build_engine(url: str, read_only: bool = False) -> Engine:
+    """Create an engine, tuning its pool or the connections of SQLite databases."""
+    if not url.startswith("sqlite"):
+        return create_engine(url, **pool_options(url, read_only))
+
+    engine = create_engine(url)
+    _set_pragmas_on_connect(engine, read_only)
+    return engine
+
+
+def async_url(url: str) -> Optional[str]:
+    """Return the URL of a database with its asyncio driver, if that is installed."""
+    scheme, separator, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if not HAS_ASYNCIO or not separator or dialect not in ASYNC_DRIVERS:
+        return None
+
+    driver, module = ASYNC_DRIVERS[dialect]
+    if importlib.util.find_spec(module) is None:
+        return None
+    return f"{driver}://{rest}"
+
+
+def build_async_engine(url: str, read_only: bool = False) -> "AsyncEngine":
+    """Create an asyncio engine, tuned like the engine of `build_engine`."""
+    if not url.startswith("sqlite"):
+        return create_async_engine(url, **pool_options(url, read_only))
+
+    engine = create_async_engine(url)
+    _set_pragmas_on_connect(engine.sync_engine, read_only)
+    return engine
+
+
+def is_memory_database(url: str) -> bool:
+    """Check whether a database only lives as long as its connection."""
+    return url.startswith("sqlite") and url.endswith((":memory:", "sqlite://"))
+
+
+# The refresh writes through `engine`. Requests read through `read_engine`, which has
+# its own pool of read-only connections. An in-memory database is private to its
+# connection, so both share a single engine then.
+engine = build_engine(DATABASE_URL)
+if is_memory_database(DATABASE_URL):
+    read_engine = engine
+else:
+    read_engine = build_engine(DATABASE_URL, read_only=True)
 
-engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# With aiosqlite or asyncpg installed, requests read through an asyncio engine and
+# wait for the database without holding a worker thread. An in-memory database can't
+# be shared with another engine, so it is always read through `read_engine`.
+ASYNC_DATABASE_URL = None
+if ASYNC_DATABASE_ENABLED and not is_memory_database(DATABASE_URL):
+    ASYNC_DATABASE_URL = async_url(DATABASE_URL)
+
+async_read_engine = None
+AsyncReadSessionLocal = None
+if ASYNC_DATABASE_URL is not None:
+    async_read_engine = build_async_engine(ASYNC_DATABASE_URL, read_only=True)
+    AsyncReadSessionLocal = async_sessionmaker(
+        async_read_engine, autoflush=False, expire_on_commit=False
+    )
 
 Base = declarative_base()
+
+
+def dispose_after_fork() -> None:
+    """Give a forked process pools of its own, without closing the parent's connections.
+
+    Connections opened before the fork belong to the parent, and would be shared with
+    the child otherwise. An in-memory database only exists in its connection, so its
+    engine is kept.
+    """
+    if is_memory_database(DATABASE_URL):
+        return
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+    if async_read_engine is not None:
+        async_read_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,68 @@
+"""Encode streams of image rows as NDJSON or CSV chunks for the export endpoints.
+
+Rows are encoded a batch at a time, so an export holds a single batch in memory
+however large the listing is.
+"""
+
+import csv
+import io
+import json
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from datetime import date
+from itertools import islice
+from typing import Any
+
+from cid.serialization import dumps
+
+# A row of an image: a RowMapping from the database, whose keys may also be columns, or
+# a dict from the snapshot.
+ImageRow = Mapping[Any, Any]
+
+# Rows encoded into each chunk of the response body.
+CHUNK_ROWS = 500
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def batches(rows: Iterable[ImageRow]) -> Iterator[list[ImageRow]]:
+    """Split rows into lists of at most `CHUNK_ROWS` rows."""
+    iterator = iter(rows)
+    while batch := list(islice(iterator, CHUNK_ROWS)):
+        yield batch
+
+
+def ndjson_chunks(rows: Iterable[ImageRow]) -> Iterator[bytes]:
+    """Encode rows as newline-delimited JSON, one object per line."""
+    for batch in batches(rows):
+        yield b"".join(dumps(row) + b"\n" for row in batch)
+
+
+def _csv_value(value: Any) -> Any:
+    """Flatten a value into a single CSV cell."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"))
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(columns: Sequence[str], rows: Iterable[ImageRow]) -> Iterator[bytes]:
+    """Encode rows as CSV with a header line. JSON columns are stored as JSON text."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(columns)
+    for batch in batches(rows):
+        writer.writerows(
+            [_csv_value(row[column]) for column in columns] for row in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Send the header even when no rows matched.
+    if buffer.tell():
+        yield buffer.getvalue().encode()
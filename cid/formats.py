@@ -0,0 +1,173 @@
+"""Alternative representations of the paginated listings, chosen from `Accept`.
+
+Row-oriented JSON repeats every column name on every row. For large pages the
+listings can also be sent column by column, with each name appearing once:
+
+* `application/vnd.cid.columns+json`: JSON with one array of values per column,
+* `application/msgpack`: the same columnar document as MessagePack, when `msgpack`
+  is installed,
+* `application/vnd.apache.arrow.stream`: an Arrow IPC stream with one record batch,
+  when `pyarrow` is installed. The pagination is stored in the schema metadata.
+
+Every other listing and endpoint is sent as JSON.
+"""
+
+import importlib.util
+import io
+import json
+import re
+from collections.abc import Mapping, Sequence
+from datetime import date
+from typing import Any, Optional
+
+from sqlalchemy import JSON, DateTime, Integer, Table
+
+from cid.serialization import dumps
+
+# msgpack and pyarrow are only imported once a listing is rendered with them, since
+# neither is needed to start serving requests.
+HAS_MSGPACK = importlib.util.find_spec("msgpack") is not None
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.cid.columns+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# Media types the listings can be sent as, in order of preference.
+MEDIA_TYPES = [
+    JSON_MEDIA_TYPE,
+    COLUMNAR_JSON_MEDIA_TYPE,
+    *([MSGPACK_MEDIA_TYPE] if HAS_MSGPACK else []),
+    *([ARROW_MEDIA_TYPE] if HAS_PYARROW else []),
+]
+
+# The paginated listings, which are the only endpoints with other representations.
+LISTING_PATH = re.compile(r"^/(aws|azure|google)$")
+
+# Keys of a listing besides its results.
+PAGINATION_KEYS = ("page", "page_size", "total_count", "total_pages")
+
+
+def _accepted(accept: str) -> list[tuple[str, float]]:
+    """Parse the media ranges of an Accept header along with their quality values."""
+    ranges = []
+    for item in accept.split(","):
+        media_range, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range:
+            ranges.append((media_range.lower(), quality))
+    return ranges
+
+
+def negotiate_format(path: str, accept: Optional[str]) -> Optional[str]:
+    """Pick the representation of a response from the Accept header of its request.
+
+    Returns None when the response is sent as JSON, which is the case for every path
+    but the listings and for clients that ask for nothing better.
+    """
+    if not accept or not LISTING_PATH.match(path):
+        return None
+
+    best, best_rank = JSON_MEDIA_TYPE, (0.0, 0)
+    for media_range, quality in _accepted(accept):
+        if quality <= 0:
+            continue
+        # Exact media types win over wildcards of the same quality, which leave the
+        # choice to the server.
+        if media_range in MEDIA_TYPES:
+            rank, candidate = (quality, 1), media_range
+        elif media_range in ("*/*", "application/*"):
+            rank, candidate = (quality, 0), JSON_MEDIA_TYPE
+        else:
+            continue
+        if rank > best_rank:
+            best, best_rank = candidate, rank
+
+    return None if best == JSON_MEDIA_TYPE else best
+
+
+def _columnar(listing: Mapping[str, Any], columns: Sequence[str]) -> dict[str, Any]:
+    """Turn the rows of a listing into one list of values per column."""
+    rows = listing["results"]
+    return {
+        "results": {column: [row[column] for row in rows] for column in columns},
+        **{key: listing[key] for key in PAGINATION_KEYS},
+    }
+
+
+def _msgpack_default(value: Any) -> Any:
+    """Send datetimes as the same ISO 8601 strings as the JSON listings."""
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(type(value).__name__)
+
+
+def arrow_type(column: Any) -> Any:
+    """Map a column to the Arrow type it is stored as. JSON is stored as text."""
+    import pyarrow as pa
+
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    return pa.string()
+
+
+def arrow_values(column: Any, values: list[Any]) -> list[Any]:
+    """Convert the values of a column to the Arrow type it is stored as."""
+    if isinstance(column.type, JSON):
+        return [None if value is None else json.dumps(value) for value in values]
+    return values
+
+
+def _arrow_stream(
+    listing: Mapping[str, Any], table: Table, columns: Sequence[str]
+) -> bytes:
+    """Encode a listing as an Arrow IPC stream holding a single record batch."""
+    import pyarrow as pa
+
+    document = _columnar(listing, columns)
+    schema = pa.schema(
+        [(column, arrow_type(table.c[column])) for column in columns],
+        metadata={key: str(listing[key]) for key in PAGINATION_KEYS},
+    )
+    batch = pa.RecordBatch.from_pydict(
+        {
+            column: arrow_values(table.c[column], values)
+            for column, values in document["results"].items()
+        },
+        schema=schema,
+    )
+
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue()
+
+
+def render_listing(
+    listing: Mapping[str, Any], table: Table, columns: Sequence[str], media_type: str
+) -> bytes:
+    """Render a listing with the given columns in one of the columnar media types."""
+    if media_type == ARROW_MEDIA_TYPE:
+        return _arrow_stream(listing, table, columns)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        import msgpack
+
+        return bytes(
+            msgpack.packb(_columnar(listing, columns), default=_msgpack_default)
+        )
+    return dumps(_columnar(listing, columns))
+
+
+def vary_header(path: str) -> str:
+    """Return the request headers the representation of a response depends on."""
+    return "Accept, Accept-Encoding" if LISTING_PATH.match(path) else "Accept-Encoding"
@@ -0,0 +1,404 @@
+"""Build each generation of the image data once and distribute it to every node.
+
+Without a shared database, every node would download and parse the image data of
+every provider to build its own database and catalog. Instead, one node or a job
+publishes each finished generation to a shared store, and every other node only
+pulls the generations it doesn't have yet:
+
+    GENERATION_STORE/
+        latest.json                   manifest of the newest generation
+        20261019T120000000000Z/
+            manifest.json             name, sizes and SHA-256 of every file
+            database.gz               the SQLite database, if there is one
+            catalog.gz                the catalog file, if there is one
+
+The store is a local directory, an `s3://bucket/prefix` when boto3 is installed, or an
+`http(s)://` URL to pull from, such as a public bucket or a CDN in front of one.
+
+A generation is uploaded before `latest.json` points at it, so nodes never see a
+partial one. Pulled files are checked against their SHA-256 before they are activated:
+the database is copied into the live one with SQLite's backup API, which readers see
+as a single commit, and the catalog is renamed into place. Old generations are left
+for the store's lifecycle rules to expire.
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections.abc import Iterator
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from typing import Any, Optional, Protocol, Union
+from urllib.parse import urlparse
+
+from sqlalchemy import Connection, Engine
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.config import CATALOG_PATH, SNAPSHOT_ENABLED
+
+# boto3 takes long to import, so it is only imported once an S3 store is opened.
+HAS_BOTO3 = importlib.util.find_spec("boto3") is not None
+
+logger = logging.getLogger(__name__)
+
+LATEST = "latest.json"
+MANIFEST = "manifest.json"
+
+# Local files remember the generation they were activated from in a file next to them.
+ACTIVE_SUFFIX = ".generation"
+
+
+class InvalidGeneration(Exception):
+    """When a pulled file doesn't match the checksum of its manifest."""
+
+    pass
+
+
+class ReadOnlyStore(Exception):
+    """When publishing to a store that can only be pulled from."""
+
+    pass
+
+
+class Store(Protocol):
+    """Shared location holding the published generations."""
+
+    def read(self, name: str) -> Optional[bytes]:
+        """Return the content of an object, or None if there is no such object."""
+
+    def download(self, name: str, path: str) -> None:
+        """Write an object to a local file."""
+
+    def write(self, name: str, data: bytes) -> None:
+        """Create or replace an object."""
+
+    def upload(self, path: str, name: str) -> None:
+        """Create or replace an object with the content of a local file."""
+
+
+class LocalStore:
+    """Store in a local directory, such as a mounted volume shared by the nodes."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def read(self, name: str) -> Optional[bytes]:
+        try:
+            with open(self._path(name), "rb") as fileh:
+                return fileh.read()
+        except FileNotFoundError:
+            return None
+
+    def download(self, name: str, path: str) -> None:
+        shutil.copyfile(self._path(name), path)
+
+    def _replace(self, name: str, copy: Any) -> None:
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        copy(tmp_path)
+        os.replace(tmp_path, path)
+
+    def write(self, name: str, data: bytes) -> None:
+        def copy(tmp_path: str) -> None:
+            with open(tmp_path, "wb") as fileh:
+                fileh.write(data)
+
+        self._replace(name, copy)
+
+    def upload(self, path: str, name: str) -> None:
+        self._replace(name, lambda tmp_path: shutil.copyfile(path, tmp_path))
+
+
+class HttpStore:
+    """Store behind a base URL, which can only be pulled from.
+
+    httpx is imported once the store is used, like for downloading the image data.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+
+    def read(self, name: str) -> Optional[bytes]:
+        import httpx
+
+        response = httpx.get(f"{self.base_url}/{name}")
+        if response.status_code == httpx.codes.NOT_FOUND:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def download(self, name: str, path: str) -> None:
+        import httpx
+
+        with (
+            httpx.stream("GET", f"{self.base_url}/{name}") as response,
+            open(path, "wb") as fileh,
+        ):
+            response.raise_for_status()
+            for chunk in response.iter_bytes():
+                fileh.write(chunk)
+
+    def write(self, name: str, data: bytes) -> None:
+        raise ReadOnlyStore(self.base_url)
+
+    def upload(self, path: str, name: str) -> None:
+        raise ReadOnlyStore(self.base_url)
+
+
+class S3Store:
+    """Store in an S3 bucket, or any object store with an S3 API."""
+
+    def __init__(self, bucket: str, prefix: str = "", client: Any = None) -> None:
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3")
+        self.client = client
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def read(self, name: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._key(name))
+        except self.client.exceptions.NoSuchKey:
+            return None
+        body: bytes = response["Body"].read()
+        return body
+
+    def download(self, name: str, path: str) -> None:
+        self.client.download_file(self.bucket, self._key(name), path)
+
+    def write(self, name: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def upload(self, path: str, name: str) -> None:
+        self.client.upload_file(path, self.bucket, self._key(name))
+
+
+def open_store(url: str) -> Store:
+    """Open the store at a local path, an s3:// URL or an http(s):// URL.
+
+    Raises:
+        ValueError: for an s3:// URL when boto3 isn't installed
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        if not HAS_BOTO3:
+            raise ValueError(url)
+        return S3Store(parsed.netloc, parsed.path)
+    if parsed.scheme in ("http", "https"):
+        return HttpStore(url)
+    if parsed.scheme == "file":
+        return LocalStore(parsed.path)
+    return LocalStore(url)
+
+
+def sqlite_path(bind: Union[Engine, Connection]) -> Optional[str]:
+    """Return the path of a SQLite database file, which can be distributed."""
+    if bind.dialect.name != "sqlite":
+        return None
+    database = bind.engine.url.database
+    if not database or database == ":memory:":
+        return None
+    return database
+
+
+def local_files(bind: Union[Engine, Connection]) -> dict[str, str]:
+    """Return the paths of the files that make up a generation on this node."""
+    files = {}
+    database = sqlite_path(bind)
+    if database:
+        files["database"] = database
+    if SNAPSHOT_ENABLED and CATALOG_PATH:
+        files["catalog"] = CATALOG_PATH
+    return files
+
+
+def active_version(path: str) -> Optional[str]:
+    """Return the generation a local file was activated from, if any."""
+    try:
+        with open(f"{path}{ACTIVE_SUFFIX}") as fileh:
+            return fileh.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _mark_active(path: str, version: str) -> None:
+    tmp_path = f"{path}{ACTIVE_SUFFIX}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fileh:
+        fileh.write(version)
+    os.replace(tmp_path, f"{path}{ACTIVE_SUFFIX}")
+
+
+def _compress(source: str, path: str) -> tuple[int, str]:
+    """Compress a file, and return its size and SHA-256 before compression."""
+    digest = hashlib.sha256()
+    size = 0
+    with (
+        open(source, "rb") as fileh,
+        open(path, "wb") as raw,
+        gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed,
+    ):
+        for block in iter(lambda: fileh.read(2**20), b""):
+            digest.update(block)
+            size += len(block)
+            compressed.write(block)
+    return size, digest.hexdigest()
+
+
+def _decompress(path: str, target: str, entry: dict[str, Any]) -> None:
+    """Decompress a pulled file and check it against its manifest entry."""
+    digest = hashlib.sha256()
+    with gzip.open(path, "rb") as compressed, open(target, "wb") as fileh:
+        for block in iter(lambda: compressed.read(2**20), b""):
+            digest.update(block)
+            fileh.write(block)
+    if digest.hexdigest() != entry["sha256"]:
+        raise InvalidGeneration(entry["file"])
+
+
+def _copy_database(source: str, target: str) -> None:
+    """Copy a SQLite database through the backup API, in a single transaction."""
+    with (
+        closing(sqlite3.connect(source)) as src,
+        closing(sqlite3.connect(target)) as dst,
+    ):
+        src.backup(dst)
+
+
+@contextmanager
+def _workdir(near: str) -> Iterator[str]:
+    """Create a temporary directory on the file system of a target file."""
+    directory = os.path.dirname(os.path.abspath(near))
+    with tempfile.TemporaryDirectory(dir=directory, prefix=".generation-") as workdir:
+        yield workdir
+
+
+def read_latest(store: Store) -> Optional[dict[str, Any]]:
+    """Return the manifest of the newest generation in the store, if there is one."""
+    content = store.read(LATEST)
+    if content is None:
+        return None
+    manifest: dict[str, Any] = json.loads(content)
+    return manifest
+
+
+def pending_version(store: Store, bind: Union[Engine, Connection]) -> Optional[str]:
+    """Return the newest generation in the store if this node doesn't have it yet.
+
+    Only `latest.json` is read, so this is cheap enough to check every minute.
+    """
+    manifest = read_latest(store)
+    if manifest is None:
+        return None
+    version: str = manifest["version"]
+    files = local_files(bind)
+    for entry in manifest["files"]:
+        path = files.get(entry["name"])
+        if path is not None and active_version(path) != version:
+            return version
+    return None
+
+
+def publish_generation(store: Store, db: Session) -> Optional[dict[str, Any]]:
+    """Publish the database and catalog of this node as a new generation.
+
+    Returns:
+        dict: manifest of the new generation, or None if there is nothing to publish
+    """
+    files = local_files(db.get_bind())
+    files = {name: path for name, path in files.items() if os.path.exists(path)}
+    if not files:
+        return None
+
+    built_at = datetime.now(timezone.utc)
+    version = built_at.strftime("%Y%m%dT%H%M%S%fZ")
+    entries = []
+    with _workdir(next(iter(files.values()))) as workdir:
+        for name, path in files.items():
+            source = path
+            if name == "database":
+                # Take a consistent copy while requests keep reading the database.
+                source = os.path.join(workdir, name)
+                _copy_database(path, source)
+                with closing(sqlite3.connect(source)) as connection:
+                    connection.execute("PRAGMA journal_mode=DELETE")
+
+            compressed = os.path.join(workdir, f"{name}.gz")
+            size, sha256 = _compress(source, compressed)
+            entries.append({
+                "name": name,
+                "file": f"{version}/{name}.gz",
+                "size": size,
+                "compressed_size": os.path.getsize(compressed),
+                "sha256": sha256,
+            })
+            store.upload(compressed, f"{version}/{name}.gz")
+
+    manifest = {
+        "version": version,
+        "built_at": built_at.isoformat(),
+        "last_update": crud.get_last_update(db),
+        "files": entries,
+    }
+    content = json.dumps(manifest, indent=2).encode()
+    store.write(f"{version}/{MANIFEST}", content)
+    store.write(LATEST, content)
+
+    for path in files.values():
+        _mark_active(path, version)
+    logger.info("🚚 Published generation %s", version)
+    return manifest
+
+
+def pull_generation(
+    store: Store, bind: Union[Engine, Connection]
+) -> Optional[list[str]]:
+    """Activate the files of the newest generation that this node doesn't have yet.
+
+    Returns:
+        list: names of the files activated, empty when the node is up to date, or None
+            when the store holds no generation yet
+    """
+    manifest = read_latest(store)
+    if manifest is None:
+        return None
+
+    version = manifest["version"]
+    files = local_files(bind)
+    activated = []
+    for entry in manifest["files"]:
+        path = files.get(entry["name"])
+        if path is None or active_version(path) == version:
+            continue
+
+        with _workdir(path) as workdir:
+            compressed = os.path.join(workdir, f"{entry['name']}.gz")
+            target = os.path.join(workdir, entry["name"])
+            store.download(entry["file"], compressed)
+            _decompress(compressed, target, entry)
+
+            if entry["name"] == "database":
+                _copy_database(target, path)
+            else:
+                os.replace(target, path)
+        _mark_active(path, version)
+        activated.append(entry["name"])
+
+    if activated:
+        logger.info("🚚 Activated %s of generation %s", ", ".join(activated), version)
+    return activated
@@ -0,0 +1,127 @@
+"""Bulk loading of imported images into their tables.
+
+Inserting hundreds of thousands of rows with `executemany` sends every row as its own
+set of parameters. On PostgreSQL the rows are streamed through `COPY FROM STDIN`
+into a temporary staging table instead, which is never written to the WAL, and then
+moved into the live table with a single `INSERT ... SELECT`. Every other database,
+and PostgreSQL drivers without `copy_expert`, use `executemany`.
+"""
+
+import io
+import json
+import logging
+from collections.abc import Iterable, Iterator, Mapping
+from typing import Any, Optional, cast
+
+from sqlalchemy import JSON, CursorResult, Table, insert, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Characters that have a meaning in the text format of COPY, backslash first.
+_COPY_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+# How COPY reads a NULL.
+COPY_NULL = "\\N"
+
+
+def copy_value(value: Any, is_json: bool = False) -> str:
+    """Write a value as a field of the text format of COPY.
+
+    None is stored as JSON null in JSON columns, as SQLAlchemy does, and as NULL
+    everywhere else.
+    """
+    if is_json:
+        value = json.dumps(value)
+    elif value is None:
+        return COPY_NULL
+    field = str(value)
+    # Chained replacements are much faster than str.translate for mostly clean text.
+    for character, escaped in _COPY_ESCAPES:
+        field = field.replace(character, escaped)
+    return field
+
+
+def copy_lines(table: Table, rows: Iterable[Mapping[str, Any]]) -> Iterator[str]:
+    """Write every row as a line of the text format of COPY, in column order."""
+    columns = [(column.key, isinstance(column.type, JSON)) for column in table.columns]
+    for row in rows:
+        fields = (copy_value(row.get(key), is_json) for key, is_json in columns)
+        yield "\t".join(fields) + "\n"
+
+
+class _LineReader(io.TextIOBase):
+    """A file that reads lines from an iterator, so COPY never needs all of them."""
+
+    def __init__(self, lines: Iterator[str]) -> None:
+        self._lines = lines
+        self._buffer = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            data, self._buffer = self._buffer + "".join(self._lines), ""
+            return data
+        while len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buffer += line
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def can_copy(db: Session) -> bool:
+    """Check whether a session can load rows with COPY."""
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def copy_rows(db: Session, table: Table, rows: Iterable[Mapping[str, Any]]) -> int:
+    """Load rows into a table through COPY and a staging table, in one transaction.
+
+    The staging table only lives as long as the load. It is dropped along with the
+    rest of the transaction if the load fails.
+
+    Returns:
+        int: number of rows added to the table
+    """
+    quote = db.get_bind().dialect.identifier_preparer.quote
+    live = quote(table.name)
+    staging = quote(f"{table.name}_staging")
+    columns = ", ".join(quote(column.name) for column in table.columns)
+
+    db.execute(
+        text(f"CREATE TEMPORARY TABLE {staging} (LIKE {live} INCLUDING DEFAULTS)")
+    )
+    # The COPY runs on the connection of the session, inside its transaction.
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {staging} ({columns}) FROM STDIN",
+            _LineReader(copy_lines(table, rows)),
+        )
+    finally:
+        cursor.close()
+
+    # The statement only holds the quoted names of the model's table and columns.
+    merge = f"INSERT INTO {live} ({columns}) SELECT {columns} FROM {staging}"  # noqa: S608
+    result = cast(CursorResult, db.execute(text(merge)))
+    db.execute(text(f"DROP TABLE {staging}"))
+    return result.rowcount
+
+
+def bulk_insert(db: Session, table: Table, rows: list[dict[str, Any]]) -> None:
+    """Add rows to a table with the fastest method the database supports.
+
+    The rows are not committed.
+    """
+    if not rows:
+        return
+    if can_copy(db):
+        count = copy_rows(db, table, rows)
+        logger.debug("Copied %s rows into %s", count, table.name)
+    else:
+        db.execute(insert(table), rows)
@@ -0,0 +1,114 @@
+"""Elect the single process that refreshes the image data.
+
+Every worker process of every node runs the refresh schedule, but only one of them
+should download the image data and write it. The others keep serving requests and
+pick up the new data once the leader is done.
+
+* On PostgreSQL the leader holds a session-level advisory lock, which works across
+  every node sharing the database.
+* On a SQLite file the leader holds an exclusive lock on a file next to the database,
+  which works across the worker processes of the host.
+
+The lock only keeps refreshes from running at the same time. A process that gets the
+lock after another one refreshed skips its own refresh while the data is still fresh.
+"""
+
+import fcntl
+import os
+import zlib
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import Engine, func, make_url, select, text
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.config import REFRESH_INTERVAL, REFRESH_LOCK_PATH
+
+# Key of the PostgreSQL advisory lock, shared by every node.
+ADVISORY_LOCK_KEY = zlib.crc32(b"cid.refresh")
+
+
+def lock_path(url: str) -> Optional[str]:
+    """Return the path of the lock file, next to a SQLite database by default."""
+    if REFRESH_LOCK_PATH:
+        return REFRESH_LOCK_PATH
+
+    database_url = make_url(url)
+    if database_url.get_backend_name() != "sqlite":
+        return None
+    database = database_url.database
+    if not database or database == ":memory:":
+        return None
+    return f"{database}.refresh.lock"
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[bool]:
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def _advisory_lock(engine: Engine) -> Iterator[bool]:
+    # The lock belongs to the connection, which is held until the refresh is done.
+    # Autocommit keeps it from sitting idle in a transaction meanwhile.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        params = {"key": ADVISORY_LOCK_KEY}
+        acquired = bool(conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), params))
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), params)
+
+
+@contextmanager
+def refresh_lock(engine: Engine) -> Iterator[bool]:
+    """Hold the refresh lock if no other process does, and tell whether it did.
+
+    Databases that can't be shared, like an in-memory one, have no other process to
+    compete with, so the lock is always acquired.
+    """
+    if engine.dialect.name == "postgresql":
+        with _advisory_lock(engine) as acquired:
+            yield acquired
+        return
+
+    path = lock_path(engine.url.render_as_string(hide_password=False))
+    if path is None:
+        yield True
+        return
+    with _file_lock(path) as acquired:
+        yield acquired
+
+
+def is_fresh(db: Session) -> bool:
+    """Check whether another process refreshed the data less than half an interval ago.
+
+    The time of the last update is compared with the clock of the database, which
+    stored it.
+    """
+    updated_at: Optional[datetime] = db.scalars(crud.LAST_UPDATE).first()
+    if updated_at is None:
+        return False
+    now: Optional[datetime] = db.scalar(select(func.now()))
+    if now is None:
+        return False
+    # PostgreSQL returns the time in the session's time zone, which is the one the
+    # last update was stored in.
+    age = now.replace(tzinfo=None) - updated_at
+    return age < timedelta(seconds=REFRESH_INTERVAL / 2)
@@ -1,16 +1,85 @@
+import base64
 import logging
 import threading
-from time import sleep
-from typing import Any, Generator, Optional
+from collections.abc import Hashable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+    cast,
+)
 
-from fastapi import Depends, FastAPI, HTTPException, Request
-from fastapi.encoders import jsonable_encoder
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from schedule import every, repeat, run_pending
+from sqlalchemy import Table, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from cid import crud
-from cid.config import ENVIRONMENT
-from cid.database import SessionLocal
+from cid import async_crud, crud
+from cid.admission import AdmissionMiddleware
+from cid.artifacts import MEDIA_TYPES as ARTIFACT_MEDIA_TYPES
+from cid.artifacts import find_artifact, read_manifest
+from cid.async_crud import AnySession
+from cid.cache import (
+    CACHEABLE_PATH,
+    CacheKey,
+    bump_generation,
+    caching_headers,
+    data_version,
+    etag,
+    is_not_modified,
+    matches_etag,
+    response_cache,
+    set_data_version,
+)
+from cid.coalesce import SingleFlight
+from cid.compression import compress, negotiate
+from cid.config import (
+    ARTIFACTS_DIR,
+    CATALOG_PATH,
+    ENVIRONMENT,
+    REFRESH_INTERVAL,
+    REFRESH_JITTER,
+    REQUEST_COALESCING_ENABLED,
+    RESPONSE_CACHE_ENABLED,
+    SNAPSHOT_ENABLED,
+)
+from cid.database import (
+    AsyncReadSessionLocal,
+    ReadSessionLocal,
+    SessionLocal,
+    engine,
+)
+from cid.export import MEDIA_TYPES, csv_chunks, ndjson_chunks
+from cid.formats import negotiate_format, render_listing, vary_header
+from cid.leader import is_fresh, refresh_lock
+from cid.models import GOOGLE_DEFERRED_COLUMNS, AwsImage, AzureImage, GoogleImage
+from cid.refresh import (
+    has_new_generation,
+    pull_newest_generation,
+    refresh_image_data,
+    run_refresh_process,
+    runs_in_subprocess,
+)
+from cid.serialization import JSONBytesResponse, dumps
+from cid.snapshot import (
+    current_snapshot,
+    load_catalog,
+    refresh_snapshot,
+    reload_catalog_if_changed,
+)
+from cid.status import current_status, record_status
+from cid.utils import InvalidFields
 
 log = logging.getLogger(__name__)
 
@@ -28,7 +97,27 @@ or submit a [GitHub issue](https://github.com/redhatcloudx/cidv2).
 ----
 """
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Start the background work once the server is up, and stop it on shutdown.
+
+    Nothing waits for the background work: requests are answered from the database
+    until the snapshot is loaded. Workers forked by `cid.server` leave the background
+    work to their master process.
+    """
+    stop = threading.Event()
+    # NOTE(major): Pytest runs this code for some reason. This is a workaround.
+    if ENVIRONMENT != "testing" and app.state.background_work:
+        threading.Thread(
+            target=run_background_work, args=(stop,), name="schedule", daemon=True
+        ).start()
+    yield
+    stop.set()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="CIDv2",
     description=description,
     summary="🔎 Find Red Hat Enterprise Linux™ images on various cloud providers.",
@@ -43,42 +132,289 @@ app = FastAPI(
         "url": "https://www.apache.org/licenses/LICENSE-2.0.html",
     },
 )
+app.state.background_work = True
+# Middleware added first runs last, so only requests that reach an endpoint are
+# admitted: responses from the cache or shared with another request never wait.
+app.add_middleware(AdmissionMiddleware)
 
 
-def get_db() -> Generator:
-    db = SessionLocal()
+# Status code, headers and body of a response, shared by identical requests.
+Rendered = tuple[int, list[tuple[str, str]], bytes]
+
+request_flights: SingleFlight[Rendered] = SingleFlight()
+
+
+async def coalesce(
+    key: Hashable, function: Callable[[], Awaitable[Rendered]]
+) -> Rendered:
+    """Let identical requests in flight at the same time share one response.
+
+    Requests refused by admission control aren't shared, since identical requests
+    waiting for them may still be admitted.
+    """
+    if not REQUEST_COALESCING_ENABLED:
+        return await function()
+    return await request_flights.do(key, function, shareable=lambda r: r[0] != 503)
+
+
+async def _read_body(response: Response) -> bytes:
+    """Collect the body of a response returned by the rest of the app."""
+    # The response of the rest of the app is always streamed.
+    streamed = cast(StreamingResponse, response)
+    return b"".join([
+        chunk.encode() if isinstance(chunk, str) else bytes(chunk)
+        async for chunk in streamed.body_iterator
+    ])
+
+
+async def _render(
+    request: Request,
+    call_next: Callable[[Request], Awaitable[Response]],
+    plain_key: CacheKey,
+) -> Rendered:
+    """Run the endpoint of a read request, and cache its uncompressed response."""
+    response = await call_next(request)
+    body = await _read_body(response)
+    headers = [
+        (name, value)
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-encoding")
+    ]
+    if response.status_code == 200:
+        headers.append(("vary", vary_header(request.url.path)))
+        if RESPONSE_CACHE_ENABLED:
+            response_cache.put(plain_key, response.status_code, headers, body)
+    return response.status_code, headers, body
+
+
+async def _respond(
+    request: Request,
+    call_next: Callable[[Request], Awaitable[Response]],
+    key: CacheKey,
+    encoding: Optional[str],
+    media_type: Optional[str],
+) -> Rendered:
+    """Render the response of a read request in its encoding, and cache it."""
+    # Another encoding of the same response only needs to be compressed again.
+    plain_key = response_cache.key(
+        request.url.path, request.query_params.multi_items(), None, media_type
+    )
+    plain = None
+    if RESPONSE_CACHE_ENABLED and encoding is not None:
+        plain = response_cache.get(plain_key)
+
+    if plain is not None:
+        status_code, headers, body = plain.status_code, plain.headers, plain.body
+    else:
+        status_code, headers, body = await coalesce(
+            ("render", plain_key), partial(_render, request, call_next, plain_key)
+        )
+    if status_code != 200:
+        return status_code, headers, body
+
+    # Compressing a large listing takes a while, so keep it off the event loop.
+    body, applied = await run_in_threadpool(compress, body, encoding)
+    if applied is not None:
+        headers = [*headers, ("content-encoding", applied)]
+    if RESPONSE_CACHE_ENABLED and encoding is not None:
+        response_cache.put(key, status_code, headers, body)
+    return status_code, headers, body
+
+
+@app.middleware("http")
+async def compress_and_cache_responses(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """Compress read responses and answer repeated ones from the response cache.
+
+    The cache is checked before the request is routed, so a hit never runs the
+    endpoint or opens a database session. Every content encoding of a response is
+    cached separately, so each one is only rendered and compressed once per data
+    generation. Identical requests that miss the cache at the same time wait for the
+    first one to render their response, instead of all running the same queries.
+    """
+    if request.method != "GET" or not CACHEABLE_PATH.match(request.url.path):
+        return await call_next(request)
+
+    path, query_params = request.url.path, request.query_params.multi_items()
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    media_type = negotiate_format(path, request.headers.get("Accept"))
+
+    key = response_cache.key(path, query_params, encoding, media_type)
+    cached = response_cache.get(key) if RESPONSE_CACHE_ENABLED else None
+    if cached is not None:
+        return Response(
+            cached.body,
+            status_code=cached.status_code,
+            headers={**dict(cached.headers), "X-Cache": "HIT"},
+        )
+
+    status_code, headers, body = await coalesce(
+        ("respond", key),
+        partial(_respond, request, call_next, key, encoding, media_type),
+    )
+    if status_code != 200 or not RESPONSE_CACHE_ENABLED:
+        return Response(body, status_code=status_code, headers=dict(headers))
+    return Response(
+        body, status_code=status_code, headers={**dict(headers), "X-Cache": "MISS"}
+    )
+
+
+# Middleware added last runs first, so conditional requests are answered before the
+# response cache is even looked at.
+@app.middleware("http")
+async def conditional_requests(
+    request: Request, call_next: Callable[[Request], Awaitable[Response]]
+) -> Response:
+    """Add validators to read responses and answer revalidations with a 304."""
+    if request.method != "GET" or not CACHEABLE_PATH.match(request.url.path):
+        return await call_next(request)
+
+    if data_version() is None:
+        await run_in_threadpool(load_data_version)
+
+    path = request.url.path
+    tag = etag(
+        path,
+        request.query_params.multi_items(),
+        negotiate(request.headers.get("Accept-Encoding")),
+        negotiate_format(path, request.headers.get("Accept")),
+    )
+    headers = caching_headers(tag, vary_header(path))
+    if_none_match = request.headers.get("If-None-Match")
+    if not is_not_modified(
+        tag, if_none_match, request.headers.get("If-Modified-Since")
+    ):
+        response = await call_next(request)
+        if response.status_code == 200:
+            response.headers.update(headers)
+        return response
+
+    # The tag is only sent along with a successful response of this very request.
+    if matches_etag(tag, if_none_match) or is_cached(request):
+        return Response(status_code=304, headers=headers)
+
+    # Only answer with a 304 when the resource exists and the request is valid.
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    await _read_body(response)
+    return Response(status_code=304, headers=headers)
+
+
+def is_cached(request: Request) -> bool:
+    """Check whether the response cache holds a successful response to a request."""
+    if not RESPONSE_CACHE_ENABLED:
+        return False
+    path = request.url.path
+    key = response_cache.key(
+        path,
+        request.query_params.multi_items(),
+        negotiate(request.headers.get("Accept-Encoding")),
+        negotiate_format(path, request.headers.get("Accept")),
+    )
+    return key in response_cache
+
+
+def load_data_version() -> None:
+    """Read the last update of the image data, before its status is first recorded."""
+    db = ReadSessionLocal()
     try:
-        yield db
+        last_update = crud.get_last_update(db)
+    except SQLAlchemyError:
+        # The database may not be populated yet.
+        return
     finally:
         db.close()
+    if last_update:
+        set_data_version(last_update)
 
 
-def check_endpoint_status(
-    db: Session, endpoint_func: Any, *args: str, **kwargs: int
-) -> str:
+async def get_db() -> AsyncIterator[AnySession]:
+    """Open a read session, on the asyncio engine when there is one."""
+    db: AnySession = (
+        ReadSessionLocal() if AsyncReadSessionLocal is None else AsyncReadSessionLocal()
+    )
     try:
-        data = endpoint_func(db, *args, **kwargs)
-        if data is None:
-            return "down"
-        else:
-            return "running"
-    except HTTPException:
-        return "down"
+        yield db
+    finally:
+        await async_crud.close(db)
+
+
+async def find_image_or_404(db: AnySession, cloud_provider: str, image_id: str) -> Any:
+    image = await async_crud.run(db, crud.find_image, cloud_provider, image_id)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image
+
+
+# Export formats, passed as the `format` query parameter.
+ExportFormat = Annotated[Literal["ndjson", "csv"], Query(alias="format")]
+
+
+def export_response(
+    cloud_provider: str,
+    export_format: str,
+    columns: tuple[str, ...],
+    rows: Iterator[Any],
+    db: AnySession,
+) -> StreamingResponse:
+    """Stream exported rows to the client, closing the session once they are sent."""
+    if export_format == "csv":
+        chunks = csv_chunks(columns, rows)
+    else:
+        chunks = ndjson_chunks(rows)
+
+    async def body() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in async_crud.iterate(db, chunks):
+                yield chunk
+        finally:
+            # get_db may close the session before the body is streamed. Closing it
+            # again releases the connection the stream used either way.
+            await async_crud.close(db)
+
+    filename = f"{cloud_provider}-images.{export_format}"
+    return StreamingResponse(
+        body(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def listing_response(
+    request: Request,
+    listing: dict,
+    table: Table,
+    fields: Optional[str],
+    deferred: tuple[str, ...] = (),
+) -> Response:
+    """Send a listing as JSON or in the columnar format the client asked for."""
+    media_type = negotiate_format(request.url.path, request.headers.get("Accept"))
+    if media_type is None:
+        return JSONBytesResponse(listing)
+
+    columns = crud.listing_columns(table, fields, deferred)
+    return Response(
+        render_listing(listing, table, columns, media_type), media_type=media_type
+    )
+
+
+@app.exception_handler(InvalidFields)
+async def invalid_fields(request: Request, exc: InvalidFields) -> Response:
+    return JSONBytesResponse({"detail": f"Unknown fields: {exc}"}, status_code=400)
 
 
 @app.get("/", summary="Status")
-def status(request: Request, db: Session = Depends(get_db)) -> dict:  # noqa: B008
+async def status(request: Request, db: AnySession = Depends(get_db)) -> dict:  # noqa: B008
     """
-    Get the status of the CIDv2 API and the last update time.
+    Get the status of the CIDv2 API, the number of images of each cloud provider and
+    the last update time, as recorded after the last refresh.
     """
-    aws_status = check_endpoint_status(db, crud.find_aws_images, page=1, page_size=1)
-    google_status = check_endpoint_status(
-        db, crud.find_google_images, page=1, page_size=1
-    )
-    azure_status = check_endpoint_status(
-        db, crud.find_azure_images, page=1, page_size=1
-    )
-    last_update = crud.get_last_update(db)
+    recorded = current_status()
+    if recorded is None:
+        recorded = await async_crud.run(db, record_status)
+    images = recorded["images"]
 
     # In some situations, the base_url will start with http:// instead of https:// and
     # we don't want that.
@@ -86,18 +422,36 @@ def status(request: Request, db: Session = Depends(get_db)) -> dict:  # noqa: B0
 
     return {
         "status": {
-            f"{secure_base_url}aws": aws_status,
-            f"{secure_base_url}google": google_status,
-            f"{secure_base_url}azure": azure_status,
+            f"{secure_base_url}{cloud_provider}": "running" if count else "down"
+            for cloud_provider, count in images.items()
         },
+        "images": images,
         "docs": f"{secure_base_url}docs",
-        "last_update": last_update,
+        "last_update": recorded["last_update"],
     }
 
 
-@app.get("/aws", summary="AWS: Get all images")
-def all_aws_images(
-    db: Session = Depends(get_db),  # noqa: B008
+@app.get("/healthz", include_in_schema=False)
+async def healthz() -> Response:
+    """Report that the app is alive, without touching the database."""
+    return JSONBytesResponse({"status": "ok"})
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz(db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
+    """Report whether the app can serve requests, with a single `SELECT 1`."""
+    try:
+        await async_crud.run(db, lambda session: session.execute(text("SELECT 1")))
+    except SQLAlchemyError:
+        log.exception("The database is not available")
+        raise HTTPException(status_code=503, detail="Database unavailable") from None
+    return JSONBytesResponse({"status": "ok"})
+
+
+@app.get("/aws", summary="AWS: Get all images", response_class=JSONBytesResponse)
+async def all_aws_images(
+    request: Request,
+    db: AnySession = Depends(get_db),  # noqa: B008
     arch: Optional[str] = None,
     version: Optional[str] = None,
     name: Optional[str] = None,
@@ -105,160 +459,568 @@ def all_aws_images(
     image_id: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
-) -> dict:
+    fields: Optional[str] = None,
+) -> Response:
     """
     Get a list of all of the Red Hat Enterprise Linux™ images from AWS.
 
     - **arch**: Limit results to a single architecture, such as `arm64` or `x86_64`.
+    - **fields**: Comma-separated fields to return, such as `name,imageId`.
     - **image_id**: Search for images by ImageId.
     - **name**: Search for images by name.
     - **page**: The page number to return.
-    - **page_size**: The number of results to return per page.
+    - **page_size**: The number of results to return per page, at most 1000 by default.
     - **region**: Limit results to a specific AWS region such as `us-east-1`.
     - **version**: Search for a specific RHEL version such as `8.8` or `9.4`.
     """
-    result = crud.find_aws_images(
-        db, arch, version, name, region, image_id, page, page_size
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        result = await run_in_threadpool(
+            snapshot.find_aws_images,
+            arch,
+            version,
+            name,
+            region,
+            image_id,
+            page,
+            page_size,
+            fields,
+        )
+    else:
+        result = await async_crud.run(
+            db,
+            crud.find_aws_images,
+            arch,
+            version,
+            name,
+            region,
+            image_id,
+            page,
+            page_size,
+            fields,
+        )
+    # Rendering a large page takes a while, so keep it off the event loop.
+    return await run_in_threadpool(
+        listing_response, request, result, AwsImage.__table__, fields
     )
-    return dict(jsonable_encoder(result))
 
 
-@app.get("/aws/versions", summary="AWS: Get available versions")
-def aws_versions(db: Session = Depends(get_db)) -> list:  # noqa: B008
+@app.get(
+    "/aws/versions",
+    summary="AWS: Get available versions",
+    response_class=JSONBytesResponse,
+)
+async def aws_versions(db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
     """
     Get a list of Red Hat Enterprise Linux™ versions which are available to deploy in AWS.
     """
-    return crud.find_available_aws_versions(db)
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return JSONBytesResponse(
+            snapshot.rendered(
+                "aws_versions",
+                lambda: dumps(snapshot.find_available_aws_versions()),
+            )
+        )
+    return JSONBytesResponse(await async_crud.run(db, crud.find_available_aws_versions))
 
 
-@app.get("/aws/latest", summary="AWS: Get latest image")
-def latest_aws_image(db: Session = Depends(get_db), arch: Optional[str] = None) -> dict:  # noqa: B008
+@app.get(
+    "/aws/latest", summary="AWS: Get latest image", response_class=JSONBytesResponse
+)
+async def latest_aws_image(
+    db: AnySession = Depends(get_db),  # noqa: B008
+    arch: Optional[str] = None,
+) -> Response:
     """
     Get the latest Red Hat Enterprise Linux™ image from AWS in each region.
 
     - **arch**: Limit results to a single architecture, such as `arm64` or `x86_64`.
     """
-    return crud.latest_aws_image(db, arch)
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return JSONBytesResponse(
+            snapshot.rendered(
+                ("aws_latest", arch), lambda: dumps(snapshot.latest_aws_image(arch))
+            )
+        )
+    return JSONBytesResponse(await async_crud.run(db, crud.latest_aws_image, arch))
+
+
+@app.get("/aws/export", summary="AWS: Export all images")
+async def export_aws_images(
+    db: AnySession = Depends(get_db),  # noqa: B008
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    name: Optional[str] = None,
+    region: Optional[str] = None,
+    image_id: Optional[str] = None,
+    fields: Optional[str] = None,
+    export_format: ExportFormat = "ndjson",
+) -> StreamingResponse:
+    """
+    Download every AWS image that matches the filters as NDJSON or CSV, streamed
+    from the database without pagination.
+
+    - Takes the same filters and **fields** as `/aws`.
+    - **format**: `ndjson` (the default) or `csv`.
+    """
+    columns, rows = await async_crud.run(
+        db, crud.export_aws_images, arch, version, name, region, image_id, fields
+    )
+    return export_response("aws", export_format, columns, rows, db)
+
+
+@app.get(
+    "/aws/images/{image_id}",
+    summary="AWS: Get image details",
+    response_class=JSONBytesResponse,
+)
+async def aws_image(image_id: str, db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
+    """
+    Get every detail of a single Red Hat Enterprise Linux™ image from AWS.
+
+    - **image_id**: The AWS ImageId of the image.
+    """
+    return JSONBytesResponse(await find_image_or_404(db, "aws", image_id))
 
 
-@app.get("/aws/match/{image_id}", summary="AWS: Match image")
-def match_aws_image(image_id: str, db: Session = Depends(get_db)) -> dict:  # noqa: B008
+@app.get(
+    "/aws/match/{image_id}",
+    summary="AWS: Match image",
+    response_class=JSONBytesResponse,
+)
+async def match_aws_image(image_id: str, db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
     """
     Find other Red Hat Enterprise Linux™ images from other AWS regions that match the
     `image_id` provided.
 
     - **image_id**: AWS ImageId to match in other regions.
     """
-    result = crud.find_matching_ami(db, image_id)
-    return result
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return JSONBytesResponse(snapshot.find_matching_ami(image_id))
+    return JSONBytesResponse(await async_crud.run(db, crud.find_matching_ami, image_id))
 
 
-@app.get("/azure", summary="Azure: Get all images")
-def all_azure_images(
-    db: Session = Depends(get_db),  # noqa: B008
+@app.get("/azure", summary="Azure: Get all images", response_class=JSONBytesResponse)
+async def all_azure_images(
+    request: Request,
+    db: AnySession = Depends(get_db),  # noqa: B008
     arch: Optional[str] = None,
     version: Optional[str] = None,
     urn: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
-) -> dict:
+    fields: Optional[str] = None,
+) -> Response:
     """
     Get a list of all of the Red Hat Enterprise Linux™ images available in Azure.
 
     - **arch**: Limit results to a single architecture, such as `arm64` or `x64`.
+    - **fields**: Comma-separated fields to return, such as `urn,version`.
     - **page**: The page number to return.
-    - **page_size**: The number of results to return per page.
+    - **page_size**: The number of results to return per page, at most 1000 by default.
     - **urn**: Limit results to a specific Azure URN.
     - **version**: Search for a specific RHEL version such as `8.8` or `9.4`.
     """
-    result = crud.find_azure_images(db, arch, version, urn, page, page_size)
-    return dict(jsonable_encoder(result))
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        result = await run_in_threadpool(
+            snapshot.find_azure_images, arch, version, urn, page, page_size, fields
+        )
+    else:
+        result = await async_crud.run(
+            db, crud.find_azure_images, arch, version, urn, page, page_size, fields
+        )
+    # Rendering a large page takes a while, so keep it off the event loop.
+    return await run_in_threadpool(
+        listing_response, request, result, AzureImage.__table__, fields
+    )
 
 
-@app.get("/azure/versions", summary="Azure: Get available versions")
-def azure_versions(db: Session = Depends(get_db)) -> list:  # noqa: B008
+@app.get(
+    "/azure/versions",
+    summary="Azure: Get available versions",
+    response_class=JSONBytesResponse,
+)
+async def azure_versions(db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
     """
     Get a list of Red Hat Enterprise Linux™ versions which are available to deploy in Azure.
     """
-    return crud.find_available_azure_versions(db)
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return JSONBytesResponse(
+            snapshot.rendered(
+                "azure_versions",
+                lambda: dumps(snapshot.find_available_azure_versions()),
+            )
+        )
+    return JSONBytesResponse(
+        await async_crud.run(db, crud.find_available_azure_versions)
+    )
 
 
-@app.get("/azure/latest", summary="Azure: Get latest image")
-def latest_azure_image(
-    db: Session = Depends(get_db),  # noqa: B008
+@app.get(
+    "/azure/latest", summary="Azure: Get latest image", response_class=JSONBytesResponse
+)
+async def latest_azure_image(
+    db: AnySession = Depends(get_db),  # noqa: B008
     arch: Optional[str] = None,
-) -> dict:
+) -> Response:
     """
     Get the latest Red Hat Enterprise Linux™ image from Azure.
 
     - **arch**: Limit results to a single architecture, such as `arm64` or `x64`.
     """
-    return crud.latest_azure_image(db, arch)
+    return JSONBytesResponse(await async_crud.run(db, crud.latest_azure_image, arch))
+
+
+@app.get("/azure/export", summary="Azure: Export all images")
+async def export_azure_images(
+    db: AnySession = Depends(get_db),  # noqa: B008
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    urn: Optional[str] = None,
+    fields: Optional[str] = None,
+    export_format: ExportFormat = "ndjson",
+) -> StreamingResponse:
+    """
+    Download every Azure image that matches the filters as NDJSON or CSV, streamed
+    from the database without pagination.
+
+    - Takes the same filters and **fields** as `/azure`.
+    - **format**: `ndjson` (the default) or `csv`.
+    """
+    columns, rows = await async_crud.run(
+        db, crud.export_azure_images, arch, version, urn, fields
+    )
+    return export_response("azure", export_format, columns, rows, db)
+
+
+@app.get(
+    "/azure/images/{image_id}",
+    summary="Azure: Get image details",
+    response_class=JSONBytesResponse,
+)
+async def azure_image(image_id: str, db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
+    """
+    Get every detail of a single Red Hat Enterprise Linux™ image from Azure.
+
+    - **image_id**: The URN of the image.
+    """
+    return JSONBytesResponse(await find_image_or_404(db, "azure", image_id))
 
 
-@app.get("/google", summary="Google: Get all images")
-def all_google_images(
-    db: Session = Depends(get_db),  # noqa: B008
+@app.get("/google", summary="Google: Get all images", response_class=JSONBytesResponse)
+async def all_google_images(
+    request: Request,
+    db: AnySession = Depends(get_db),  # noqa: B008
     arch: Optional[str] = None,
     version: Optional[str] = None,
     name: Optional[str] = None,
     family: Optional[str] = None,
     page: int = 1,
     page_size: int = 100,
-) -> dict:
+    fields: Optional[str] = None,
+) -> Response:
     """
     Get a list of all of the Red Hat Enterprise Linux™ images available in Google Cloud Platform.
 
     - **arch**: Limit results to a single architecture, such as `ARM64` or `X86_64`.
+    - **fields**: Comma-separated fields to return, such as `name,selfLink`. The
+      large JSON fields are only returned when they are asked for, or by the image
+      detail endpoint.
     - **name**: Search for images by name.
     - **family**: Search for images by family.
     - **page**: The page number to return.
-    - **page_size**: The number of results to return per page.
+    - **page_size**: The number of results to return per page, at most 1000 by default.
     - **urn**: Limit results to a specific Azure URN.
     - **version**: Search for a specific RHEL version such as `8.8` or `9.4`.
     """
-    result = crud.find_google_images(db, arch, version, name, family, page, page_size)
-    return dict(jsonable_encoder(result))
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        result = await run_in_threadpool(
+            snapshot.find_google_images,
+            arch,
+            version,
+            name,
+            family,
+            page,
+            page_size,
+            fields,
+        )
+    else:
+        result = await async_crud.run(
+            db,
+            crud.find_google_images,
+            arch,
+            version,
+            name,
+            family,
+            page,
+            page_size,
+            fields,
+        )
+    # Rendering a large page takes a while, so keep it off the event loop.
+    return await run_in_threadpool(
+        listing_response,
+        request,
+        result,
+        GoogleImage.__table__,
+        fields,
+        GOOGLE_DEFERRED_COLUMNS,
+    )
 
 
-@app.get("/google/versions", summary="Google: Get available versions")
-def google_versions(db: Session = Depends(get_db)) -> list:  # noqa: B008
+@app.get(
+    "/google/versions",
+    summary="Google: Get available versions",
+    response_class=JSONBytesResponse,
+)
+async def google_versions(db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
     """
     Get a list of Red Hat Enterprise Linux™ versions which are available to deploy in Google Cloud Platform.
     """
-    return crud.find_available_google_versions(db)
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        return JSONBytesResponse(
+            snapshot.rendered(
+                "google_versions",
+                lambda: dumps(snapshot.find_available_google_versions()),
+            )
+        )
+    return JSONBytesResponse(
+        await async_crud.run(db, crud.find_available_google_versions)
+    )
 
 
-@app.get("/google/latest", summary="Google: Get latest image")
-def latest_google_image(
-    db: Session = Depends(get_db),  # noqa: B008
+@app.get(
+    "/google/latest",
+    summary="Google: Get latest image",
+    response_class=JSONBytesResponse,
+)
+async def latest_google_image(
+    db: AnySession = Depends(get_db),  # noqa: B008
     arch: Optional[str] = None,
-) -> dict:
+) -> Response:
     """
     Get the latest Red Hat Enterprise Linux™ image from Google Cloud Platform.
 
     - **arch**: Limit results to a single architecture, such as `ARM64` or `X86_64`.
     """
-    return crud.latest_google_image(db, arch)
+    return JSONBytesResponse(await async_crud.run(db, crud.latest_google_image, arch))
+
+
+@app.get("/google/export", summary="Google: Export all images")
+async def export_google_images(
+    db: AnySession = Depends(get_db),  # noqa: B008
+    arch: Optional[str] = None,
+    version: Optional[str] = None,
+    name: Optional[str] = None,
+    family: Optional[str] = None,
+    fields: Optional[str] = None,
+    export_format: ExportFormat = "ndjson",
+) -> StreamingResponse:
+    """
+    Download every Google image that matches the filters as NDJSON or CSV, streamed
+    from the database without pagination.
+
+    - Takes the same filters and **fields** as `/google`.
+    - **format**: `ndjson` (the default) or `csv`.
+    """
+    columns, rows = await async_crud.run(
+        db, crud.export_google_images, arch, version, name, family, fields
+    )
+    return export_response("google", export_format, columns, rows, db)
+
+
+@app.get(
+    "/google/images/{image_id}",
+    summary="Google: Get image details",
+    response_class=JSONBytesResponse,
+)
+async def google_image(image_id: str, db: AnySession = Depends(get_db)) -> Response:  # noqa: B008
+    """
+    Get every detail of a single Red Hat Enterprise Linux™ image from Google Cloud Platform.
+
+    - **image_id**: The id of the image.
+    """
+    return JSONBytesResponse(await find_image_or_404(db, "google", image_id))
+
+
+def artifact_headers(version: str, entry: dict, built_at: str) -> dict[str, str]:
+    """Return the validators and freshness headers of an artifact file."""
+    if version == "latest":
+        # The latest version changes with the next scheduled refresh.
+        next_refresh = datetime.fromisoformat(built_at) + timedelta(
+            seconds=REFRESH_INTERVAL
+        )
+        max_age = int((next_refresh - datetime.now(timezone.utc)).total_seconds())
+        cache_control = f"public, max-age={max(max_age, 0)}"
+    else:
+        cache_control = "public, max-age=31536000, immutable"
+
+    digest = base64.b64encode(bytes.fromhex(entry["sha256"])).decode()
+    return {
+        "ETag": f'"{entry["sha256"]}"',
+        "Repr-Digest": f"sha-256=:{digest}:",
+        "Cache-Control": cache_control,
+    }
+
+
+@app.get(
+    "/artifacts/{version}",
+    summary="Artifacts: List downloadable files",
+    response_class=JSONBytesResponse,
+)
+async def artifacts_manifest(version: str) -> Response:
+    """
+    List the files of the whole catalog that are built at every refresh, with their
+    size, number of rows and SHA-256 hash.
+
+    - **version**: `latest` or the version of an earlier build.
+    """
+    manifest = read_manifest(ARTIFACTS_DIR, version) if ARTIFACTS_DIR else None
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="No artifacts found")
+    return JSONBytesResponse(manifest)
 
 
-@repeat(every(24).hours)
+@app.get("/artifacts/{version}/{name}", summary="Artifacts: Download a file")
+async def artifact_file(request: Request, version: str, name: str) -> Response:
+    """
+    Download a file of the whole catalog, such as `aws.ndjson.gz`, `aws.parquet` or
+    `aws.sqlite`. Byte ranges are supported for resuming downloads.
+
+    - **version**: `latest` or the version of an earlier build.
+    - **name**: The name of the file, as listed in the manifest.
+    """
+    manifest = read_manifest(ARTIFACTS_DIR, version) if ARTIFACTS_DIR else None
+    found = find_artifact(ARTIFACTS_DIR, version, name) if manifest else None
+    if manifest is None or found is None:
+        raise HTTPException(status_code=404, detail="No artifact found")
+
+    path, entry = found
+    headers = artifact_headers(version, entry, manifest["built_at"])
+    if is_not_modified(headers["ETag"], request.headers.get("If-None-Match"), None):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path,
+        media_type=ARTIFACT_MEDIA_TYPES[entry["format"]],
+        filename=name,
+        headers=headers,
+    )
+
+
+@repeat(every(REFRESH_INTERVAL).to(REFRESH_INTERVAL + REFRESH_JITTER).seconds)
 def self_update_image_data() -> None:
-    """Update the database with new image data."""
+    """Update the database with new image data, unless another process does it."""
+    with refresh_lock(engine) as leader:
+        if not leader:
+            log.info("⏭️ Another process is refreshing the image data")
+            return
+
+        db = SessionLocal()
+        try:
+            if is_fresh(db):
+                log.info("⏭️ The image data was refreshed by another process")
+                return
+
+            if runs_in_subprocess():
+                if not run_refresh_process():
+                    return
+            else:
+                refresh_image_data(db)
+            switch_to_new_data(db)
+        finally:
+            db.close()
+
+
+def switch_to_new_data(db: Session) -> None:
+    """Serve the image data of the last refresh, and forget the responses of the old."""
+    # The refresh wrote the catalog file, if there is one.
+    if SNAPSHOT_ENABLED and (not CATALOG_PATH or load_catalog() is None):
+        refresh_snapshot(db)
+
+    bump_generation()
+    record_status(db)
+
+
+def load_snapshot() -> None:
+    """Serve the first snapshot from an existing catalog or from the database."""
+    if load_catalog() is not None:
+        return
+
+    db = ReadSessionLocal()
+    try:
+        refresh_snapshot(db)
+    except Exception:
+        # The database may not be populated yet. Requests are answered from the
+        # database until the next refresh builds a snapshot.
+        log.exception("Unable to build the initial snapshot")
+    finally:
+        db.close()
+
+
+@repeat(every(1).minutes)
+def follow_catalog() -> None:
+    """Pick up a catalog file written by another worker process."""
+    if SNAPSHOT_ENABLED and CATALOG_PATH and reload_catalog_if_changed():
+        bump_generation()
+
+
+@repeat(every(1).minutes)
+def follow_generations() -> None:
+    """Pull a generation as soon as it is published, instead of at the next refresh.
+
+    Every node pulls on its own, so this doesn't wait for the refresh lock, and the
+    last update copied from the publisher doesn't make the node skip it.
+    """
     db = SessionLocal()
-    crud.update_image_data(db)
-    crud.update_last_updated(db)
+    try:
+        if not has_new_generation(db):
+            return
 
+        log.info("🚚 Pulling the newest generation")
+        if runs_in_subprocess():
+            if not run_refresh_process(pull_only=True):
+                return
+        elif not pull_newest_generation(db):
+            return
+        switch_to_new_data(db)
+    finally:
+        db.close()
 
-def run_schedule() -> None:
-    """Background task to run the scheduled tasks."""
-    while True:
-        run_pending()
-        sleep(1)
 
+@repeat(every(1).minutes)
+def follow_refresh() -> None:
+    """Pick up image data written by the process that refreshed it."""
+    db = ReadSessionLocal()
+    try:
+        recorded = current_status()
+        if recorded is None:
+            # Remember the data this process started with.
+            record_status(db)
+            return
+        if recorded["last_update"] == crud.get_last_update(db):
+            return
 
-# Run the schedule in a separate thread
-# NOTE(major): Pytest runs this code for some reason. This is a workaround.
-if ENVIRONMENT != "testing":
-    schedule_thread = threading.Thread(target=run_schedule)
-    schedule_thread.start()
+        log.info("🔄 Picking up image data refreshed by another process")
+        switch_to_new_data(db)
+    except SQLAlchemyError:
+        # The database may not be populated yet.
+        log.exception("Unable to check for refreshed image data")
+    finally:
+        db.close()
+
+
+def run_background_work(stop: threading.Event) -> None:
+    """Load the snapshot, then run the scheduled tasks until the app shuts down."""
+    if SNAPSHOT_ENABLED:
+        load_snapshot()
+    follow_refresh()
+
+    while not stop.wait(1):
+        run_pending()
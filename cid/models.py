@@ -1,9 +1,13 @@
 """Database models."""
 
 from sqlalchemy import JSON, Column, DateTime, Integer, String, func
+from sqlalchemy.dialects.postgresql import JSONB
 
 from cid.database import Base
 
+# JSON columns are stored as JSONB on PostgreSQL, which is parsed once on write.
+JSONColumn = JSON().with_variant(JSONB(), "postgresql")
+
 # Avoid ruff getting upset about the id column below.
 # ruff: noqa: A003
 
@@ -35,16 +39,27 @@ class GoogleImage(Base):
     description = Column(String)
     diskSizeGb = Column(Integer)
     family = Column(String)
-    guestOsFeatures = Column(JSON)
+    guestOsFeatures = Column(JSONColumn)
     kind = Column(String)
     labelFingerprint = Column(String)
-    licenseCodes = Column(JSON)
-    licenses = Column(JSON)
-    rawDisk = Column(JSON)
+    licenseCodes = Column(JSONColumn)
+    licenses = Column(JSONColumn)
+    rawDisk = Column(JSONColumn)
     selfLink = Column(String)
     sourceType = Column(String)
     status = Column(String)
-    storageLocations = Column(JSON)
+    storageLocations = Column(JSONColumn)
+
+
+# Large JSON columns that the listings leave out unless they are asked for. They are
+# always available from the detail endpoint of a single image.
+GOOGLE_DEFERRED_COLUMNS = (
+    "guestOsFeatures",
+    "licenseCodes",
+    "licenses",
+    "rawDisk",
+    "storageLocations",
+)
 
 
 class AzureImage(Base):
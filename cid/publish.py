@@ -0,0 +1,199 @@
+"""Publish the read API as a tree of static, precompressed files.
+
+Most responses only depend on the last refresh: the latest images, the versions, the
+first page of every listing and the matching AMIs of every AWS image. They can be
+rendered once per refresh and served by any web server or CDN without running the
+app, leaving only the other filter combinations to it.
+
+Every response is written to `<path>/index.json` along with a copy for each content
+encoding, so `/aws/latest` becomes:
+
+    STATIC_SITE_DIR/
+        current -> 20261019T120000000000Z
+        20261019T120000000000Z/
+            manifest.json
+            aws/latest/index.json
+            aws/latest/index.json.gz
+            aws/latest/index.json.br     only when brotli is installed
+            ...
+
+The web server maps a request for `/path` to `current/path/index.json`, or to one of
+its precompressed copies. With nginx, for example:
+
+    location / {
+        root /srv/cid/current;
+        gzip_static on;
+        try_files $uri/index.json =404;
+        default_type application/json;
+    }
+
+A new site is written next to the one being served and `current` is switched to it
+with a single rename. The manifest lists the files, hashes and encodings of every path.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+from collections.abc import Iterator
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.artifacts import VERSION_PATTERN
+from cid.compression import ENCODERS, compress
+from cid.config import STATIC_SITE_DIR
+from cid.database import ReadSessionLocal
+from cid.serialization import dumps
+from cid.snapshot import Snapshot, build_snapshot, current_snapshot
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+CURRENT = "current"
+INDEX = "index.json"
+
+# File extensions of the precompressed copies, by content encoding.
+EXTENSIONS = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+# Sites kept on disk, including the one being served.
+KEEP_VERSIONS = 2
+
+
+def responses(db: Session, snapshot: Snapshot) -> Iterator[tuple[str, Any]]:
+    """Yield the path and content of every response that only depends on the data."""
+    yield "/aws/latest", snapshot.latest_aws_image(None)
+    # Like the app, the other latest images are always read from the database.
+    yield "/azure/latest", crud.latest_azure_image(db, None)
+    yield "/google/latest", crud.latest_google_image(db, None)
+
+    yield "/aws/versions", snapshot.find_available_aws_versions()
+    yield "/azure/versions", snapshot.find_available_azure_versions()
+    yield "/google/versions", snapshot.find_available_google_versions()
+
+    yield "/aws", snapshot.find_aws_images()
+    yield "/azure", snapshot.find_azure_images()
+    yield "/google", snapshot.find_google_images()
+
+    for image_id in snapshot.aws.distinct("imageId"):
+        if image_id:
+            yield f"/aws/match/{image_id}", snapshot.find_matching_ami(image_id)
+
+
+def _write(path: str, body: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as fh:
+        fh.write(body)
+
+
+def _write_response(site: str, path: str, body: bytes) -> dict[str, Any]:
+    """Write a response and its precompressed copies, and describe them."""
+    file = os.path.join(path.strip("/"), INDEX)
+    _write(os.path.join(site, file), body)
+
+    digest = hashlib.sha256(body).hexdigest()
+    entry: dict[str, Any] = {
+        "file": file,
+        "content_type": "application/json",
+        "size": len(body),
+        "sha256": digest,
+        "etag": f'"{digest[:32]}"',
+        "encodings": {},
+    }
+    for encoding in ENCODERS:
+        compressed, applied = compress(body, encoding)
+        if applied is None:
+            continue
+        compressed_file = file + EXTENSIONS[encoding]
+        _write(os.path.join(site, compressed_file), compressed)
+        entry["encodings"][encoding] = {
+            "file": compressed_file,
+            "size": len(compressed),
+        }
+    return entry
+
+
+def publish_site(db: Session, directory: str) -> dict[str, Any]:
+    """Render the static responses into a new site and start serving it.
+
+    The snapshot being served is used when there is one, so the published responses
+    match the ones of the app.
+
+    Args:
+        db (Session): database session, to build a snapshot when there is none
+        directory (str): directory holding the sites and the `current` link
+
+    Returns:
+        dict: manifest of the new site
+    """
+    snapshot = current_snapshot() or build_snapshot(db)
+
+    built_at = datetime.now(timezone.utc)
+    version = built_at.strftime("%Y%m%dT%H%M%S%fZ")
+    site = os.path.join(directory, version)
+    tmp_site = os.path.join(directory, f".{version}.{os.getpid()}.tmp")
+
+    try:
+        os.makedirs(tmp_site)
+        files = {
+            path: _write_response(tmp_site, path, dumps(content))
+            for path, content in responses(db, snapshot)
+        }
+        manifest = {
+            "version": version,
+            "built_at": built_at.isoformat(),
+            "files": files,
+        }
+        with open(os.path.join(tmp_site, MANIFEST), "w") as fh:
+            json.dump(manifest, fh, indent=2)
+        os.rename(tmp_site, site)
+    except BaseException:
+        shutil.rmtree(tmp_site, ignore_errors=True)
+        raise
+
+    # Replacing a link is atomic, so the web server sees either site but never both.
+    tmp_link = os.path.join(directory, f".{CURRENT}.{os.getpid()}.tmp")
+    os.symlink(version, tmp_link)
+    os.replace(tmp_link, os.path.join(directory, CURRENT))
+    logger.info("🌐 Published %d static responses in %s", len(files), site)
+
+    _prune(directory, version)
+    return manifest
+
+
+def _prune(directory: str, current: str) -> None:
+    """Remove all but the newest sites, never the one being served."""
+    sites = sorted(
+        (entry for entry in os.listdir(directory) if VERSION_PATTERN.match(entry)),
+        reverse=True,
+    )
+    for site in sites[KEEP_VERSIONS:]:
+        if site != current:
+            shutil.rmtree(os.path.join(directory, site), ignore_errors=True)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Publish the static site from the database, for use as a command."""
+    parser = argparse.ArgumentParser(
+        description="Publish the read API as static, precompressed files."
+    )
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=STATIC_SITE_DIR,
+        help="directory to publish into (default: $STATIC_SITE_DIR)",
+    )
+    args = parser.parse_args(argv)
+    if not args.directory:
+        parser.error("a directory is required when STATIC_SITE_DIR is not set")
+
+    os.makedirs(args.directory, exist_ok=True)
+    db = ReadSessionLocal()
+    try:
+        publish_site(db, args.directory)
+    finally:
+        db.close()
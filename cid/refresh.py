@@ -0,0 +1,202 @@
+"""Refresh the image data in a process of its own.
+
+Parsing hundreds of thousands of images holds the GIL for long stretches, which would
+stall every request of the API process while a refresh runs. Instead, the API process
+runs `python -m cid.refresh` and waits for it to exit, which doesn't hold the GIL.
+The refresh process downloads and writes the image data and builds everything that
+is built from it: the catalog file, the artifacts and the static site. Once it exits
+successfully, the API process switches over to the new data.
+
+An in-memory database only exists in the API process, so it is refreshed in place.
+
+With a generation store, only the publisher builds the database and catalog from the
+image data. Every other node pulls them from the store, and only falls back to the
+image data while the store holds no generation or can't be reached. They also check
+the store every minute, and pull each generation as soon as it is published.
+"""
+
+import argparse
+import logging
+import subprocess
+import sys
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.artifacts import build_artifacts
+from cid.config import (
+    ARTIFACTS_DIR,
+    CATALOG_PATH,
+    DATABASE_URL,
+    GENERATION_PUBLISHER,
+    GENERATION_STORE,
+    REFRESH_IN_SUBPROCESS,
+    REFRESH_TIMEOUT,
+    SNAPSHOT_ENABLED,
+    STATIC_SITE_DIR,
+)
+from cid.database import SessionLocal, is_memory_database
+from cid.generations import (
+    open_store,
+    pending_version,
+    publish_generation,
+    pull_generation,
+    sqlite_path,
+)
+from cid.publish import publish_site
+from cid.snapshot import refresh_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def pulls_generations(db: Session) -> bool:
+    """Check whether this node pulls its database from the generation store.
+
+    Nodes sharing a database server elect the one that refreshes it instead.
+    """
+    return (
+        bool(GENERATION_STORE)
+        and not GENERATION_PUBLISHER
+        and sqlite_path(db.get_bind()) is not None
+    )
+
+
+def _pull_generation(db: Session) -> Optional[list[str]]:
+    """Pull the newest generation, or return None to build one from the image data."""
+    try:
+        return pull_generation(open_store(GENERATION_STORE), db.get_bind())
+    except Exception:
+        logger.exception("Unable to pull the newest generation")
+        return None
+
+
+def has_new_generation(db: Session) -> bool:
+    """Check whether the store holds a generation that this node hasn't pulled yet."""
+    if not pulls_generations(db):
+        return False
+    try:
+        version = pending_version(open_store(GENERATION_STORE), db.get_bind())
+    except Exception:
+        logger.exception("Unable to check for a new generation")
+        return False
+    return version is not None
+
+
+def pull_newest_generation(db: Session) -> bool:
+    """Pull the newest generation, and build what is built from it.
+
+    Unlike a refresh, nothing is built from the image data when the store can't be
+    read. The next refresh does that.
+
+    Returns:
+        bool: whether a new generation was activated
+    """
+    activated = _pull_generation(db) if pulls_generations(db) else None
+    if not activated:
+        return False
+    _build_from_data(db, activated)
+    return True
+
+
+def refresh_image_data(db: Session) -> None:
+    """Bring the image data up to date and build everything that is built from it.
+
+    Only what other processes read is built here. The snapshot and the response cache
+    of the API process are switched over once this is done.
+    """
+    activated = _pull_generation(db) if pulls_generations(db) else None
+    if activated == []:
+        logger.info("⏭️ The newest generation is active already")
+        return
+
+    if activated is None:
+        crud.update_image_data(db)
+        crud.update_last_updated(db)
+
+    _build_from_data(db, activated)
+
+
+def _build_from_data(db: Session, activated: Optional[list[str]]) -> None:
+    """Build the catalog, generation, artifacts and static site of new image data."""
+    if SNAPSHOT_ENABLED and CATALOG_PATH and "catalog" not in (activated or []):
+        refresh_snapshot(db)
+
+    if GENERATION_STORE and GENERATION_PUBLISHER:
+        try:
+            publish_generation(open_store(GENERATION_STORE), db)
+        except Exception:
+            # The other nodes keep the previous generation.
+            logger.exception("Unable to publish the generation")
+
+    if ARTIFACTS_DIR:
+        try:
+            build_artifacts(db, ARTIFACTS_DIR)
+        except Exception:
+            # Clients keep downloading the previous version.
+            logger.exception("Unable to build the artifacts")
+
+    if STATIC_SITE_DIR:
+        try:
+            publish_site(db, STATIC_SITE_DIR)
+        except Exception:
+            # The web server keeps serving the previous site.
+            logger.exception("Unable to publish the static site")
+
+
+def runs_in_subprocess() -> bool:
+    """Check whether refreshes run in a process of their own."""
+    return REFRESH_IN_SUBPROCESS and not is_memory_database(DATABASE_URL)
+
+
+def run_refresh_process(
+    timeout: Optional[float] = REFRESH_TIMEOUT, pull_only: bool = False
+) -> bool:
+    """Refresh the image data in a new process and wait for it.
+
+    With `pull_only`, the process only pulls the newest generation.
+
+    Returns:
+        bool: whether the refresh succeeded
+    """
+    command = [sys.executable, "-m", "cid.refresh"]
+    if pull_only:
+        command.append("--pull-only")
+    try:
+        completed = subprocess.run(command, timeout=timeout, check=False)  # noqa: S603
+    except subprocess.TimeoutExpired:
+        logger.exception("The refresh process took longer than %s seconds", timeout)
+        return False
+
+    if completed.returncode != 0:
+        logger.error(
+            "The refresh process failed with exit code %s", completed.returncode
+        )
+        return False
+    return True
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Refresh the image data, for use as a command."""
+    parser = argparse.ArgumentParser(
+        description="Download the image data and build everything built from it."
+    )
+    parser.add_argument(
+        "--pull-only",
+        action="store_true",
+        help="only pull the newest generation from the generation store",
+    )
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.pull_only:
+            pull_newest_generation(db)
+        else:
+            refresh_image_data(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
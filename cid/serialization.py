@@ -0,0 +1,58 @@
+"""Fast JSON rendering for the read endpoints.
+
+Endpoints return a `JSONBytesResponse`, which FastAPI sends as it is instead of
+validating and encoding the result again. The JSON is rendered with `orjson` when it
+is installed and with the standard library otherwise. Both produce the same output
+that `jsonable_encoder` would for the image data: datetimes become ISO 8601 strings
+and database rows become objects holding their columns.
+"""
+
+import json
+from collections.abc import Mapping
+from datetime import date
+from typing import Any
+
+from fastapi import Response
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:  # pragma: no cover
+    HAS_ORJSON = False
+
+
+def _default(value: Any) -> Any:
+    """Convert the values the JSON encoders do not know about."""
+    if isinstance(value, date):
+        return value.isoformat()
+
+    # Rows read through SQLAlchemy Core come back as read-only mappings.
+    if isinstance(value, Mapping):
+        return dict(value)
+
+    table = getattr(value, "__table__", None)
+    if table is not None:
+        return {column.key: getattr(value, column.key) for column in table.columns}
+
+    raise TypeError(type(value).__name__)
+
+
+def dumps(content: Any) -> bytes:
+    """Render content as compact JSON bytes."""
+    if HAS_ORJSON:
+        return bytes(orjson.dumps(content, default=_default))
+    return json.dumps(
+        content, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+class JSONBytesResponse(Response):
+    """A JSON response that can also be given JSON that was rendered earlier."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
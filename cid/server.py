@@ -0,0 +1,277 @@
+"""Serve the API from worker processes forked off a master that preloads everything.
+
+A single uvicorn process only uses one core. Starting several would load the app and
+the snapshot once per process. Instead, the master process:
+
+* imports the app and loads the snapshot and the status once,
+* freezes the garbage collector, so collections in the workers never write to the
+  objects they share with the master,
+* forks the workers, which share the preloaded memory copy-on-write and accept
+  connections on the same listening socket,
+* forks a scheduler process that runs the refresh schedule for all of them, so a
+  refresh never keeps the master from replacing workers that exit, whether or not
+  it runs in a process of its own,
+* checks every minute whether the data changed. Whenever it did, or on SIGHUP, it
+  forks a new set of workers with the new data and stops the old ones, which finish
+  the requests in flight first.
+
+Logging is configured once by the master, like uvicorn would, and every process
+forked off it keeps that configuration.
+
+    poetry run cid --port 8080 --workers 4
+"""
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from contextlib import suppress
+from types import FrameType
+from typing import Any, Callable, Optional
+
+import uvicorn
+from schedule import run_pending
+
+from cid import main as api
+from cid.config import SERVER_WORKERS, SNAPSHOT_ENABLED
+from cid.database import dispose_after_fork
+from cid.snapshot import current_snapshot
+from cid.status import current_status
+
+logger = logging.getLogger(__name__)
+
+# Seconds that stopping workers get to finish the requests in flight.
+GRACEFUL_TIMEOUT = 30
+
+# Seconds between two checks of the master for data written by the scheduler.
+FOLLOW_INTERVAL = 60
+
+
+def worker_count(workers: int = SERVER_WORKERS) -> int:
+    """Return the number of workers to fork, one per CPU by default."""
+    if workers > 0:
+        return workers
+    return os.cpu_count() or 1
+
+
+def preload() -> None:
+    """Load what every worker shares: the snapshot and the status of the data."""
+    api.app.state.background_work = False
+    if SNAPSHOT_ENABLED:
+        api.load_snapshot()
+    api.follow_refresh()
+
+
+def follow_data() -> None:
+    """Pick up data that the scheduler or another node wrote since the last check."""
+    api.follow_refresh()
+    api.follow_catalog()
+
+
+def data_generation() -> tuple[Any, ...]:
+    """Return what the workers serve, which is replaced after every refresh."""
+    return current_snapshot(), current_status()
+
+
+class Master:
+    """Fork the workers, keep them running and replace them when the data changes."""
+
+    def __init__(
+        self, sock: socket.socket, workers: int, config: uvicorn.Config
+    ) -> None:
+        self.sock = sock
+        self.workers = workers
+        self.config = config
+        self.pids: set[int] = set()
+        # Workers that were asked to stop, and are finishing their requests.
+        self.retiring: set[int] = set()
+        self.scheduler: Optional[int] = None
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def _fork(self, target: Callable[[], None]) -> int:
+        """Fork a process that shares everything loaded so far, and runs the target."""
+        gc.freeze()
+        pid = os.fork()
+        if pid != 0:
+            return pid
+
+        status = 0
+        try:
+            for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(signum, signal.SIG_DFL)
+            dispose_after_fork()
+            target()
+        except BaseException:
+            logger.exception("The process %s failed", os.getpid())
+            status = 1
+        finally:
+            os._exit(status)
+
+    def spawn(self) -> None:
+        """Fork a worker."""
+        self.pids.add(self._fork(self._serve))
+
+    def spawn_scheduler(self) -> None:
+        """Fork the process that runs the refresh schedule."""
+        self.scheduler = self._fork(self._schedule)
+
+    def _serve(self) -> None:
+        uvicorn.Server(self.config).run(sockets=[self.sock])
+
+    def _schedule(self) -> None:
+        while True:
+            run_pending()
+            time.sleep(1)
+
+    def reap(self) -> None:
+        """Forget the processes that exited, and replace those that weren't retiring."""
+        children = self.pids | self.retiring
+        if self.scheduler is not None:
+            children.add(self.scheduler)
+        for pid in children:
+            try:
+                exited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                exited, status = pid, 0
+            if not exited:
+                continue
+
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            exitcode = os.waitstatus_to_exitcode(status)
+            if pid == self.scheduler:
+                logger.warning("The scheduler %s exited with %s", pid, exitcode)
+                self.spawn_scheduler()
+                continue
+            self.pids.discard(pid)
+            logger.warning("Worker %s exited with %s", pid, exitcode)
+            self.spawn()
+
+    def _terminate(self, pids: set[int]) -> None:
+        for pid in pids:
+            with suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    def reload(self) -> None:
+        """Replace every worker by one forked with the data loaded now."""
+        # Let the data the master no longer serves be collected before freezing again.
+        gc.unfreeze()
+        gc.collect()
+
+        old = self.pids
+        self.pids = set()
+        for _ in range(self.workers):
+            self.spawn()
+        # The new workers accept the connections while the old ones finish theirs.
+        self.retiring |= old
+        self._terminate(old)
+        logger.info("🔁 Replaced %s workers", len(old))
+
+    def stop(self) -> None:
+        """Stop every worker, and kill those that don't finish in time."""
+        # Signals sent to the whole process group reach the master more than once.
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if self.scheduler is not None:
+            self.retiring.add(self.scheduler)
+            self.scheduler = None
+        self._terminate(self.pids | self.retiring)
+
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while (self.pids or self.retiring) and time.monotonic() < deadline:
+            self.retiring |= self.pids
+            self.pids = set()
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in self.retiring:
+            with suppress(ProcessLookupError, ChildProcessError):
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        self.retiring = set()
+
+    def _request_stop(self, signum: int, frame: Optional[FrameType]) -> None:
+        # Only set a flag: raising here could interrupt a fork before its pid is kept.
+        self.stop_requested = True
+
+    def _request_reload(self, signum: int, frame: Optional[FrameType]) -> None:
+        self.reload_requested = True
+
+    def run(self) -> None:
+        """Serve until SIGTERM or SIGINT, following the refreshed data meanwhile."""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            self.spawn_scheduler()
+            logger.info("🚀 Forked %s workers", self.workers)
+
+            followed = time.monotonic()
+            while not self.stop_requested:
+                self.reap()
+
+                generation = data_generation()
+                reload_requested = self.reload_requested
+                if reload_requested:
+                    self.reload_requested = False
+                    preload()
+                elif time.monotonic() - followed >= FOLLOW_INTERVAL:
+                    followed = time.monotonic()
+                    follow_data()
+                if reload_requested or data_generation() != generation:
+                    self.reload()
+                time.sleep(1)
+        finally:
+            self.stop()
+
+
+def listen(host: str, port: int) -> socket.socket:
+    """Open the listening socket that every worker accepts connections on."""
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    return sock
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Preload the app and serve it from forked workers, for use as a command."""
+    parser = argparse.ArgumentParser(
+        description="Serve the API from workers forked off a preloaded master."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=SERVER_WORKERS,
+        help="worker processes (default: $SERVER_WORKERS, or one per CPU)",
+    )
+    parser.add_argument(
+        "--log-level",
+        default="info",
+        choices=["critical", "error", "warning", "info", "debug", "trace"],
+    )
+    args = parser.parse_args(argv)
+
+    # Configures logging for the master and every process forked off it.
+    config = uvicorn.Config(
+        api.app,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    sock = listen(args.host, args.port)
+    preload()
+    Master(sock, worker_count(args.workers), config).run()
+
+
+if __name__ == "__main__":
+    main()
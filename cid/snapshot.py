@@ -0,0 +1,369 @@
+"""Immutable in-memory snapshot of the image data for the hot read endpoints.
+
+The image data only changes when a refresh runs, so the results of the most popular
+lookups can be computed once per refresh and served straight from memory. A snapshot
+is never modified after it is built. Each refresh builds a new one and swaps it in
+with a single assignment, so readers always see one consistent generation.
+
+Each provider's images are held in a dictionary-encoded `ColumnarTable` whose indexes
+answer the lookups by imageId, name, region and version, and whose filters serve the
+paginated listings.
+"""
+
+import logging
+import os
+from collections.abc import Callable, Hashable
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from cid.catalog import Catalog, write_catalog
+from cid.columnar import ColumnarTable, Filter
+from cid.config import CATALOG_PATH
+from cid.crud import LISTINGS, listing_columns, listing_order
+from cid.models import GOOGLE_DEFERRED_COLUMNS, AwsImage, AzureImage, GoogleImage
+from cid.utils import google_version_key, newest_versions_first
+
+logger = logging.getLogger(__name__)
+
+# Most response bodies rendered from a single snapshot that are kept for reuse.
+MAX_RENDERED_BODIES = 64
+
+# Columns that can be filtered on or looked up in each provider's table.
+AWS_INDEXED_COLUMNS = ("arch", "id", "imageId", "name", "region", "version")
+AZURE_INDEXED_COLUMNS = ("architecture", "urn", "version")
+GOOGLE_INDEXED_COLUMNS = ("arch", "family", "name", "version")
+
+
+def _latest_sort_key(version: Optional[str], date: Optional[datetime]) -> tuple:
+    """Order rows like `ORDER BY version DESC, date DESC` does in the database."""
+    # NULLs sort last when ordering in descending order.
+    return (version is not None, version or "", date is not None, date or datetime.min)
+
+
+class Snapshot:
+    """Read-only view of the image data as of a single refresh."""
+
+    __slots__ = (
+        "_aws_latest",
+        "catalog",
+        "_aws_versions",
+        "_azure_versions",
+        "_google_versions",
+        "_rendered",
+        "aws",
+        "azure",
+        "built_at",
+        "google",
+    )
+
+    def __init__(
+        self,
+        aws: ColumnarTable,
+        azure: ColumnarTable,
+        google: ColumnarTable,
+        catalog: Optional[Catalog] = None,
+    ) -> None:
+        self.built_at = datetime.now()
+        self.catalog = catalog
+        self.aws = aws
+        self.azure = azure
+        self.google = google
+
+        self._aws_versions = tuple(newest_versions_first(aws.distinct("version")))
+        self._azure_versions = tuple(
+            newest_versions_first({
+                ".".join(version.split(".")[:2])
+                for version in azure.distinct("version")
+            })
+        )
+        self._google_versions = tuple(
+            newest_versions_first(google.distinct("version"), google_version_key)
+        )
+        self._aws_latest = self._build_aws_latest()
+        self._rendered: dict[Hashable, bytes] = {}
+
+    def _build_aws_latest(self) -> dict[str, dict]:
+        """Find the latest non-beta image for each architecture and its AMIs."""
+        latest_rows: dict[str, dict] = {}
+        for arch in self.aws.distinct("arch"):
+            latest_key = None
+            for position in self.aws.positions("arch", arch):
+                name = self.aws.value("name", position)
+                # The database matches `NOT LIKE '%BETA%'` without regard to case.
+                if name is None or "BETA" in name.upper():
+                    continue
+                key = _latest_sort_key(
+                    self.aws.value("version", position),
+                    self.aws.value("date", position),
+                )
+                if latest_key is None or key > latest_key:
+                    latest_key = key
+                    latest_rows[arch] = self.aws.row(position)
+
+        latest = {}
+        for arch, latest_row in latest_rows.items():
+            # Keep the first AMI found in each region, just like the database query.
+            amis_by_region: dict[str, str] = {}
+            for position in self.aws.positions("name", latest_row["name"]):
+                row = self.aws.row(position)
+                if row["arch"] == arch and row["region"] is not None:
+                    amis_by_region.setdefault(row["region"], row["imageId"])
+
+            latest[arch] = {
+                "name": latest_row["name"],
+                "version": latest_row["version"],
+                "date": latest_row["date"],
+                "amis": {
+                    region: amis_by_region[region] for region in sorted(amis_by_region)
+                },
+            }
+        return latest
+
+    def rendered(self, key: Hashable, render: Callable[[], bytes]) -> bytes:
+        """Return a response body rendered from this snapshot, rendering it only once.
+
+        This is the only state that changes after the snapshot is built. It is a plain
+        memo, so two threads racing to render the same body is harmless.
+        """
+        body = self._rendered.get(key)
+        if body is None:
+            body = render()
+            if len(self._rendered) < MAX_RENDERED_BODIES:
+                self._rendered[key] = body
+        return body
+
+    def aws_regions(self) -> list[str]:
+        """Get all AWS regions."""
+        return self.aws.distinct("region")
+
+    def latest_aws_image(self, arch: Optional[str]) -> dict[str, Any]:
+        """Get the latest RHEL image on AWS."""
+        archs = [arch] if arch is not None else list(self._aws_latest)
+
+        latest_images_dict = {}
+        for arch in archs:
+            latest_image = self._aws_latest.get(arch)
+            if latest_image is None:
+                continue
+            latest_images_dict[arch] = {
+                **latest_image,
+                "amis": dict(latest_image["amis"]),
+            }
+
+        if not latest_images_dict:
+            return {"error": "No images found for AWS.", "code": 404}
+
+        return latest_images_dict
+
+    def find_matching_ami(self, image_id: str) -> dict:
+        """Given a single AMI, find matching AMIs in other regions."""
+        positions = self.aws.positions("imageId", image_id)
+
+        if not positions:
+            return {"error": "No images found", "code": 404}
+
+        image = self.aws.row(positions[0])
+        matching_images = [
+            self.aws.row(position)
+            for position in self.aws.positions("name", image["name"])
+        ]
+
+        return {
+            "ami": image["imageId"],
+            "name": image["name"],
+            "version": image["version"],
+            "region": image["region"],
+            "matching_images": [
+                {"region": row["region"], "ami": row["imageId"]}
+                for row in matching_images
+            ],
+        }
+
+    def find_images_for_version(self, version: str) -> list:
+        """Return all AWS images for a specific version of RHEL."""
+        positions = self.aws.positions("version", version)
+        rows = [self.aws.row(position) for position in positions]
+        return [{"ami": row["id"], "name": row["name"]} for row in rows]
+
+    def find_available_aws_versions(self) -> list:
+        """Return all RHEL versions available from AWS."""
+        return list(self._aws_versions)
+
+    def find_available_azure_versions(self) -> list:
+        """Return all RHEL versions available from Azure."""
+        return list(self._azure_versions)
+
+    def find_available_google_versions(self) -> list:
+        """Return all RHEL versions available from Google Cloud."""
+        return list(self._google_versions)
+
+    def find_aws_images(
+        self,
+        arch: Optional[str] = None,
+        version: Optional[str] = None,
+        name: Optional[str] = None,
+        region: Optional[str] = None,
+        image_id: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 100,
+        fields: Optional[str] = None,
+    ) -> dict:
+        """Return paginated AWS images that match the given criteria."""
+        filters = []
+        if arch:
+            filters.append(Filter("arch", arch))
+        if version:
+            filters.append(Filter("version", version))
+        if name:
+            filters.append(Filter("name", name, contains=True))
+        if region:
+            filters.append(Filter("region", region))
+        if image_id:
+            filters.append(Filter("id", image_id))
+
+        columns = listing_columns(AwsImage.__table__, fields)
+        return self.aws.find(filters, page, page_size, columns)
+
+    def find_azure_images(
+        self,
+        arch: Optional[str] = None,
+        version: Optional[str] = None,
+        urn: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 100,
+        fields: Optional[str] = None,
+    ) -> dict:
+        """Return paginated Azure images that match the given criteria."""
+        filters = []
+        if arch:
+            filters.append(Filter("architecture", arch))
+        if version:
+            filters.append(Filter("version", version, contains=True))
+        if urn:
+            filters.append(Filter("urn", urn, contains=True))
+
+        columns = listing_columns(AzureImage.__table__, fields)
+        return self.azure.find(filters, page, page_size, columns)
+
+    def find_google_images(
+        self,
+        arch: Optional[str] = None,
+        version: Optional[str] = None,
+        name: Optional[str] = None,
+        family: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 100,
+        fields: Optional[str] = None,
+    ) -> dict:
+        """Return paginated Google images that match the given criteria."""
+        filters = []
+        if arch:
+            filters.append(Filter("arch", arch))
+        if version:
+            filters.append(Filter("version", version))
+        if name:
+            filters.append(Filter("name", name, contains=True))
+        if family:
+            filters.append(Filter("family", family))
+
+        columns = listing_columns(
+            GoogleImage.__table__, fields, GOOGLE_DEFERRED_COLUMNS
+        )
+        return self.google.find(filters, page, page_size, columns)
+
+
+def _load_table(
+    db: Session, cloud_provider: str, indexed: tuple[str, ...]
+) -> ColumnarTable:
+    """Read a whole table, in listing order, into a columnar table."""
+    table, order_by = LISTINGS[cloud_provider]
+    rows = db.execute(select(table).order_by(*listing_order(table, order_by))).all()
+    return ColumnarTable.from_rows(table.columns.keys(), rows, indexed)
+
+
+def load_tables(db: Session) -> dict[str, ColumnarTable]:
+    """Read the image data of every provider from the database into columnar tables."""
+    return {
+        "aws": _load_table(db, "aws", AWS_INDEXED_COLUMNS),
+        "azure": _load_table(db, "azure", AZURE_INDEXED_COLUMNS),
+        "google": _load_table(db, "google", GOOGLE_INDEXED_COLUMNS),
+    }
+
+
+def build_snapshot(db: Session) -> Snapshot:
+    """Read the image data from the database into a new snapshot."""
+    tables = load_tables(db)
+    return Snapshot(aws=tables["aws"], azure=tables["azure"], google=tables["google"])
+
+
+def open_catalog_snapshot(path: str) -> Snapshot:
+    """Map a catalog file and build a snapshot whose tables live in it."""
+    catalog = Catalog(path)
+    return Snapshot(
+        aws=catalog.table("aws"),
+        azure=catalog.table("azure"),
+        google=catalog.table("google"),
+        catalog=catalog,
+    )
+
+
+# The snapshot currently being served. Readers grab the reference once per request
+# and keep using it, so replacing it never disturbs a request that is in flight.
+_current: Optional[Snapshot] = None
+
+
+def current_snapshot() -> Optional[Snapshot]:
+    """Return the snapshot being served, if one has been built."""
+    return _current
+
+
+def refresh_snapshot(db: Session) -> Snapshot:
+    """Build a new snapshot from the database and start serving it.
+
+    When a catalog path is configured, the snapshot is written to the catalog first
+    and then served from the mapped file, which every worker process can share.
+    """
+    global _current
+
+    if CATALOG_PATH:
+        write_catalog(CATALOG_PATH, load_tables(db))
+        snapshot = open_catalog_snapshot(CATALOG_PATH)
+    else:
+        snapshot = build_snapshot(db)
+    _current = snapshot
+
+    logger.info("📸 Built a new in-memory snapshot of the image data")
+    return snapshot
+
+
+def load_catalog() -> Optional[Snapshot]:
+    """Start serving the snapshot in the catalog file, if there is one."""
+    global _current
+
+    if not CATALOG_PATH or not os.path.exists(CATALOG_PATH):
+        return None
+
+    snapshot = open_catalog_snapshot(CATALOG_PATH)
+    _current = snapshot
+
+    logger.info("📸 Mapped the image catalog from %s", CATALOG_PATH)
+    return snapshot
+
+
+def reload_catalog_if_changed() -> bool:
+    """Switch to a new catalog file once another process has written one."""
+    snapshot = _current
+    if snapshot is None or snapshot.catalog is None or snapshot.catalog.is_current():
+        return False
+
+    return load_catalog() is not None
+
+
+def clear_snapshot() -> None:
+    """Stop serving from a snapshot and fall back to the database."""
+    global _current
+
+    _current = None
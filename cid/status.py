@@ -0,0 +1,50 @@
+"""Status of the image data, recorded once per refresh.
+
+The root endpoint reports how many images each provider has and when the data was
+last updated. Those values only change when a refresh runs, so they are counted
+right after it instead of on every request.
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from cid import crud
+from cid.cache import set_data_version
+
+logger = logging.getLogger(__name__)
+
+_status: Optional[dict[str, Any]] = None
+
+
+def record_status(db: Session) -> dict[str, Any]:
+    """Count the images of every provider and remember them until the next refresh."""
+    global _status
+
+    images = {
+        cloud_provider: db.scalar(select(func.count()).select_from(table)) or 0
+        for cloud_provider, (table, _) in crud.LISTINGS.items()
+    }
+    _status = {
+        "images": images,
+        "last_update": crud.get_last_update(db),
+        "recorded_at": datetime.now(),
+    }
+    # Responses are validated by the update of the data they are served from.
+    set_data_version(_status["last_update"])
+    logger.info("📊 Recorded image counts %s", images)
+    return _status
+
+
+def current_status() -> Optional[dict[str, Any]]:
+    """Return the status recorded after the last refresh, if there is one."""
+    return _status
+
+
+def clear_status() -> None:
+    """Forget the recorded status, so the next request records it again."""
+    global _status
+    _status = None
@@ -1,12 +1,19 @@
-"""General utilities for the CID package."""
+"""General utilities for the CID package.
+
+httpx and packaging are only imported once they are used, since neither is needed to
+start serving requests.
+"""
 
 import logging
 import re
-
-import httpx
+from collections.abc import Callable, Iterable
+from typing import TYPE_CHECKING
 
 from cid.config import AWS_IMAGE_DATA, AZURE_IMAGE_DATA, GOOGLE_IMAGE_DATA
 
+if TYPE_CHECKING:
+    from packaging.version import Version
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,6 +23,12 @@ class InvalidCloudProvider(Exception):
     pass
 
 
+class InvalidFields(Exception):
+    """When fields are requested that an image does not have."""
+
+    pass
+
+
 def get_json_data(cloud_provider: str) -> list[dict]:
     """Get image data from the retriever."""
     match cloud_provider:
@@ -27,6 +40,9 @@ def get_json_data(cloud_provider: str) -> list[dict]:
             data_url = GOOGLE_IMAGE_DATA
         case _:
             raise InvalidCloudProvider(cloud_provider)
+
+    import httpx
+
     response = httpx.get(data_url)
     return list(response.json()) if response.json() else []
 
@@ -41,3 +57,27 @@ def extract_google_version(image_name: str) -> str:
     """Extract the RHEL version from a Google image name."""
     match = re.findall(r"rhel-(\d{1,2}(?:-arm64)*)", image_name)
     return str(match[0].replace("-", ".")) if match else ""
+
+
+def version_key(version: str) -> "Version":
+    """Sort key for RHEL versions."""
+    from packaging.version import Version
+
+    return Version(version)
+
+
+def google_version_key(version: str) -> "Version":
+    """Sort key for Google versions, which may carry a non-numeric suffix like arm64."""
+    parts = [part for part in version.split(".") if part.isdigit()]
+    return version_key(".".join(parts))
+
+
+def newest_versions_first(
+    versions: Iterable[str], key: Callable[[str], "Version"] = version_key
+) -> list[str]:
+    """Sort versions newest first.
+
+    Versions that sort as equal, like 9 and 9.arm64 on Google, are ordered by the
+    version string, so the database and the snapshot list them in the same order.
+    """
+    return sorted(versions, key=lambda version: (key(version), version), reverse=True)
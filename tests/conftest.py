@@ -1,7 +1,10 @@
 """Shared items for testing."""
 
+import json
+
 import pytest
 
+from cid import crud
 from cid.database import SessionLocal, engine
 from cid.models import AwsImage, AzureImage, GoogleImage
 
@@ -17,9 +20,20 @@ def db():
 
     yield db
 
+    # End the session first: PostgreSQL waits for open transactions before dropping.
+    db.rollback()
+    db.close()
+
     AwsImage.metadata.drop_all(bind=engine)
     AzureImage.metadata.drop_all(bind=engine)
     GoogleImage.metadata.drop_all(bind=engine)
 
-    db.rollback()
-    db.close()
+
+@pytest.fixture(scope="function")
+def loaded_db(db):
+    """Yield a database session populated with the test data of every provider."""
+    for cloud_provider in ("aws", "azure", "google"):
+        with open(f"tests/data/{cloud_provider}.json") as fileh:
+            getattr(crud, f"import_{cloud_provider}_images")(db, json.load(fileh))
+
+    yield db
@@ -0,0 +1,144 @@
+"""Test admitting a bounded number of requests to the expensive endpoints."""
+
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from cid import admission, main
+
+
+def test_limiter_queues_then_rejects():
+    limiter = admission.Limiter(concurrency=1, queue=1, timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(admission.Overloaded):
+            await limiter.acquire()
+
+        # The slot is handed over to the queued request.
+        limiter.release()
+        await queued
+        assert limiter.stats() == {
+            "active": 1,
+            "waiting": 0,
+            "admitted": 2,
+            "rejected": 1,
+        }
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.active == 0
+
+
+def test_limiter_wait_times_out():
+    limiter = admission.Limiter(concurrency=1, queue=1, timeout=0.01)
+
+    async def scenario():
+        await limiter.acquire()
+        with pytest.raises(admission.Overloaded):
+            await limiter.acquire()
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.stats() == {"active": 0, "waiting": 0, "admitted": 1, "rejected": 1}
+
+
+def test_limiter_forgets_cancelled_waiters():
+    limiter = admission.Limiter(concurrency=1, queue=1, timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+        limiter.release()
+        # The queue has room again.
+        await limiter.acquire()
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.stats()["active"] == 0
+
+
+def test_limiter_release_skips_cancelled_waiter():
+    limiter = admission.Limiter(concurrency=1, queue=2, timeout=1)
+
+    async def scenario():
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # The waiter is cancelled right away, and released before its task resumes.
+        queued.cancel()
+        limiter.release()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+    asyncio.run(scenario())
+    assert limiter.stats() == {"active": 0, "waiting": 0, "admitted": 1, "rejected": 0}
+
+
+@pytest.mark.parametrize(
+    "path, expensive",
+    [
+        ("/aws", True),
+        ("/google/export", True),
+        ("/aws/latest", False),
+        ("/azure/images/urn", False),
+    ],
+)
+def test_limiter_per_expensive_endpoint(path, expensive):
+    control = admission.AdmissionControl(4, 16, 5, 1)
+    assert (control.limiter(path) is not None) is expensive
+
+    disabled = admission.AdmissionControl(0, 16, 5, 1)
+    assert disabled.limiter(path) is None
+
+
+def test_overloaded_endpoint_sheds_load():
+    queries = []
+
+    async def run(db, function, *args):
+        queries.append(function.__name__)
+        await asyncio.sleep(0.05)
+        return {"results": [], "page": 1, "page_size": 1}
+
+    async def get_db():
+        yield None
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            # Different pages, so the requests aren't coalesced.
+            return await asyncio.gather(
+                *(client.get(f"/aws?page={page}") for page in range(1, 5)),
+                client.get("/aws/latest"),
+            )
+
+    control = admission.AdmissionControl(1, 1, 5, 7)
+    with (
+        patch.object(admission, "admission_control", control),
+        patch.object(main.async_crud, "run", run),
+        patch.dict(main.app.dependency_overrides, {main.get_db: get_db}),
+    ):
+        responses = asyncio.run(scenario())
+
+    statuses = [response.status_code for response in responses]
+    # One request runs and one waits for it, the others are refused right away.
+    assert sorted(statuses[:4]) == [200, 200, 503, 503]
+    assert statuses[4] == 200
+    for response in responses[:4]:
+        if response.status_code == 503:
+            assert response.headers["Retry-After"] == "7"
+    assert control.stats() == {
+        "/aws": {"active": 0, "waiting": 0, "admitted": 2, "rejected": 2}
+    }
@@ -0,0 +1,116 @@
+"""Tests for the downloadable loaded_db artifacts."""
+
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cid import artifacts, crud
+from cid.main import app
+
+
+def test_build_artifacts(loaded_db, tmp_path):
+    manifest = artifacts.build_artifacts(loaded_db, str(tmp_path))
+
+    assert artifacts.read_manifest(str(tmp_path)) == manifest
+    assert artifacts.read_manifest(str(tmp_path), manifest["version"]) == manifest
+
+    names = [entry["name"] for entry in manifest["files"]]
+    assert "aws.ndjson.gz" in names
+    assert "google.sqlite" in names
+    assert ("azure.parquet" in names) == artifacts.HAS_PYARROW
+
+    for entry in manifest["files"]:
+        path = tmp_path / manifest["version"] / entry["name"]
+        assert entry["size"] == path.stat().st_size
+        assert entry["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+
+    aws = crud.find_aws_images(loaded_db, page_size=1000)
+    path = tmp_path / manifest["version"] / "aws.ndjson.gz"
+    lines = gzip.decompress(path.read_bytes()).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [
+        image["id"] for image in aws["results"]
+    ]
+
+    path = tmp_path / manifest["version"] / "google.sqlite"
+    assert path.stat().st_mode & 0o222 == 0
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        (count,) = connection.execute("SELECT count(*) FROM google_images").fetchone()
+        (licenses,) = connection.execute(
+            "SELECT licenses FROM google_images"
+        ).fetchone()
+    google = [entry for entry in manifest["files"] if entry["name"] == "google.sqlite"]
+    assert count == google[0]["rows"] > 0
+    assert json.loads(licenses)
+
+
+def test_build_artifacts_keeps_previous_version(loaded_db, tmp_path):
+    versions = [
+        artifacts.build_artifacts(loaded_db, str(tmp_path))["version"] for _ in range(3)
+    ]
+
+    assert sorted(os.listdir(tmp_path)) == sorted([*versions[1:], "manifest.json"])
+    assert artifacts.read_manifest(str(tmp_path))["version"] == versions[2]
+    assert artifacts.read_manifest(str(tmp_path), versions[0]) is None
+
+
+def test_build_parquet_artifacts(loaded_db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    manifest = artifacts.build_artifacts(loaded_db, str(tmp_path))
+    table = pq.read_table(tmp_path / manifest["version"] / "google.parquet")
+    assert table.num_rows == crud.find_google_images(loaded_db)["total_count"]
+    assert json.loads(table.column("licenses")[0].as_py())
+
+
+def test_read_manifest_rejects_bad_versions(tmp_path):
+    assert artifacts.read_manifest(str(tmp_path)) is None
+    assert artifacts.read_manifest(str(tmp_path), "../etc") is None
+    assert artifacts.find_artifact(str(tmp_path), "latest", "aws.sqlite") is None
+
+
+def test_artifact_endpoints(loaded_db, tmp_path):
+    manifest = artifacts.build_artifacts(loaded_db, str(tmp_path))
+    entry = manifest["files"][0]
+    content = (tmp_path / manifest["version"] / entry["name"]).read_bytes()
+
+    client = TestClient(app)
+    with patch("cid.main.ARTIFACTS_DIR", str(tmp_path)):
+        listing = client.get("/artifacts/latest")
+        full = client.get(f"/artifacts/latest/{entry['name']}")
+        partial = client.get(
+            f"/artifacts/{manifest['version']}/{entry['name']}",
+            headers={"Range": "bytes=0-9"},
+        )
+        revalidated = client.get(
+            f"/artifacts/latest/{entry['name']}",
+            headers={"If-None-Match": full.headers["ETag"]},
+        )
+        missing = client.get("/artifacts/latest/aws.exe")
+
+    assert listing.json() == manifest
+
+    assert full.status_code == 200
+    assert full.content == content
+    assert full.headers["ETag"] == f'"{entry["sha256"]}"'
+    assert full.headers["Repr-Digest"].startswith("sha-256=:")
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" not in full.headers["Cache-Control"]
+
+    assert partial.status_code == 206
+    assert partial.content == content[:10]
+    assert "immutable" in partial.headers["Cache-Control"]
+
+    assert revalidated.status_code == 304
+    assert missing.status_code == 404
+
+
+def test_artifact_endpoints_without_artifacts():
+    with patch("cid.main.ARTIFACTS_DIR", ""):
+        response = TestClient(app).get("/artifacts/latest")
+    assert response.status_code == 404
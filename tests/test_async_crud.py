@@ -0,0 +1,193 @@
+"""Test running the crud read functions from async code."""
+
+import asyncio
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from unittest.mock import patch
+
+import pytest
+import tomllib
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from cid import async_crud, crud, database
+from cid.main import app
+from cid.models import Base
+from cid.status import clear_status
+
+
+def load_test_data(db):
+    for cloud_provider in ("aws", "azure", "google"):
+        with open(f"tests/data/{cloud_provider}.json") as fileh:
+            getattr(crud, f"import_{cloud_provider}_images")(db, json.load(fileh))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """Yield the URL of a SQLite database with the test data, and a session of it.
+
+    Sessions of an in-memory database can't be used from the thread pool, which has
+    its own connections.
+    """
+    url = f"sqlite:///{tmp_path / 'cid.db'}"
+    engine = database.build_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    load_test_data(db)
+
+    yield url, db
+
+    db.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def async_session(sqlite_db):
+    """Yield a factory of asyncio sessions reading the SQLite database."""
+    url = database.async_url(sqlite_db[0])
+    if url is None:
+        pytest.skip("needs greenlet and aiosqlite")
+
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    engine = database.build_async_engine(url, read_only=True)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+
+    asyncio.run(engine.dispose())
+
+
+def test_run_with_sync_session(sqlite_db):
+    _, db = sqlite_db
+
+    versions = asyncio.run(async_crud.run(db, crud.find_available_aws_versions))
+
+    assert not async_crud.is_async(db)
+    assert versions == crud.find_available_aws_versions(db)
+
+
+def test_iterate_with_sync_session(sqlite_db):
+    _, db = sqlite_db
+    _, rows = crud.export_azure_images(db)
+
+    async def collect():
+        return [row async for row in async_crud.iterate(db, rows)]
+
+    assert len(asyncio.run(collect())) == 152
+
+
+def test_run_with_async_session(sqlite_db, async_session):
+    """The crud functions return the same results through the asyncio engine."""
+    _, db = sqlite_db
+
+    async def read():
+        async with async_session() as session:
+            assert async_crud.is_async(session)
+            return (
+                await async_crud.run(session, crud.find_aws_images, "x86_64"),
+                await async_crud.run(session, crud.latest_google_image, None),
+                await async_crud.run(session, crud.find_image, "azure", "missing"),
+            )
+
+    listing, latest, missing = asyncio.run(read())
+
+    assert listing == crud.find_aws_images(db, "x86_64")
+    assert latest == crud.latest_google_image(db, None)
+    assert missing is None
+
+
+def test_iterate_with_async_session(sqlite_db, async_session):
+    """Exports are streamed a batch at a time through the asyncio engine."""
+    _, db = sqlite_db
+
+    async def export():
+        async with async_session() as session:
+            _, rows = await async_crud.run(session, crud.export_aws_images)
+            return [dict(row) async for row in async_crud.iterate(session, rows)]
+
+    _, rows = crud.export_aws_images(db)
+    assert asyncio.run(export()) == [dict(row) for row in rows]
+
+
+def test_endpoints_with_async_session(sqlite_db, async_session):
+    """Requests read through the asyncio engine when it is available."""
+    _, db = sqlite_db
+    clear_status()
+
+    with (
+        patch("cid.main.AsyncReadSessionLocal", async_session),
+        TestClient(app) as client,
+    ):
+        root = client.get("/")
+        listing = client.get("/aws", params={"arch": "arm64", "page_size": 2})
+        image = client.get("/azure/images/missing")
+        export = client.get("/google/export")
+
+    clear_status()
+    assert root.json()["images"] == {"aws": 500, "azure": 152, "google": 4}
+    assert (
+        listing.json()["total_count"]
+        == crud.find_aws_images(db, "arm64")["total_count"]
+    )
+    assert image.status_code == 404
+    assert len(export.text.splitlines()) == 4
+
+
+# Packages only used when they are installed.
+OPTIONAL_PACKAGES = {
+    "aiosqlite",
+    "asyncpg",
+    "greenlet",
+    "orjson",
+    "brotli",
+    "zstandard",
+    "msgpack",
+    "pyarrow",
+    "boto3",
+}
+
+
+def test_optional_dependencies_are_declared():
+    """Every optional dependency can be installed through one of the extras."""
+    with open("pyproject.toml", "rb") as fileh:
+        poetry = tomllib.load(fileh)["tool"]["poetry"]
+
+    extras = {package for packages in poetry["extras"].values() for package in packages}
+    assert extras >= OPTIONAL_PACKAGES
+    for package in extras:
+        assert poetry["dependencies"][package]["optional"]
+
+
+@pytest.mark.skipif(
+    importlib.util.find_spec("aiosqlite") is None or not database.HAS_ASYNCIO,
+    reason="needs the async extra",
+)
+def test_async_extra_serves_requests(sqlite_db):
+    """With the async extra installed, requests read through the asyncio engine."""
+    url, db = sqlite_db
+    script = """
+import json
+from fastapi.testclient import TestClient
+from cid import database, main
+assert database.async_read_engine.dialect.driver == "aiosqlite"
+with TestClient(main.app) as client:
+    response = client.get("/aws/latest", params={"arch": "arm64"})
+assert response.status_code == 200, response.text
+print(json.dumps(response.json()))
+"""
+    completed = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script],
+        env={**os.environ, "DATABASE_URL": url, "ENVIRONMENT": "testing"},
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=False,
+    )
+
+    assert completed.returncode == 0, completed.stderr
+    served = json.loads(completed.stdout.splitlines()[-1])
+    assert (
+        served["arm64"]["name"] == crud.latest_aws_image(db, "arm64")["arm64"]["name"]
+    )
@@ -0,0 +1,281 @@
+"""Tests for the response cache."""
+
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from cid import cache, crud, database
+from cid.main import app, get_db
+from cid.models import Base
+
+
+@pytest.fixture(scope="function")
+def response_cache():
+    """Yield an empty response cache that the app uses for the duration of a test."""
+    cache.response_cache.clear()
+    with patch("cid.main.RESPONSE_CACHE_ENABLED", True):
+        yield cache.response_cache
+    cache.response_cache.clear()
+
+
+def test_key_ignores_parameter_order():
+    response_cache = cache.ResponseCache(10, 1000, 60)
+    assert response_cache.key("/aws", [("arch", "x86_64"), ("page", "2")]) == (
+        response_cache.key("/aws", [("page", "2"), ("arch", "x86_64")])
+    )
+    assert response_cache.key("/aws", [("page", "2")]) != response_cache.key(
+        "/aws", [("page", "3")]
+    )
+
+
+def test_evicts_least_recently_used_entries():
+    response_cache = cache.ResponseCache(2, 1000, 60)
+    first, second, third = (response_cache.key(f"/{n}", []) for n in range(3))
+
+    response_cache.put(first, 200, [], b"1")
+    response_cache.put(second, 200, [], b"2")
+    assert response_cache.get(first) is not None
+
+    response_cache.put(third, 200, [], b"3")
+    assert response_cache.get(second) is None
+    assert response_cache.get(first) is not None
+    assert response_cache.get(third) is not None
+    assert response_cache.stats() == {
+        "entries": 2,
+        "bytes": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+    }
+
+
+def test_evicts_by_size():
+    response_cache = cache.ResponseCache(10, 10, 60)
+    first, second = (response_cache.key(f"/{n}", []) for n in range(2))
+
+    response_cache.put(first, 200, [], b"x" * 6)
+    response_cache.put(second, 200, [], b"y" * 6)
+    assert response_cache.get(first) is None
+    assert response_cache.get(second).body == b"y" * 6
+
+    # Bodies larger than the whole cache are never stored.
+    response_cache.put(first, 200, [], b"z" * 11)
+    assert response_cache.get(first) is None
+
+
+def test_entries_expire():
+    response_cache = cache.ResponseCache(10, 1000, 60)
+    key = response_cache.key("/aws", [])
+
+    with patch("cid.cache.monotonic", return_value=100.0):
+        response_cache.put(key, 200, [], b"{}")
+    with patch("cid.cache.monotonic", return_value=159.0):
+        assert response_cache.get(key) is not None
+    with patch("cid.cache.monotonic", return_value=160.0):
+        assert response_cache.get(key) is None
+
+
+def test_bump_generation_invalidates_entries(response_cache):
+    old_key = response_cache.key("/aws", [])
+    response_cache.put(old_key, 200, [], b"{}")
+
+    cache.bump_generation()
+    assert response_cache.key("/aws", []) != old_key
+    assert response_cache.get(old_key) is None
+
+    # Responses rendered from the previous generation are not stored.
+    response_cache.put(old_key, 200, [], b"{}")
+    assert response_cache.stats()["entries"] == 0
+
+
+@patch("cid.crud.find_available_aws_versions", return_value=["9.4"])
+def test_cache_hit_skips_database(mock_versions, response_cache):
+    sessions = []
+
+    def counting_get_db():
+        sessions.append(None)
+        yield None
+
+    client = TestClient(app)
+    with patch.dict(app.dependency_overrides, {get_db: counting_get_db}):
+        first = client.get("/aws/versions")
+        second = client.get("/aws/versions")
+
+        cache.bump_generation()
+        third = client.get("/aws/versions")
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert third.headers["X-Cache"] == "MISS"
+    assert first.json() == second.json() == third.json() == ["9.4"]
+    assert len(sessions) == 2
+    assert mock_versions.call_count == 2
+
+
+def test_uncacheable_requests_bypass_cache(response_cache):
+    misses = response_cache.stats()["misses"]
+
+    client = TestClient(app)
+    response = client.get("/docs")
+    assert "X-Cache" not in response.headers
+    assert response_cache.stats()["misses"] == misses
+
+
+@pytest.fixture
+def data_version():
+    """Serve image data last updated at a known time for the duration of a test."""
+    previous = cache._data_version, cache._last_modified
+    cache.set_data_version("2024-05-01 12:00:00")
+    yield
+    cache._data_version, cache._last_modified = previous
+
+
+@patch("cid.crud.find_available_aws_versions", return_value=["9.4"])
+def test_conditional_request_not_modified(mock_versions, data_version):
+    client = TestClient(app)
+
+    response = client.get("/aws/versions")
+    assert response.status_code == 200
+    tag = response.headers["ETag"]
+    assert tag.startswith('"')
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    assert response.headers["Last-Modified"] == "Wed, 01 May 2024 12:00:00 GMT"
+
+    response = client.get("/aws/versions", headers={"If-None-Match": f"W/{tag}"})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == tag
+    assert not response.content
+    assert mock_versions.call_count == 1
+
+    last_modified = client.get("/aws/versions").headers["Last-Modified"]
+    response = client.get("/aws/versions", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+    # Another generation of the same data in this process keeps the validators.
+    cache.bump_generation()
+    response = client.get("/aws/versions", headers={"If-None-Match": tag})
+    assert response.status_code == 304
+
+    cache.set_data_version("2024-05-02 12:00:00")
+    response = client.get("/aws/versions", headers={"If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != tag
+    assert response.headers["Last-Modified"] == "Thu, 02 May 2024 12:00:00 GMT"
+
+
+@patch("cid.crud.find_image", return_value=None)
+def test_any_tag_only_matches_existing_resources(mock_find_image, data_version):
+    """`*` and If-Modified-Since don't turn errors into a 304."""
+    client = TestClient(app)
+    with patch.dict(app.dependency_overrides, {get_db: lambda: (yield None)}):
+        missing = client.get("/aws/images/nope", headers={"If-None-Match": "*"})
+        since = client.get(
+            "/aws/images/nope",
+            headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+        )
+        invalid = client.get("/aws?page=abc", headers={"If-None-Match": "*"})
+
+    assert missing.status_code == 404
+    assert since.status_code == 404
+    assert invalid.status_code == 422
+
+
+@patch("cid.crud.find_available_aws_versions", return_value=["9.4"])
+def test_any_tag_matches_existing_resource(mock_versions, data_version):
+    client = TestClient(app)
+
+    response = client.get("/aws/versions", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 304
+    assert not response.content
+    assert response.headers["ETag"] == client.get("/aws/versions").headers["ETag"]
+
+
+@patch("cid.crud.find_available_aws_versions", return_value=["9.4"])
+def test_any_tag_matches_cached_response(mock_versions, response_cache, data_version):
+    client = TestClient(app)
+    client.get("/aws/versions")
+
+    response = client.get("/aws/versions", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 304
+    assert mock_versions.call_count == 1
+
+
+def test_validators_come_from_data(tmp_path):
+    """Processes started at different times on the same data send the same validators."""
+    path = tmp_path / "cid.db"
+    engine = database.build_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db:
+        crud.update_last_updated(db)
+        last_update = crud.get_last_update(db)
+    engine.dispose()
+
+    script = (
+        "from fastapi.testclient import TestClient; from cid.main import app; "
+        "headers = TestClient(app).get('/aws/versions').headers; "
+        "print(headers['ETag'], headers['Last-Modified'])"
+    )
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}"}
+    outputs = []
+    for _ in range(2):
+        output = subprocess.check_output(  # noqa: S603
+            [sys.executable, "-c", script], env=env, text=True
+        )
+        outputs.append(output.splitlines()[-1])
+        time.sleep(1.1)
+
+    assert outputs[0] == outputs[1]
+    expected = datetime.fromisoformat(last_update).replace(tzinfo=timezone.utc)
+    assert outputs[0].endswith(format_datetime(expected, usegmt=True))
+
+
+def test_validators_without_data_version():
+    with patch.multiple(cache, _data_version=None, _last_modified=None):
+        headers = cache.caching_headers(cache.etag("/aws", []))
+        assert "Last-Modified" not in headers
+        assert headers["Cache-Control"] == "public, max-age=0"
+        assert not cache.is_not_modified('"abc"', None, "Fri, 01 Jan 2100 00:00:00 GMT")
+
+
+def test_matches_etag():
+    assert cache.matches_etag('"abc"', 'W/"abc"')
+    assert cache.matches_etag('"abc"', '"xyz", "abc"')
+    assert not cache.matches_etag('"abc"', "*")
+    assert not cache.matches_etag('"abc"', None)
+
+
+def test_etag_depends_on_request():
+    assert cache.etag("/aws", [("arch", "x86_64")]) == cache.etag(
+        "/aws", [("arch", "x86_64")]
+    )
+    assert cache.etag("/aws", [("arch", "x86_64")]) != cache.etag(
+        "/aws", [("arch", "arm64")]
+    )
+    assert cache.etag("/aws", []) != cache.etag("/azure", [])
+
+
+@pytest.mark.parametrize(
+    "if_none_match, if_modified_since, expected",
+    [
+        (None, None, False),
+        ('"abc"', None, True),
+        ('"nope", W/"abc"', None, True),
+        ("*", None, True),
+        ('"nope"', "Fri, 01 Jan 2100 00:00:00 GMT", False),
+        (None, "Fri, 01 Jan 2100 00:00:00 GMT", True),
+        (None, "Thu, 01 Jan 1970 00:00:00 GMT", False),
+        (None, "not a date", False),
+    ],
+)
+def test_is_not_modified(if_none_match, if_modified_since, expected, data_version):
+    assert cache.is_not_modified('"abc"', if_none_match, if_modified_since) is expected
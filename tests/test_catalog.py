@@ -0,0 +1,83 @@
+"""Tests for the memory-mapped catalog."""
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+from cid import catalog, snapshot
+
+
+@pytest.fixture(scope="function")
+def snapshots(loaded_db, tmp_path):
+    """Yield a snapshot built in memory and the same snapshot read from a catalog."""
+    path = str(tmp_path / "catalog.bin")
+    catalog.write_catalog(path, snapshot.load_tables(loaded_db))
+
+    yield snapshot.build_snapshot(loaded_db), snapshot.open_catalog_snapshot(path)
+
+
+def test_catalog_tables_match(snapshots):
+    in_memory, mapped = snapshots
+
+    for name in ("aws", "azure", "google"):
+        expected = getattr(in_memory, name)
+        table = getattr(mapped, name)
+        assert table.size == expected.size
+        assert [table.row(i) for i in range(table.size)] == [
+            expected.row(i) for i in range(expected.size)
+        ]
+
+
+def test_catalog_lookups_match(snapshots):
+    in_memory, mapped = snapshots
+
+    assert mapped.aws_regions() == in_memory.aws_regions()
+    assert mapped.latest_aws_image(None) == in_memory.latest_aws_image(None)
+    assert mapped.find_matching_ami("ami-08a20c15f394e5531") == (
+        in_memory.find_matching_ami("ami-08a20c15f394e5531")
+    )
+    assert mapped.find_matching_ami("ami-nope") == in_memory.find_matching_ami(
+        "ami-nope"
+    )
+    assert mapped.find_available_aws_versions() == (
+        in_memory.find_available_aws_versions()
+    )
+    assert mapped.find_available_google_versions() == (
+        in_memory.find_available_google_versions()
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"arch": "x86_64", "page": 2, "page_size": 10},
+        {"arch": "arm64", "region": "af-south-1"},
+        {"name": "ha-9.4", "arch": "x86_64"},
+        {"image_id": "ami-08a20c15f394e5531"},
+        {"version": "does-not-exist"},
+    ],
+)
+def test_catalog_find_aws_images(snapshots, kwargs):
+    in_memory, mapped = snapshots
+    assert jsonable_encoder(mapped.find_aws_images(**kwargs)) == jsonable_encoder(
+        in_memory.find_aws_images(**kwargs)
+    )
+
+
+def test_catalog_detects_replacement(snapshots, tmp_path):
+    _, mapped = snapshots
+    assert mapped.catalog.is_current()
+
+    catalog.write_catalog(mapped.catalog.path, {"aws": mapped.aws})
+    assert not mapped.catalog.is_current()
+
+    # The old mapping stays readable after the file was replaced.
+    assert mapped.aws.row(0)["id"]
+
+
+def test_catalog_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-catalog"
+    path.write_bytes(b"hello world, this is not a catalog")
+
+    with pytest.raises(catalog.InvalidCatalog):
+        catalog.Catalog(str(path))
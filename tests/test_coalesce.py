@@ -0,0 +1,131 @@
+"""Test coalescing identical requests that arrive at the same time."""
+
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from cid import main
+from cid.coalesce import SingleFlight
+
+
+def test_concurrent_calls_share_result():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flights.do("a", lambda: compute("a")) for _ in range(5)),
+            flights.do("b", lambda: compute("b")),
+        )
+
+    assert asyncio.run(scenario()) == ["a"] * 5 + ["b"]
+    assert calls == ["a", "b"]
+    assert flights.stats() == {"in_flight": 0, "computed": 2, "shared": 4}
+
+
+def test_errors_are_shared():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flights.do("a", fail) for _ in range(3)), return_exceptions=True
+        )
+
+    errors = asyncio.run(scenario())
+    assert [type(error) for error in errors] == [ValueError] * 3
+    assert flights.stats()["computed"] == 1
+
+
+def test_followers_compute_unshareable_results():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(None)
+        await asyncio.sleep(0.01)
+        return 503 if len(calls) == 1 else 200
+
+    async def scenario():
+        return await asyncio.gather(
+            *(flights.do("a", compute, shareable=lambda r: r != 503) for _ in range(3))
+        )
+
+    assert asyncio.run(scenario()) == [503, 200, 200]
+    assert flights.stats() == {"in_flight": 0, "computed": 3, "shared": 0}
+
+
+def test_follower_computes_when_leader_is_cancelled():
+    flights = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(None)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.create_task(flights.do("a", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("a", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == 2
+    assert flights.stats()["in_flight"] == 0
+
+
+def request_concurrently(path, count):
+    """Send identical requests to the app at once, and count the queries they ran."""
+    queries = []
+
+    async def run(db, function, *args):
+        queries.append(function.__name__)
+        await asyncio.sleep(0.05)
+        return function.__name__
+
+    async def get_db():
+        yield None
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(*(client.get(path) for _ in range(count)))
+
+    with (
+        patch.object(main.async_crud, "run", run),
+        patch.dict(main.app.dependency_overrides, {main.get_db: get_db}),
+    ):
+        responses = asyncio.run(scenario())
+    return responses, queries
+
+
+def test_identical_requests_run_one_query():
+    responses, queries = request_concurrently("/aws/latest?arch=x86_64", 10)
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert {response.text for response in responses} == {'"latest_aws_image"'}
+    assert queries == ["latest_aws_image"]
+
+
+def test_coalescing_can_be_disabled():
+    with patch.object(main, "REQUEST_COALESCING_ENABLED", False):
+        responses, queries = request_concurrently("/aws/latest", 4)
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert queries == ["latest_aws_image"] * 4
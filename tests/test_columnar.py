@@ -0,0 +1,132 @@
+"""Tests for the columnar tables."""
+
+import random
+from unittest.mock import patch
+
+import pytest
+
+from cid import columnar
+from cid.columnar import ColumnarTable, Filter, _set_bit_positions
+
+NAMES = ("id", "arch", "name", "region", "tags")
+ROWS = [
+    (
+        f"ami-{i}",
+        "arm64" if i % 3 == 0 else "x86_64",
+        f"RHEL-{i % 7}",
+        f"r-{i % 4}",
+        [i],
+    )
+    for i in range(50)
+]
+ROWS.append(("ami-null", None, None, "r-0", None))
+
+
+@pytest.fixture(scope="module")
+def table():
+    return ColumnarTable.from_rows(
+        NAMES, ROWS, indexed=("id", "arch", "name", "region")
+    )
+
+
+def brute_force(filters):
+    """Return the positions a filter should match, found the slow way."""
+    positions = []
+    for position, row in enumerate(ROWS):
+        record = dict(zip(NAMES, row, strict=True))
+        matched = True
+        for column_filter in filters:
+            value = record[column_filter.column]
+            if column_filter.contains:
+                matched &= value is not None and (
+                    column_filter.value.lower() in value.lower()
+                )
+            else:
+                matched &= value == column_filter.value
+        if matched:
+            positions.append(position)
+    return positions
+
+
+def test_row_roundtrip(table):
+    for position, row in enumerate(ROWS):
+        assert table.row(position) == dict(zip(NAMES, row, strict=True))
+
+
+def test_dictionaries_are_sorted_with_null_first(table):
+    assert table.columns["arch"].values == [None, "arm64", "x86_64"]
+    assert table.columns["arch"].bitmaps is not None
+    assert not table.columns["tags"].postings
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        [],
+        [Filter("arch", "arm64")],
+        [Filter("arch", "arm64"), Filter("region", "r-1")],
+        [Filter("name", "rhel-3", contains=True)],
+        [Filter("name", "RHEL", contains=True), Filter("arch", "x86_64")],
+        [Filter("id", "ami-12"), Filter("region", "r-0")],
+        [Filter("id", "ami-12"), Filter("arch", "x86_64")],
+        [Filter("arch", "ppc64le")],
+        [Filter("name", "does-not-exist", contains=True)],
+    ],
+)
+def test_select_matches_brute_force(table, filters):
+    expected = brute_force(filters)
+    selection = table.select(filters)
+
+    assert selection.count() == len(expected)
+    assert list(selection.slice(0, len(ROWS))) == expected
+    assert list(selection.slice(3, 5)) == expected[3:8]
+
+
+def test_find_paginates(table):
+    result = table.find([Filter("arch", "x86_64")], page=2, page_size=10)
+    expected = brute_force([Filter("arch", "x86_64")])
+
+    assert result["page"] == 2
+    assert result["page_size"] == 10
+    assert result["total_count"] == len(expected)
+    assert result["total_pages"] == (len(expected) + 9) // 10
+    assert [row["id"] for row in result["results"]] == [
+        ROWS[position][0] for position in expected[10:20]
+    ]
+
+    result = table.find([], page=-1, page_size=-10)
+    assert result["page"] == 1
+    assert result["page_size"] == 1
+    assert len(result["results"]) == 1
+
+    result = table.find([], page=100, page_size=10)
+    assert result["results"] == []
+
+    with patch.object(columnar, "MAX_PAGE_SIZE", 5):
+        result = table.find([], page_size=1000)
+    assert result["page_size"] == 5
+    assert len(result["results"]) == 5
+
+
+def test_set_bit_positions_skips_whole_chunks():
+    mask = sum(1 << position for position in range(0, 20000, 3))
+    expected = list(range(0, 20000, 3))
+
+    assert _set_bit_positions(mask, 0, 5) == expected[:5]
+    assert _set_bit_positions(mask, 4000, 5) == expected[4000:4005]
+    assert _set_bit_positions(mask, len(expected) - 2, 5) == expected[-2:]
+    assert _set_bit_positions(mask, len(expected) + 10, 5) == []
+
+
+@pytest.mark.parametrize("size", [64, 4096, 4160, 20000])
+@pytest.mark.parametrize("density", [0.001, 0.1, 0.9])
+def test_set_bit_positions_matches_every_bit(size, density):
+    """Pages match the set bits, across words and windows of any density."""
+    generator = random.Random(size)  # noqa: S311
+    expected = [position for position in range(size) if generator.random() < density]
+    mask = sum(1 << position for position in expected)
+
+    for skip in (0, 1, 63, 64, len(expected) // 2, max(len(expected) - 1, 0)):
+        for limit in (1, 10, 1000):
+            page = expected[skip : skip + limit]
+            assert _set_bit_positions(mask, skip, limit) == page
@@ -0,0 +1,94 @@
+"""Tests for the content encodings of the read endpoints."""
+
+import gzip
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from cid import cache, compression
+from cid.main import app, get_db
+
+LISTING = {
+    "results": [{"name": f"RHEL-9.4.0_HVM-{i}", "arch": "x86_64"} for i in range(100)],
+    "page": 1,
+    "page_size": 100,
+    "total_count": 100,
+    "total_pages": 1,
+}
+
+
+def fake_get_db():
+    yield None
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("GZIP ; q=0.8", "gzip"),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    assert compression.negotiate(accept_encoding) == expected
+
+
+def test_negotiate_prefers_server_order():
+    preferred = next(iter(compression.ENCODERS))
+    assert compression.negotiate("*") == preferred
+    assert compression.negotiate(", ".join(reversed(compression.ENCODERS))) == (
+        preferred
+    )
+
+
+def test_small_bodies_are_not_compressed():
+    assert compression.compress(b"[]", "gzip") == (b"[]", None)
+
+    body = b"x" * compression.MIN_COMPRESSED_SIZE
+    compressed, encoding = compression.compress(body, "gzip")
+    assert encoding == "gzip"
+    assert gzip.decompress(compressed) == body
+
+
+@patch("cid.crud.find_aws_images", return_value=LISTING)
+def test_listing_is_compressed(mock_find):
+    client = TestClient(app)
+    with patch.dict(app.dependency_overrides, {get_db: fake_get_db}):
+        compressed = client.get("/aws", headers={"Accept-Encoding": "gzip"})
+        plain = client.get("/aws", headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in plain.headers
+    assert compressed.headers["Vary"] == "Accept, Accept-Encoding"
+    assert compressed.json() == plain.json() == LISTING
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+
+
+@patch("cid.crud.find_aws_images", return_value=LISTING)
+def test_compressed_variants_are_cached(mock_find):
+    cache.response_cache.clear()
+    client = TestClient(app)
+    with (
+        patch("cid.main.RESPONSE_CACHE_ENABLED", True),
+        patch.dict(app.dependency_overrides, {get_db: fake_get_db}),
+        patch("cid.main.compress", wraps=compression.compress) as mock_compress,
+    ):
+        plain = client.get("/aws", headers={"Accept-Encoding": "identity"})
+        first = client.get("/aws", headers={"Accept-Encoding": "gzip"})
+        second = client.get("/aws", headers={"Accept-Encoding": "gzip"})
+    cache.response_cache.clear()
+
+    assert plain.headers["X-Cache"] == "MISS"
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.headers["Content-Encoding"] == "gzip"
+    assert first.json() == second.json() == plain.json() == LISTING
+
+    # The listing was rendered once and compressed with gzip once.
+    assert mock_find.call_count == 1
+    assert [call.args[1] for call in mock_compress.call_args_list] == [None, "gzip"]
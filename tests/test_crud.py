@@ -3,8 +3,13 @@
 import json
 from datetime import datetime
 
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import JSONB
+
 from cid import crud
-from cid.models import AwsImage, AzureImage, GoogleImage
+from cid.models import GOOGLE_DEFERRED_COLUMNS, AwsImage, AzureImage, GoogleImage
+from cid.utils import InvalidCloudProvider, InvalidFields
 
 
 def test_last_update(db):
@@ -535,24 +540,24 @@ def test_find_aws_images(db):
 
     result = crud.find_aws_images(db, "arm64", None, None, None, None)
     assert len(result["results"]) == 1
-    assert result["results"][0].name == "RHEL-9.5.0"
-    assert result["results"][0].arch == "arm64"
-    assert result["results"][0].region == "us-west-2"
+    assert result["results"][0]["name"] == "RHEL-9.5.0"
+    assert result["results"][0]["arch"] == "arm64"
+    assert result["results"][0]["region"] == "us-west-2"
 
     result = crud.find_aws_images(db, None, "9.5.0", None, None, None)
     assert len(result["results"]) == 2
-    assert result["results"][0].name == "RHEL-9.5.0"
-    assert result["results"][0].arch == "x86_64"
-    assert result["results"][0].region == "us-west-1"
-    assert result["results"][1].name == "RHEL-9.5.0"
-    assert result["results"][1].arch == "arm64"
-    assert result["results"][1].region == "us-west-2"
+    assert result["results"][0]["name"] == "RHEL-9.5.0"
+    assert result["results"][0]["arch"] == "x86_64"
+    assert result["results"][0]["region"] == "us-west-1"
+    assert result["results"][1]["name"] == "RHEL-9.5.0"
+    assert result["results"][1]["arch"] == "arm64"
+    assert result["results"][1]["region"] == "us-west-2"
 
     result = crud.find_aws_images(db, None, None, "10.0.0", None, None)
     assert len(result["results"]) == 1
-    assert result["results"][0].name == "RHEL-10.0.0"
-    assert result["results"][0].arch == "x86_64"
-    assert result["results"][0].region == "us-west-2"
+    assert result["results"][0]["name"] == "RHEL-10.0.0"
+    assert result["results"][0]["arch"] == "x86_64"
+    assert result["results"][0]["region"] == "us-west-2"
 
     result = crud.find_aws_images(db, None, None, None, "us-west-1", None)
     assert len(result["results"]) == 3
@@ -940,3 +945,109 @@ def test_find_google_images_paginated(db):
     assert result["page_size"] == 1
     assert result["total_count"] == 4
     assert result["total_pages"] == 4
+
+
+def test_find_images_reuses_statements(db):
+    db.add(AwsImage(id="ami-a", name="RHEL-9.5.0", arch="x86_64", region="us-east-1"))
+    db.commit()
+
+    crud.find_aws_images(db, arch="x86_64", name="RHEL")
+    hits = crud._listing_statements.cache_info().hits
+    result = crud.find_aws_images(db, arch="arm64", name="RHEL", page=2)
+    assert crud._listing_statements.cache_info().hits == hits + 1
+    assert result["results"] == []
+    assert result["total_count"] == 0
+
+    result = crud.find_aws_images(db, arch="x86_64", name="9.5")
+    assert dict(result["results"][0])["id"] == "ami-a"
+    assert result["total_count"] == 1
+
+
+def test_find_images_with_fields(db):
+    with open("tests/data/google.json") as fileh:
+        crud.import_google_images(db, json.load(fileh))
+
+    result = crud.find_google_images(db, page_size=1)
+    assert "name" in result["results"][0]
+    for column in GOOGLE_DEFERRED_COLUMNS:
+        assert column not in result["results"][0]
+
+    result = crud.find_google_images(db, page_size=1, fields="selfLink, name,name")
+    assert list(result["results"][0]) == ["selfLink", "name"]
+
+    result = crud.find_google_images(db, page_size=1, fields="name,licenses")
+    assert result["results"][0]["licenses"]
+
+    with pytest.raises(InvalidFields, match="bogus"):
+        crud.find_aws_images(db, fields="name,bogus")
+
+
+def test_find_image(db):
+    with open("tests/data/google.json") as fileh:
+        images = json.load(fileh)
+    crud.import_google_images(db, images)
+
+    image = crud.find_image(db, "google", images[0]["id"])
+    assert image["name"] == images[0]["name"]
+    assert image["licenses"] == images[0]["licenses"]
+
+    assert crud.find_image(db, "aws", "ami-nope") is None
+    with pytest.raises(InvalidCloudProvider):
+        crud.find_image(db, "digitalocean", "1")
+
+
+def test_export_images(db):
+    with open("tests/data/aws.json") as fileh:
+        crud.import_aws_images(db, json.load(fileh))
+
+    listing = crud.find_aws_images(db, arch="x86_64", page_size=1000)
+    columns, rows = crud.export_aws_images(db, arch="x86_64", fields="name,region")
+    assert columns == ("name", "region")
+    assert [dict(row) for row in rows] == [
+        {"name": image["name"], "region": image["region"]}
+        for image in listing["results"]
+    ]
+
+    with pytest.raises(InvalidFields, match="bogus"):
+        crud.export_azure_images(db, fields="bogus")
+
+
+def test_parse_timestamp():
+    assert crud.parse_timestamp("2024-05-01T12:30:00.000Z") == datetime(
+        2024, 5, 1, 12, 30
+    )
+    assert crud.parse_timestamp("2023-01-11T10:20:37.447-08:00") == datetime(
+        2023, 1, 11, 10, 20, 37, 447000
+    )
+
+
+def test_find_images_ignores_case(db):
+    with open("tests/data/aws.json") as fileh:
+        crud.import_aws_images(db, json.load(fileh))
+
+    upper = crud.find_aws_images(db, name="RHEL-9")
+    assert upper["total_count"] > 0
+    assert (
+        crud.find_aws_images(db, name="rhel-9")["total_count"] == (upper["total_count"])
+    )
+
+
+def test_latest_images_of_every_arch_match_each_arch(loaded_db):
+    """PostgreSQL finds the latest image of every arch at once with DISTINCT ON."""
+    for latest, archs in (
+        (crud.latest_aws_image, crud.AWS_ARCHS),
+        (crud.latest_azure_image, crud.AZURE_ARCHS),
+        (crud.latest_google_image, crud.GOOGLE_ARCHS),
+    ):
+        every_arch = latest(loaded_db, None)
+        for arch in loaded_db.scalars(archs):
+            assert every_arch[arch] == latest(loaded_db, arch)[arch]
+
+
+def test_postgresql_statements():
+    statement = str(crud.AZURE_LATEST_IMAGES.compile(dialect=postgresql.dialect()))
+    assert statement.startswith("SELECT DISTINCT ON (azure_images.architecture)")
+    assert "DESC NULLS LAST" in statement
+
+    column = GoogleImage.__table__.c.licenses
+    assert isinstance(column.type.dialect_impl(postgresql.dialect()), JSONB)
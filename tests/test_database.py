@@ -0,0 +1,87 @@
+"""Tests for the database engines."""
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from cid import database
+from cid.config import DATABASE_URL
+
+
+def test_sqlite_engines(tmp_path):
+    url = f"sqlite:///{tmp_path / 'cid.db'}"
+    writer = database.build_engine(url)
+    reader = database.build_engine(url, read_only=True)
+
+    with writer.begin() as connection:
+        assert connection.scalar(text("PRAGMA journal_mode")) == "wal"
+        assert connection.scalar(text("PRAGMA synchronous")) == 1
+        assert connection.scalar(text("PRAGMA busy_timeout")) == 5000
+        assert connection.scalar(text("PRAGMA temp_store")) == 2
+        connection.execute(text("CREATE TABLE images (id TEXT)"))
+        connection.execute(text("INSERT INTO images VALUES ('ami-1')"))
+
+    with reader.connect() as connection:
+        assert connection.scalar(text("SELECT id FROM images")) == "ami-1"
+        with pytest.raises(OperationalError, match="readonly"):
+            connection.execute(text("INSERT INTO images VALUES ('ami-2')"))
+
+    writer.dispose()
+    reader.dispose()
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:///:memory:", True),
+        ("sqlite://", True),
+        ("sqlite:////code/cid.db", False),
+        ("postgresql://cid@localhost/cid", False),
+    ],
+)
+def test_is_memory_database(url, expected):
+    assert database.is_memory_database(url) == expected
+
+
+@pytest.mark.skipif(
+    not database.is_memory_database(DATABASE_URL), reason="needs an in-memory database"
+)
+def test_memory_database_shares_one_engine():
+    assert database.read_engine is database.engine
+
+
+def test_pool_options():
+    options = database.pool_options("postgresql://cid@localhost/cid")
+    assert options["pool_pre_ping"] is True
+    assert options["pool_size"] == 5
+    assert "connect_args" not in options
+
+    options = database.pool_options("postgresql://cid@localhost/cid", read_only=True)
+    assert "default_transaction_read_only=on" in options["connect_args"]["options"]
+
+    options = database.pool_options(
+        "postgresql+asyncpg://cid@localhost/cid", read_only=True
+    )
+    settings = options["connect_args"]["server_settings"]
+    assert settings == {"default_transaction_read_only": "on"}
+
+
+@pytest.mark.skipif(not database.HAS_ASYNCIO, reason="needs greenlet")
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:////code/cid.db", "sqlite+aiosqlite:////code/cid.db"),
+        ("postgresql+psycopg2://cid@db/cid", "postgresql+asyncpg://cid@db/cid"),
+        ("mysql://cid@db/cid", None),
+    ],
+)
+def test_async_url(url, expected):
+    with patch("importlib.util.find_spec", return_value=object()):
+        assert database.async_url(url) == expected
+
+
+def test_async_url_without_driver():
+    with patch("importlib.util.find_spec", return_value=None):
+        assert database.async_url("sqlite:////code/cid.db") is None
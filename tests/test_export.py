@@ -0,0 +1,85 @@
+"""Tests for the export endpoints and their encoders."""
+
+import csv
+import io
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from cid import export
+from cid.main import app
+
+from .test_main import client
+
+ROWS = [
+    {"name": f"image-{i}", "date": datetime(2024, 1, 1), "tags": ["a", "b"]}
+    for i in range(7)
+]
+
+
+@patch("cid.export.CHUNK_ROWS", 3)
+def test_ndjson_chunks():
+    chunks = list(export.ndjson_chunks(iter(ROWS)))
+    assert len(chunks) == 3
+
+    lines = b"".join(chunks).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"name": f"image-{i}", "date": "2024-01-01T00:00:00", "tags": ["a", "b"]}
+        for i in range(7)
+    ]
+
+
+@patch("cid.export.CHUNK_ROWS", 3)
+def test_csv_chunks():
+    chunks = list(export.csv_chunks(("name", "date", "tags"), iter(ROWS)))
+    assert len(chunks) == 3
+
+    reader = csv.reader(io.StringIO(b"".join(chunks).decode()))
+    assert next(reader) == ["name", "date", "tags"]
+    assert next(reader) == ["image-0", "2024-01-01T00:00:00", '["a","b"]']
+    assert len(list(reader)) == 6
+
+
+def test_csv_chunks_without_rows():
+    assert list(export.csv_chunks(("name",), iter([]))) == [b"name\r\n"]
+
+
+def test_export_aws_images():
+    listing = client.get("/aws?page_size=1000&arch=x86_64").json()
+
+    response = client.get("/aws/export?arch=x86_64")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == (
+        'attachment; filename="aws-images.ndjson"'
+    )
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert rows == listing["results"]
+
+
+def test_export_google_images_csv():
+    listing = client.get("/google?page_size=1000").json()
+
+    response = client.get("/google/export?format=csv&fields=name,licenses")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "text/csv; charset=utf-8"
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["name"] for row in rows] == [
+        image["name"] for image in listing["results"]
+    ]
+    assert json.loads(rows[0]["licenses"])
+
+
+def test_export_rejects_bad_parameters():
+    assert client.get("/azure/export?fields=bogus").status_code == 400
+    assert client.get("/azure/export?format=xml").status_code == 422
+
+
+def test_export_is_not_cached():
+    with patch("cid.main.RESPONSE_CACHE_ENABLED", True):
+        response = TestClient(app).get("/azure/export")
+    assert response.status_code == 200
+    assert "X-Cache" not in response.headers
+    assert "ETag" not in response.headers
@@ -0,0 +1,111 @@
+"""Tests for the columnar representations of the listings."""
+
+import io
+import json
+
+import pytest
+
+from cid import formats
+
+from .test_main import client
+
+
+@pytest.mark.parametrize(
+    "path, accept, expected",
+    [
+        ("/aws", None, None),
+        ("/aws", "application/json", None),
+        ("/aws", "*/*", None),
+        ("/aws", formats.COLUMNAR_JSON_MEDIA_TYPE, formats.COLUMNAR_JSON_MEDIA_TYPE),
+        (
+            "/aws",
+            f"application/json;q=0.5, {formats.COLUMNAR_JSON_MEDIA_TYPE}",
+            formats.COLUMNAR_JSON_MEDIA_TYPE,
+        ),
+        (
+            "/aws",
+            f"*/*, {formats.COLUMNAR_JSON_MEDIA_TYPE}",
+            formats.COLUMNAR_JSON_MEDIA_TYPE,
+        ),
+        ("/aws", f"{formats.COLUMNAR_JSON_MEDIA_TYPE};q=0", None),
+        ("/aws", "text/html", None),
+        ("/aws/latest", formats.COLUMNAR_JSON_MEDIA_TYPE, None),
+    ],
+)
+def test_negotiate_format(path, accept, expected):
+    assert formats.negotiate_format(path, accept) == expected
+
+
+def test_negotiate_format_skips_missing_packages():
+    expected = formats.MSGPACK_MEDIA_TYPE if formats.HAS_MSGPACK else None
+    assert formats.negotiate_format("/aws", formats.MSGPACK_MEDIA_TYPE) == expected
+
+
+def test_columnar_listing():
+    listing = client.get("/aws?page_size=5&fields=name,creationDate").json()
+
+    response = client.get(
+        "/aws?page_size=5&fields=name,creationDate",
+        headers={"Accept": formats.COLUMNAR_JSON_MEDIA_TYPE},
+    )
+    assert response.headers["Content-Type"] == formats.COLUMNAR_JSON_MEDIA_TYPE
+    assert response.headers["Vary"] == "Accept, Accept-Encoding"
+    result = response.json()
+    assert result["results"] == {
+        "name": [row["name"] for row in listing["results"]],
+        "creationDate": [row["creationDate"] for row in listing["results"]],
+    }
+    assert result["total_count"] == listing["total_count"]
+
+
+def test_columnar_listing_without_results():
+    response = client.get(
+        "/google?name=nope", headers={"Accept": formats.COLUMNAR_JSON_MEDIA_TYPE}
+    )
+    assert response.json()["results"]["name"] == []
+    assert "licenses" not in response.json()["results"]
+
+
+def test_representations_have_their_own_etags():
+    plain = client.get("/azure")
+    columnar = client.get(
+        "/azure", headers={"Accept": formats.COLUMNAR_JSON_MEDIA_TYPE}
+    )
+    assert plain.headers["ETag"] != columnar.headers["ETag"]
+
+    revalidated = client.get(
+        "/azure",
+        headers={
+            "Accept": formats.COLUMNAR_JSON_MEDIA_TYPE,
+            "If-None-Match": columnar.headers["ETag"],
+        },
+    )
+    assert revalidated.status_code == 304
+
+
+def test_msgpack_listing():
+    msgpack = pytest.importorskip("msgpack")
+
+    listing = client.get("/aws?page_size=3").json()
+    response = client.get(
+        "/aws?page_size=3", headers={"Accept": formats.MSGPACK_MEDIA_TYPE}
+    )
+    result = msgpack.unpackb(response.content)
+    assert result["results"]["id"] == [row["id"] for row in listing["results"]]
+    assert result["results"]["date"] == [row["date"] for row in listing["results"]]
+
+
+def test_arrow_listing():
+    pa = pytest.importorskip("pyarrow")
+
+    listing = client.get("/google?page_size=3&fields=name,licenses").json()
+    response = client.get(
+        "/google?page_size=3&fields=name,licenses",
+        headers={"Accept": formats.ARROW_MEDIA_TYPE},
+    )
+    table = pa.ipc.open_stream(io.BytesIO(response.content)).read_all()
+    assert table.column("name").to_pylist() == [
+        row["name"] for row in listing["results"]
+    ]
+    assert json.loads(table.column("licenses")[0].as_py())
+    assert table.schema.metadata[b"total_count"] == b"%d" % listing["total_count"]
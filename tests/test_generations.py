@@ -0,0 +1,292 @@
+"""Test publishing generations of the image data and pulling them on other nodes."""
+
+import gzip
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from cid import crud, database, generations, refresh
+from cid.models import AwsImage, Base
+
+
+def file_session(path):
+    engine = database.build_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    """Yield a session of the publisher's database, with the test data, and a node's."""
+    (tmp_path / "publisher").mkdir()
+    (tmp_path / "node").mkdir()
+    publisher = file_session(tmp_path / "publisher" / "cid.db")
+    for cloud_provider in ("aws", "azure", "google"):
+        with open(f"tests/data/{cloud_provider}.json") as fileh:
+            getattr(crud, f"import_{cloud_provider}_images")(
+                publisher, json.load(fileh)
+            )
+    crud.update_last_updated(publisher)
+    node = file_session(tmp_path / "node" / "cid.db")
+
+    yield publisher, node
+
+    for db in (publisher, node):
+        db.close()
+        db.get_bind().dispose()
+
+
+def count_aws(db):
+    return db.scalar(select(func.count()).select_from(AwsImage))
+
+
+def test_publish_and_pull(nodes, tmp_path):
+    publisher, node = nodes
+    store = generations.LocalStore(str(tmp_path / "store"))
+
+    manifest = generations.publish_generation(store, publisher)
+    assert generations.read_latest(store) == manifest
+    assert manifest["last_update"] == crud.get_last_update(publisher)
+    (entry,) = manifest["files"]
+    assert entry["name"] == "database"
+    assert entry["compressed_size"] < entry["size"]
+
+    assert count_aws(node) == 0
+    assert generations.pull_generation(store, node.get_bind()) == ["database"]
+    assert count_aws(node) == count_aws(publisher) == 500
+    assert crud.get_last_update(node) == manifest["last_update"]
+
+    node_path = generations.sqlite_path(node.get_bind())
+    assert generations.active_version(node_path) == manifest["version"]
+    # The database stays in WAL mode, which readers rely on.
+    assert node.execute(select(func.count()).select_from(AwsImage)).scalar()
+    assert node.connection().exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+
+    # Nothing is pulled again until a new generation is published.
+    assert generations.pull_generation(store, node.get_bind()) == []
+
+
+def test_pull_from_empty_store(nodes, tmp_path):
+    _, node = nodes
+    store = generations.LocalStore(str(tmp_path / "store"))
+
+    assert generations.pull_generation(store, node.get_bind()) is None
+
+
+def test_pull_rejects_corrupted_files(nodes, tmp_path):
+    publisher, node = nodes
+    store = generations.LocalStore(str(tmp_path / "store"))
+    manifest = generations.publish_generation(store, publisher)
+    store.write(manifest["files"][0]["file"], gzip.compress(b"not a database"))
+
+    with pytest.raises(generations.InvalidGeneration):
+        generations.pull_generation(store, node.get_bind())
+
+    assert count_aws(node) == 0
+    node_path = generations.sqlite_path(node.get_bind())
+    assert generations.active_version(node_path) is None
+
+
+def test_pull_catalog(nodes, tmp_path):
+    publisher, node = nodes
+    store = generations.LocalStore(str(tmp_path / "store"))
+    published_catalog = tmp_path / "publisher" / "catalog.bin"
+    published_catalog.write_bytes(b"catalog")
+    node_catalog = tmp_path / "node" / "catalog.bin"
+
+    with (
+        patch.object(generations, "SNAPSHOT_ENABLED", True),
+        patch.object(generations, "CATALOG_PATH", str(published_catalog)),
+    ):
+        manifest = generations.publish_generation(store, publisher)
+    assert [entry["name"] for entry in manifest["files"]] == ["database", "catalog"]
+
+    with (
+        patch.object(generations, "SNAPSHOT_ENABLED", True),
+        patch.object(generations, "CATALOG_PATH", str(node_catalog)),
+    ):
+        activated = generations.pull_generation(store, node.get_bind())
+    assert activated == ["database", "catalog"]
+    assert node_catalog.read_bytes() == b"catalog"
+
+
+def test_pull_over_http(nodes, tmp_path, httpx_mock):
+    publisher, node = nodes
+    local = generations.LocalStore(str(tmp_path / "store"))
+    manifest = generations.publish_generation(local, publisher)
+    for name in (generations.LATEST, manifest["files"][0]["file"]):
+        httpx_mock.add_response(
+            url=f"https://cdn.example.com/cid/{name}", content=local.read(name)
+        )
+
+    store = generations.open_store("https://cdn.example.com/cid/")
+    assert generations.pull_generation(store, node.get_bind()) == ["database"]
+    assert count_aws(node) == 500
+
+    with pytest.raises(generations.ReadOnlyStore):
+        generations.publish_generation(store, publisher)
+
+
+def test_http_store_without_generation(httpx_mock):
+    httpx_mock.add_response(status_code=404)
+
+    store = generations.HttpStore("https://cdn.example.com/cid")
+    assert generations.read_latest(store) is None
+
+
+class FakeS3:
+    """Just enough of a boto3 S3 client, holding the objects in a dictionary."""
+
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def get_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {"Body": io.BytesIO(self.objects[Bucket, Key])}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Bucket, Key] = Body
+
+    def upload_file(self, path, bucket, key):
+        with open(path, "rb") as fileh:
+            self.objects[bucket, key] = fileh.read()
+
+    def download_file(self, bucket, key, path):
+        with open(path, "wb") as fileh:
+            fileh.write(self.objects[bucket, key])
+
+
+def test_s3_store(nodes):
+    publisher, node = nodes
+    client = FakeS3()
+    store = generations.S3Store("bucket", "/cid/", client=client)
+
+    assert generations.read_latest(store) is None
+    manifest = generations.publish_generation(store, publisher)
+    assert ("bucket", "cid/latest.json") in client.objects
+    assert ("bucket", f"cid/{manifest['version']}/database.gz") in client.objects
+
+    assert generations.pull_generation(store, node.get_bind()) == ["database"]
+    assert count_aws(node) == 500
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("/srv/generations", generations.LocalStore),
+        ("file:///srv/generations", generations.LocalStore),
+        ("https://cdn.example.com/cid", generations.HttpStore),
+    ],
+)
+def test_open_store(url, expected):
+    assert isinstance(generations.open_store(url), expected)
+
+
+def test_open_s3_store_needs_boto3():
+    with (
+        patch.object(generations, "HAS_BOTO3", False),
+        pytest.raises(ValueError),
+    ):
+        generations.open_store("s3://bucket/cid")
+
+
+def test_refresh_pulls_generation(nodes, tmp_path):
+    publisher, node = nodes
+    store = str(tmp_path / "store")
+    generations.publish_generation(generations.LocalStore(store), publisher)
+
+    with (
+        patch.object(refresh, "GENERATION_STORE", store),
+        patch.object(refresh.crud, "update_image_data") as update_image_data,
+    ):
+        refresh.refresh_image_data(node)
+        update_image_data.assert_not_called()
+        assert count_aws(node) == 500
+
+        # The image data is downloaded when the store can't be read.
+        with patch.object(refresh, "pull_generation", side_effect=OSError):
+            refresh.refresh_image_data(node)
+        update_image_data.assert_called_once_with(node)
+
+
+def test_refresh_publishes_generation(nodes, tmp_path):
+    publisher, _ = nodes
+    store = str(tmp_path / "store")
+
+    with (
+        patch.object(refresh, "GENERATION_STORE", store),
+        patch.object(refresh, "GENERATION_PUBLISHER", True),
+        patch.object(refresh.crud, "update_image_data") as update_image_data,
+    ):
+        refresh.refresh_image_data(publisher)
+
+    update_image_data.assert_called_once_with(publisher)
+    assert generations.read_latest(generations.LocalStore(store)) is not None
+
+
+def test_pending_version(nodes, tmp_path):
+    publisher, node = nodes
+    store = generations.LocalStore(str(tmp_path / "store"))
+    assert generations.pending_version(store, node.get_bind()) is None
+
+    manifest = generations.publish_generation(store, publisher)
+    assert generations.pending_version(store, node.get_bind()) == manifest["version"]
+
+    generations.pull_generation(store, node.get_bind())
+    assert generations.pending_version(store, node.get_bind()) is None
+
+
+def test_follow_generations(nodes, tmp_path):
+    from cid import main
+
+    publisher, node = nodes
+    store = str(tmp_path / "store")
+
+    with (
+        patch.object(refresh, "GENERATION_STORE", store),
+        patch.object(main, "SessionLocal", lambda: node),
+        patch.object(main, "runs_in_subprocess", return_value=False),
+        patch.object(main, "switch_to_new_data") as switch_to_new_data,
+        patch.object(refresh.crud, "update_image_data") as update_image_data,
+    ):
+        main.follow_generations()
+        switch_to_new_data.assert_not_called()
+
+        generations.publish_generation(generations.LocalStore(store), publisher)
+        main.follow_generations()
+        assert count_aws(node) == 500
+        switch_to_new_data.assert_called_once_with(node)
+
+        # Nothing is pulled again, and nothing is built from the image data instead.
+        main.follow_generations()
+        switch_to_new_data.assert_called_once_with(node)
+        update_image_data.assert_not_called()
+
+
+def test_follow_generations_in_subprocess(nodes, tmp_path):
+    from cid import main
+
+    publisher, node = nodes
+    store = str(tmp_path / "store")
+    generations.publish_generation(generations.LocalStore(store), publisher)
+
+    with (
+        patch.object(refresh, "GENERATION_STORE", store),
+        patch.object(main, "SessionLocal", lambda: node),
+        patch.object(main, "runs_in_subprocess", return_value=True),
+        patch.object(main, "run_refresh_process", return_value=True) as process,
+        patch.object(main, "switch_to_new_data") as switch_to_new_data,
+    ):
+        main.follow_generations()
+
+    process.assert_called_once_with(pull_only=True)
+    switch_to_new_data.assert_called_once_with(node)
@@ -0,0 +1,100 @@
+"""Test the bulk loading of images."""
+
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from sqlalchemy import select, text
+
+from cid import ingest
+from cid.models import AwsImage, GoogleImage
+
+
+def test_copy_value():
+    """Values are escaped for the text format of COPY."""
+    assert ingest.copy_value(None) == "\\N"
+    assert ingest.copy_value("") == ""
+    assert ingest.copy_value("a\tb\nc\rd\\e") == "a\\tb\\nc\\rd\\\\e"
+    assert ingest.copy_value(20) == "20"
+    assert ingest.copy_value(datetime(2024, 5, 1, 12, 30)) == "2024-05-01 12:30:00"
+    assert ingest.copy_value({"a": "b\\c"}, is_json=True) == '{"a": "b\\\\\\\\c"}'
+    assert ingest.copy_value(None, is_json=True) == "null"
+
+
+def test_copy_lines():
+    """Every row is written in the order of the columns, missing values as NULL."""
+    table = AwsImage.__table__
+    lines = list(ingest.copy_lines(table, [{"id": "ami-1", "name": "RHEL\t9"}]))
+
+    assert len(lines) == 1
+    fields = lines[0].rstrip("\n").split("\t")
+    assert fields == ["ami-1", "RHEL\\t9"] + ["\\N"] * (len(table.columns) - 2)
+
+
+def test_line_reader_reads_in_chunks():
+    """The reader hands out lines in chunks of the size asked for."""
+    reader = ingest._LineReader(iter(["abc\n", "defgh\n", "i\n"]))
+
+    assert reader.read(5) == "abc\nd"
+    assert reader.read(5) == "efgh\n"
+    assert reader.read(5) == "i\n"
+    assert reader.read(5) == ""
+
+
+def test_line_reader_reads_everything():
+    reader = ingest._LineReader(iter(["abc\n", "def\n"]))
+
+    assert reader.read(2) == "ab"
+    assert reader.read() == "c\ndef\n"
+
+
+def test_bulk_insert(db):
+    """Rows with characters that COPY escapes come back unchanged."""
+    rows = [
+        {
+            "id": "image-1",
+            "name": "tab\tnewline\nbackslash\\",
+            "creationTimestamp": datetime(2024, 5, 1, 12, 30),
+            "description": "",
+            "diskSizeGb": 20,
+            "licenses": ["https://example.com/license"],
+            "rawDisk": {"source": "a\tb"},
+        },
+    ]
+    rows.append({**dict.fromkeys(rows[0]), "id": "image-2"})
+    table = GoogleImage.__table__
+
+    ingest.bulk_insert(db, table, rows)
+    db.commit()
+
+    stored = {row.id: row for row in db.execute(select(table)).mappings()}
+    assert stored["image-1"]["name"] == "tab\tnewline\nbackslash\\"
+    assert stored["image-1"]["creationTimestamp"] == datetime(2024, 5, 1, 12, 30)
+    assert stored["image-1"]["description"] == ""
+    assert stored["image-1"]["diskSizeGb"] == 20
+    assert stored["image-1"]["licenses"] == ["https://example.com/license"]
+    assert stored["image-1"]["rawDisk"] == {"source": "a\tb"}
+    assert stored["image-2"]["name"] is None
+    assert stored["image-2"]["licenses"] is None
+
+
+def test_bulk_insert_nothing(db):
+    ingest.bulk_insert(db, AwsImage.__table__, [])
+
+    assert db.query(AwsImage).count() == 0
+
+
+def test_bulk_insert_copies_on_postgresql(db):
+    """PostgreSQL loads the rows through COPY and leaves no staging table behind."""
+    if not ingest.can_copy(db):
+        pytest.skip("needs PostgreSQL with psycopg2")
+
+    rows = [{"id": f"ami-{index}", "name": f"RHEL-{index}"} for index in range(3)]
+    with mock.patch.object(ingest, "copy_rows", wraps=ingest.copy_rows) as copy_rows:
+        ingest.bulk_insert(db, AwsImage.__table__, rows)
+    db.commit()
+
+    copy_rows.assert_called_once()
+    assert db.query(AwsImage).count() == 3
+    staging = db.scalar(text("SELECT to_regclass('aws_images_staging')"))
+    assert staging is None
@@ -0,0 +1,146 @@
+"""Test the election of the process that refreshes the image data."""
+
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import update
+
+from cid import crud, leader, main
+from cid.config import REFRESH_INTERVAL
+from cid.database import build_engine
+from cid.models import LastUpdate
+from cid.status import clear_status, current_status
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("sqlite:////code/cid.db", "/code/cid.db.refresh.lock"),
+        ("sqlite:///:memory:", None),
+        ("sqlite://", None),
+        ("postgresql+psycopg2://cid@db/cid", None),
+    ],
+)
+def test_lock_path(url, expected):
+    assert leader.lock_path(url) == expected
+
+
+def test_lock_path_from_config():
+    with patch.object(leader, "REFRESH_LOCK_PATH", "/run/cid/refresh.lock"):
+        assert leader.lock_path("sqlite:////code/cid.db") == "/run/cid/refresh.lock"
+
+
+def test_file_lock_elects_one_process(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'cid.db'}")
+
+    # Every lock of the file is taken separately, as in another process.
+    with (
+        leader.refresh_lock(engine) as first,
+        leader.refresh_lock(engine) as second,
+    ):
+        assert first is True
+        assert second is False
+
+    with leader.refresh_lock(engine) as third:
+        assert third is True
+    assert (tmp_path / "cid.db.refresh.lock").exists()
+    engine.dispose()
+
+
+def test_advisory_lock_elects_one_process(db):
+    engine = db.get_bind()
+    if engine.dialect.name != "postgresql":
+        pytest.skip("needs PostgreSQL")
+
+    with (
+        leader.refresh_lock(engine) as first,
+        leader.refresh_lock(engine) as second,
+    ):
+        assert first is True
+        assert second is False
+
+    with leader.refresh_lock(engine) as third:
+        assert third is True
+
+
+def test_is_fresh(db):
+    assert not leader.is_fresh(db)
+
+    crud.update_last_updated(db)
+    assert leader.is_fresh(db)
+
+    updated_at = db.query(LastUpdate).one().updated_at
+    db.execute(
+        update(LastUpdate).values(
+            updated_at=updated_at - timedelta(seconds=REFRESH_INTERVAL)
+        )
+    )
+    db.commit()
+    assert not leader.is_fresh(db)
+
+
+def test_is_fresh_without_database_time(db):
+    crud.update_last_updated(db)
+    with patch.object(db, "scalar", return_value=None):
+        assert not leader.is_fresh(db)
+
+
+@contextmanager
+def elected(acquired):
+    @contextmanager
+    def refresh_lock(engine):
+        yield acquired
+
+    with (
+        patch.object(main, "refresh_lock", refresh_lock),
+        patch.object(main, "runs_in_subprocess", return_value=False),
+        patch.object(main, "refresh_image_data") as refresh_image_data,
+    ):
+        yield refresh_image_data
+
+
+def test_refresh_by_leader(db):
+    with (
+        patch.object(main, "SessionLocal", return_value=db),
+        elected(True) as refresh_image_data,
+    ):
+        main.self_update_image_data()
+        refresh_image_data.assert_called_once_with(db)
+
+        # The data is fresh now, so the next process leaves it alone.
+        crud.update_last_updated(db)
+        main.self_update_image_data()
+        refresh_image_data.assert_called_once()
+
+
+def test_no_refresh_by_followers(db):
+    with (
+        patch.object(main, "SessionLocal", return_value=db),
+        elected(False) as refresh_image_data,
+    ):
+        main.self_update_image_data()
+
+    refresh_image_data.assert_not_called()
+
+
+def test_follow_refresh(db):
+    clear_status()
+    with (
+        patch.object(main, "ReadSessionLocal", return_value=db),
+        patch.object(main, "bump_generation") as bump_generation,
+    ):
+        main.follow_refresh()
+        assert current_status()["last_update"] == ""
+
+        main.follow_refresh()
+        bump_generation.assert_not_called()
+
+        # Another process refreshed the data.
+        crud.update_last_updated(db)
+        main.follow_refresh()
+        bump_generation.assert_called_once()
+        assert current_status()["last_update"] == crud.get_last_update(db)
+
+    clear_status()
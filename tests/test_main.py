@@ -1,16 +1,20 @@
 """Tests for the main module."""
 
 import json
-from unittest.mock import patch
+import subprocess
+import sys
+from threading import Event
+from unittest.mock import MagicMock, patch
 
-from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 
-from cid import crud
+from cid import crud, main
 from cid.database import Base
-from cid.main import app, check_endpoint_status, get_db
+from cid.main import app, get_db
+from cid.status import clear_status
 
 engine = create_engine(
     "sqlite:///:memory:", connect_args={"check_same_thread": False}, echo=False
@@ -49,32 +53,9 @@ app.dependency_overrides[get_db] = override_get_db
 client = TestClient(app)
 
 
-def test_check_endpoint_status_running():
-    def mock_endpoint_func(db, *args, **kwargs):
-        return "data"
-
-    result = check_endpoint_status(None, mock_endpoint_func)
-    assert result == "running"
-
-
-def test_check_endpoint_status_down():
-    def mock_endpoint_func(db, *args, **kwargs):
-        return None
-
-    result = check_endpoint_status(None, mock_endpoint_func)
-    assert result == "down"
-
-
-def test_check_endpoint_status_exception():
-    def mock_endpoint_func(db, *args, **kwargs):
-        raise HTTPException(status_code=500)
-
-    result = check_endpoint_status(None, mock_endpoint_func)
-    assert result == "down"
-
-
 def test_read_root():
     """Test the read_root endpoint."""
+    clear_status()
     response = client.get("/")
     assert response.status_code == 200
     assert response.json()["status"] == {
@@ -82,9 +63,41 @@ def test_read_root():
         "https://testserver/google": "running",
         "https://testserver/azure": "running",
     }
+    assert response.json()["images"] == {"aws": 500, "azure": 152, "google": 4}
     assert "docs" in response.json()
     assert "last_update" in response.json()
 
+    # The status is recorded once and not counted again on every request.
+    with patch("cid.status.crud.get_last_update") as mock_last_update:
+        assert client.get("/").json() == response.json()
+    mock_last_update.assert_not_called()
+    clear_status()
+
+
+def test_healthz():
+    with patch("cid.main.get_db") as mock_get_db:
+        response = client.get("/healthz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    mock_get_db.assert_not_called()
+
+
+def test_readyz():
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
+def test_readyz_database_down():
+    def broken_get_db():
+        db = MagicMock()
+        db.execute.side_effect = OperationalError("SELECT 1", {}, Exception("down"))
+        yield db
+
+    with patch.dict(app.dependency_overrides, {get_db: broken_get_db}):
+        response = client.get("/readyz")
+    assert response.status_code == 503
+
 
 @patch("cid.crud.latest_aws_image")
 def test_latest_aws_image(mock_aws):
@@ -171,6 +184,15 @@ def test_all_aws_images_paginated():
     assert response.json()["total_pages"] == 500
 
 
+def test_all_aws_images_page_size_is_bounded():
+    with patch.object(crud, "MAX_PAGE_SIZE", 20):
+        response = client.get("/aws?page_size=1000000")
+    assert response.status_code == 200
+    assert len(response.json()["results"]) == 20
+    assert response.json()["page_size"] == 20
+    assert response.json()["total_pages"] == 25
+
+
 def test_all_aws_images_with_query():
     response = client.get("/aws?version=9.4.0")
     assert response.status_code == 200
@@ -371,6 +393,33 @@ def test_all_google_images_with_query_combination_no_match():
     assert len(response.json()["results"]) == 0
 
 
+def test_all_google_images_with_fields():
+    response = client.get("/google?fields=name,selfLink")
+    assert response.status_code == 200
+    assert set(response.json()["results"][0]) == {"name", "selfLink"}
+
+    response = client.get("/google")
+    assert "rawDisk" not in response.json()["results"][0]
+
+
+def test_all_aws_images_with_unknown_fields():
+    response = client.get("/aws?fields=name,nope")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Unknown fields: nope"}
+
+
+def test_google_image_details():
+    image_id = client.get("/google?page_size=1").json()["results"][0]["id"]
+
+    response = client.get(f"/google/images/{image_id}")
+    assert response.status_code == 200
+    assert response.json()["id"] == image_id
+    assert "rawDisk" in response.json()
+
+    response = client.get("/google/images/does-not-exist")
+    assert response.status_code == 404
+
+
 @patch("cid.crud.latest_google_image")
 def test_latest_google_image(mock_google):
     mock_google.return_value = {
@@ -411,3 +460,49 @@ def test_latest_google_image_query_for_arch(mock_google):
     assert result["version"] == "1.0"
     assert result["date"] == "2022-01-01"
     assert result["selfLink"] == "link"
+
+
+def test_lifespan_starts_background_work():
+    with (
+        patch.object(main, "ENVIRONMENT", "production"),
+        patch.object(main, "run_background_work") as run_background_work,
+        TestClient(app),
+    ):
+        stop = run_background_work.call_args.args[0]
+        assert not stop.is_set()
+
+    # The background work stops along with the app.
+    assert stop.is_set()
+
+
+def test_no_background_work_in_tests():
+    with (
+        patch.object(main, "run_background_work") as run_background_work,
+        TestClient(app),
+    ):
+        pass
+    run_background_work.assert_not_called()
+
+
+def test_run_background_work():
+    stop = Event()
+    stop.set()
+    with (
+        patch.object(main, "SNAPSHOT_ENABLED", True),
+        patch.object(main, "load_snapshot") as load_snapshot,
+        patch.object(main, "follow_refresh") as follow_refresh,
+        patch.object(main, "run_pending") as run_pending,
+    ):
+        main.run_background_work(stop)
+
+    load_snapshot.assert_called_once_with()
+    follow_refresh.assert_called_once_with()
+    run_pending.assert_not_called()
+
+
+def test_startup_imports():
+    """Modules that only refreshes or some requests need are not imported at startup."""
+    modules = {"httpx", "dateutil", "packaging", "boto3", "pyarrow", "msgpack"}
+    code = f"import sys, cid.main; print(sorted({modules!r} & set(sys.modules)))"
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)  # noqa: S603
+    assert output.splitlines()[-1] == "[]"
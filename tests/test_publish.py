@@ -0,0 +1,53 @@
+"""Tests for publishing the read API as static files."""
+
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+from cid import publish
+
+from .test_main import client
+
+
+def test_publish_site(loaded_db, tmp_path):
+    manifest = publish.publish_site(loaded_db, str(tmp_path))
+
+    site = tmp_path / "current"
+    assert os.readlink(site) == manifest["version"]
+    assert json.loads((site / "manifest.json").read_text()) == manifest
+
+    for path in ("/aws/latest", "/azure/versions", "/google"):
+        entry = manifest["files"][path]
+        body = (site / entry["file"]).read_bytes()
+        assert json.loads(body) == client.get(path).json()
+        assert len(body) == entry["size"]
+
+    image_id = client.get("/aws?page_size=1").json()["results"][0]["imageId"]
+    entry = manifest["files"][f"/aws/match/{image_id}"]
+    assert entry["file"] == f"aws/match/{image_id}/index.json"
+    published = json.loads((site / entry["file"]).read_bytes())
+    served = client.get(f"/aws/match/{image_id}").json()
+    # The matching images are not returned in any particular order.
+    for match in (published, served):
+        match["matching_images"].sort(key=lambda image: image["region"])
+    assert published == served
+
+    entry = manifest["files"]["/aws"]
+    compressed = (site / entry["encodings"]["gzip"]["file"]).read_bytes()
+    assert gzip.decompress(compressed) == (site / entry["file"]).read_bytes()
+
+
+def test_publish_site_replaces_previous_sites(loaded_db, tmp_path):
+    versions = [
+        publish.publish_site(loaded_db, str(tmp_path))["version"] for _ in range(3)
+    ]
+
+    assert sorted(os.listdir(tmp_path)) == sorted([*versions[1:], "current"])
+    assert os.readlink(tmp_path / "current") == versions[2]
+
+
+def test_publish_command(loaded_db, tmp_path):
+    with patch("cid.publish.ReadSessionLocal", return_value=loaded_db):
+        publish.main([str(tmp_path)])
+    assert (tmp_path / "current" / "aws" / "versions" / "index.json").exists()
@@ -0,0 +1,87 @@
+"""Test refreshing the image data in a process of its own."""
+
+import functools
+import shutil
+import subprocess
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from cid import refresh
+from cid.models import AwsImage, AzureImage, GoogleImage
+
+
+def test_runs_in_subprocess():
+    # An in-memory database can only be seen by this process.
+    with patch.object(refresh, "DATABASE_URL", "sqlite:///:memory:"):
+        assert not refresh.runs_in_subprocess()
+
+    with patch.object(refresh, "DATABASE_URL", "sqlite:////code/cid.db"):
+        assert refresh.runs_in_subprocess()
+        with patch.object(refresh, "REFRESH_IN_SUBPROCESS", False):
+            assert not refresh.runs_in_subprocess()
+
+
+@pytest.mark.parametrize("returncode, expected", [(0, True), (1, False)])
+def test_run_refresh_process(returncode, expected):
+    completed = subprocess.CompletedProcess([], returncode)
+    with patch("subprocess.run", return_value=completed) as run:
+        assert refresh.run_refresh_process(timeout=60) is expected
+
+    command = run.call_args.args[0]
+    assert command[1:] == ["-m", "cid.refresh"]
+    assert run.call_args.kwargs["timeout"] == 60
+
+
+def test_run_refresh_process_pull_only():
+    completed = subprocess.CompletedProcess([], 0)
+    with patch("subprocess.run", return_value=completed) as run:
+        assert refresh.run_refresh_process(timeout=60, pull_only=True)
+
+    assert run.call_args.args[0][1:] == ["-m", "cid.refresh", "--pull-only"]
+
+
+def test_run_refresh_process_timeout():
+    with patch("subprocess.run", side_effect=subprocess.TimeoutExpired([], 60)):
+        assert refresh.run_refresh_process(timeout=60) is False
+
+
+@pytest.fixture
+def image_data_url(tmp_path):
+    """Serve the test data from the same paths as the image data bucket."""
+    root = tmp_path / "bucket"
+    for source, target in (
+        ("aws.json", "aws/aws.json"),
+        ("azure.json", "azure/eastus.json"),
+        ("google.json", "google/global.json"),
+    ):
+        (root / target).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(f"tests/data/{source}", root / target)
+
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(root))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_refresh_process_writes_the_data(tmp_path, image_data_url, monkeypatch):
+    database = tmp_path / "cid.db"
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{database}")
+    monkeypatch.setenv("IMAGE_DATA_BASE_URL", image_data_url)
+
+    assert refresh.run_refresh_process(timeout=120)
+
+    engine = create_engine(f"sqlite:///{database}")
+    with engine.connect() as connection:
+        counts = [
+            connection.scalar(select(func.count()).select_from(model))
+            for model in (AwsImage, AzureImage, GoogleImage)
+        ]
+    engine.dispose()
+    assert counts == [500, 152, 4]
@@ -0,0 +1,72 @@
+"""Tests for the JSON rendering of the read endpoints."""
+
+import json
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from cid import crud, serialization, snapshot
+from cid.main import app
+
+
+@pytest.fixture(scope="function", params=[True, False], ids=["orjson", "stdlib"])
+def encoder(request):
+    """Render with orjson, when it is installed, and with the standard library."""
+    if request.param and not serialization.HAS_ORJSON:
+        pytest.skip("orjson is not installed")
+    with patch("cid.serialization.HAS_ORJSON", request.param):
+        yield serialization.dumps
+
+
+def test_dumps_is_compact(encoder):
+    content = {"date": datetime(2024, 5, 1, 12, 30, 15), "versions": ["9.4", "é"]}
+    assert encoder(content) == (
+        '{"date":"2024-05-01T12:30:15","versions":["9.4","é"]}'.encode()
+    )
+
+
+def test_dumps_rejects_unknown_types(encoder):
+    with pytest.raises(TypeError):
+        encoder({"value": object()})
+
+
+def test_dumps_matches_jsonable_encoder(encoder, db):
+    with open("tests/data/aws.json") as fileh:
+        crud.import_aws_images(db, json.load(fileh))
+    with open("tests/data/google.json") as fileh:
+        crud.import_google_images(db, json.load(fileh))
+
+    for result in (
+        crud.find_aws_images(db, page_size=20),
+        crud.find_google_images(db, page_size=20),
+        snapshot.build_snapshot(db).find_aws_images(page_size=20),
+        snapshot.build_snapshot(db).latest_aws_image(None),
+    ):
+        assert json.loads(encoder(result)) == jsonable_encoder(result)
+
+
+def test_snapshot_renders_bodies_once(db):
+    snap = snapshot.build_snapshot(db)
+    calls = []
+
+    def render():
+        calls.append(None)
+        return b"[]"
+
+    assert snap.rendered("versions", render) == b"[]"
+    assert snap.rendered("versions", render) == b"[]"
+    assert len(calls) == 1
+
+    for key in range(snapshot.MAX_RENDERED_BODIES):
+        snap.rendered(key, render)
+    assert len(snap._rendered) == snapshot.MAX_RENDERED_BODIES
+
+
+@patch("cid.crud.find_available_aws_versions", return_value=["9.4", "8.10"])
+def test_endpoints_return_rendered_json(mock_versions):
+    response = TestClient(app).get("/aws/versions")
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.content == b'["9.4","8.10"]'
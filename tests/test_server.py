@@ -0,0 +1,160 @@
+"""Test serving the API from workers forked off a preloaded master."""
+
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from cid import crud, database, main, server
+from cid.models import Base
+
+
+def test_worker_count():
+    assert server.worker_count(3) == 3
+    with patch("os.cpu_count", return_value=8):
+        assert server.worker_count(0) == 8
+    with patch("os.cpu_count", return_value=None):
+        assert server.worker_count(0) == 1
+
+
+def test_preload_leaves_background_work_to_master():
+    with (
+        patch.object(server, "SNAPSHOT_ENABLED", True),
+        patch.object(main, "load_snapshot") as load_snapshot,
+        patch.object(main, "follow_refresh") as follow_refresh,
+        patch.object(main, "ENVIRONMENT", "production"),
+        patch.object(main, "run_background_work") as run_background_work,
+    ):
+        try:
+            server.preload()
+            with TestClient(main.app):
+                pass
+        finally:
+            main.app.state.background_work = True
+
+    load_snapshot.assert_called_once_with()
+    follow_refresh.assert_called_once_with()
+    run_background_work.assert_not_called()
+
+
+def test_stop_signal_only_sets_a_flag():
+    master = server.Master(None, 1, None)
+    master._request_stop(signal.SIGTERM, None)
+    assert master.stop_requested
+
+    with (
+        patch.object(master, "spawn"),
+        patch.object(master, "spawn_scheduler"),
+        patch.object(master, "stop") as stop,
+        patch.object(server, "data_generation") as data_generation,
+        patch("signal.signal"),
+    ):
+        master.run()
+    stop.assert_called_once_with()
+    data_generation.assert_not_called()
+
+
+def test_master_follows_data():
+    master = server.Master(None, 1, None)
+    generations = iter([1, 1, 1, 2])
+
+    def sleep(seconds):
+        if master.pids:
+            master.stop_requested = True
+
+    with (
+        patch.object(master, "spawn"),
+        patch.object(master, "spawn_scheduler"),
+        patch.object(master, "stop"),
+        patch.object(master, "reap"),
+        patch.object(
+            master, "reload", side_effect=lambda: master.pids.add(1)
+        ) as reload,
+        patch.object(server, "FOLLOW_INTERVAL", 0),
+        patch.object(server, "follow_data") as follow_data,
+        patch.object(server, "data_generation", side_effect=lambda: next(generations)),
+        patch("signal.signal"),
+        patch("time.sleep", side_effect=sleep),
+    ):
+        master.run()
+
+    # The data only changed on the second check, which replaced the workers.
+    assert follow_data.call_count == 2
+    reload.assert_called_once_with()
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as fileh:
+        return set(fileh.read().split())
+
+
+def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return
+        time.sleep(0.1)
+    pytest.fail("Timed out")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/task"), reason="Linux only")
+def test_serve_reload_and_stop(tmp_path):
+    path = tmp_path / "cid.db"
+    engine = database.build_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as db, open("tests/data/aws.json") as fileh:
+        crud.import_aws_images(db, json.load(fileh))
+        crud.update_last_updated(db)
+    engine.dispose()
+
+    sock = server.listen("127.0.0.1", 0)
+    port = sock.getsockname()[1]
+    sock.close()
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-m", "cid.server", "--port", str(port), "--workers", "2"],
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{path}"},
+    )
+
+    def served():
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/aws/latest") as r:
+                return r.status == 200
+        except OSError:
+            return False
+
+    try:
+        wait_for(served)
+        # The workers, and the scheduler.
+        started = children(process.pid)
+        assert len(started) == 3
+
+        # A reload forks new workers, and requests are served meanwhile. The scheduler
+        # keeps running.
+        process.send_signal(signal.SIGHUP)
+        wait_for(lambda: len(children(process.pid) & started) == 1)
+        (scheduler,) = children(process.pid) & started
+        assert served()
+
+        # A worker that dies is replaced, and so is the scheduler.
+        for killed in (next(iter(children(process.pid) - {scheduler})), scheduler):
+            os.kill(int(killed), signal.SIGKILL)
+            wait_for(
+                lambda killed=killed: killed not in children(process.pid)
+                and len(children(process.pid)) == 3
+            )
+            assert served()
+
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=60) == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
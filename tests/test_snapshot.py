@@ -0,0 +1,169 @@
+"""Tests for the in-memory snapshot."""
+
+from unittest.mock import patch
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from cid import crud, snapshot
+from cid.main import app
+
+
+@pytest.fixture(scope="function")
+def served_snapshot(loaded_db):
+    """Serve a snapshot of the test data for the duration of a test."""
+    yield snapshot.refresh_snapshot(loaded_db)
+    snapshot.clear_snapshot()
+
+
+def test_refresh_snapshot_swaps_current(loaded_db):
+    assert snapshot.current_snapshot() is None
+
+    first = snapshot.refresh_snapshot(loaded_db)
+    assert snapshot.current_snapshot() is first
+
+    second = snapshot.refresh_snapshot(loaded_db)
+    assert snapshot.current_snapshot() is second
+    assert second is not first
+
+    snapshot.clear_snapshot()
+    assert snapshot.current_snapshot() is None
+
+
+def test_snapshot_matches_database(loaded_db):
+    snap = snapshot.build_snapshot(loaded_db)
+
+    assert snap.aws_regions() == [x[0] for x in crud.aws_regions(loaded_db)]
+    assert snap.find_available_aws_versions() == crud.find_available_aws_versions(
+        loaded_db
+    )
+    assert snap.find_available_azure_versions() == crud.find_available_azure_versions(
+        loaded_db
+    )
+    # Versions like 9 and 9.arm64 sort as equal, and still come in the same order.
+    assert snap.find_available_google_versions() == (
+        crud.find_available_google_versions(loaded_db)
+    )
+
+    key = lambda x: x["ami"]
+    assert sorted(snap.find_images_for_version("9.4.0"), key=key) == sorted(
+        crud.find_images_for_version(loaded_db, "9.4.0"), key=key
+    )
+
+
+@pytest.mark.parametrize("arch", [None, "x86_64", "arm64", "ppc64le"])
+def test_snapshot_latest_aws_image(loaded_db, arch):
+    snap = snapshot.build_snapshot(loaded_db)
+    assert snap.latest_aws_image(arch) == crud.latest_aws_image(loaded_db, arch)
+
+
+@pytest.mark.parametrize("image_id", ["ami-08a20c15f394e5531", "ami-does-not-exist"])
+def test_snapshot_find_matching_ami(loaded_db, image_id):
+    snap = snapshot.build_snapshot(loaded_db)
+    expected = crud.find_matching_ami(loaded_db, image_id)
+    result = snap.find_matching_ami(image_id)
+
+    if "matching_images" in expected:
+        key = lambda x: x["ami"]
+        expected["matching_images"].sort(key=key)
+        result["matching_images"].sort(key=key)
+    assert result == expected
+
+
+def test_snapshot_is_not_modified_by_callers(loaded_db):
+    snap = snapshot.build_snapshot(loaded_db)
+
+    result = snap.latest_aws_image(None)
+    result["x86_64"]["amis"].clear()
+    snap.find_available_aws_versions().clear()
+
+    assert snap.latest_aws_image(None)["x86_64"]["amis"]
+    assert snap.find_available_aws_versions()
+
+
+@patch("cid.crud.find_available_aws_versions")
+@patch("cid.crud.latest_aws_image")
+def test_endpoints_served_from_snapshot(mock_latest, mock_versions, served_snapshot):
+    client = TestClient(app)
+
+    response = client.get("/aws/versions")
+    assert response.status_code == 200
+    assert response.json() == served_snapshot.find_available_aws_versions()
+
+    response = client.get("/aws/latest?arch=x86_64")
+    assert response.status_code == 200
+    assert (
+        response.json()["x86_64"]["name"]
+        == (served_snapshot.latest_aws_image("x86_64")["x86_64"]["name"])
+    )
+
+    response = client.get("/aws/match/ami-08a20c15f394e5531")
+    assert response.status_code == 200
+    assert response.json()["ami"] == "ami-08a20c15f394e5531"
+
+    mock_latest.assert_not_called()
+    mock_versions.assert_not_called()
+
+
+AWS_FILTERS = [
+    {},
+    {"arch": "x86_64"},
+    {"arch": "arm64", "region": "af-south-1"},
+    {"version": "9.4.0"},
+    {"name": "HA-9.4"},
+    {"name": "ha-9.4", "arch": "x86_64", "region": "af-south-1"},
+    {"image_id": "ami-08a20c15f394e5531"},
+    {"arch": "x86_64", "page": 3, "page_size": 7},
+    {"region": "does-not-exist"},
+    {"arch": "x86_64", "fields": "id,imageId,region", "page": 2},
+]
+
+
+@pytest.mark.parametrize("kwargs", AWS_FILTERS)
+def test_snapshot_find_aws_images(loaded_db, kwargs):
+    snap = snapshot.build_snapshot(loaded_db)
+    expected = jsonable_encoder(crud.find_aws_images(loaded_db, **kwargs))
+    result = jsonable_encoder(snap.find_aws_images(**kwargs))
+
+    # Rows that share a creation date may come back in any order.
+    key = lambda x: x["id"]
+    if "page" not in kwargs:
+        expected["results"].sort(key=key)
+        result["results"].sort(key=key)
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"arch": "x64"},
+        {"version": "7.9"},
+        {"urn": "rh-rhel7", "arch": "x64", "page": 2, "page_size": 5},
+        {"urn": "does-not-exist"},
+    ],
+)
+def test_snapshot_find_azure_images(loaded_db, kwargs):
+    snap = snapshot.build_snapshot(loaded_db)
+    expected = jsonable_encoder(crud.find_azure_images(loaded_db, **kwargs))
+    result = jsonable_encoder(snap.find_azure_images(**kwargs))
+    assert result == expected
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"arch": "X86_64"},
+        {"version": "7"},
+        {"name": "rhel-7", "arch": "X86_64"},
+        {"family": "rhel-9"},
+        {"family": "rhel-9", "fields": "name,selfLink,licenses"},
+    ],
+)
+def test_snapshot_find_google_images(loaded_db, kwargs):
+    snap = snapshot.build_snapshot(loaded_db)
+    expected = jsonable_encoder(crud.find_google_images(loaded_db, **kwargs))
+    result = jsonable_encoder(snap.find_google_images(**kwargs))
+    assert result == expected
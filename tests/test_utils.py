@@ -55,3 +55,21 @@ def test_extract_aws_version(image_name, expected):
     """Test the extract_aws_version function."""
     version = utils.extract_aws_version(image_name)
     assert version == expected
+
+
+@pytest.mark.parametrize(
+    "versions", [["9", "9.arm64", "8", "7"], ["7", "9.arm64", "8", "9"]]
+)
+def test_newest_versions_first(versions):
+    """Versions that sort as equal come in the same order, whatever the input order."""
+    assert utils.newest_versions_first(versions, utils.google_version_key) == [
+        "9.arm64",
+        "9",
+        "8",
+        "7",
+    ]
+    assert utils.newest_versions_first(["9.4", "10.0", "9.10"]) == [
+        "10.0",
+        "9.10",
+        "9.4",
+    ]